@@ -0,0 +1,218 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+import httpx
+import fixtures
+
+"""
+Local stand-in for a Rancher server.
+
+Answers the schema, pod, cluster and registration token endpoints kctl uses from the
+fixtures, either in-process through an httpx.MockTransport (measures kctl itself, without
+socket noise) or over loopback HTTP with serve().
+
+Pods can be watched (?watch=true&resourceVersion=...). Changes made with emit() are
+applied to the pod list and streamed to the watches as kubernetes watch events. A watch
+returns the events past its resourceVersion, waiting up to timeoutSeconds for one, and
+ends, so clients resume and reconnect on every batch.
+
+Response bodies are encoded once and reused, so the server side cost of a request
+stays out of the measurements.
+"""
+
+ClusterPrefix = re.compile(r'^/k8s/clusters/[^/]+')
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+class FakeRancher:
+    """ args:
+            - host: base url the fixtures links point to
+            - items: size of the pod collection
+            - clusters: clusters and registration tokens listed for context discovery
+            - transition_polls: GETs of a pod before it stops transitioning
+            - latency: seconds added to every response
+            - watch_wait: max seconds a watch waits for an event
+    """
+    def __init__(self, host: str = 'http://rancher.bench', items: int = 1000, clusters: int = 10, transition_polls: int = 3, latency: float = 0.0, watch_wait: float = 5.0):
+        self.host = host
+        self.items = items
+        self.clusters = clusters
+        self.transition_polls = transition_polls
+        self.latency = latency
+        self.watch_wait = watch_wait
+        self.requests = collections.Counter()
+        # (method, path with its query, body) of every request
+        self.history: List[Tuple[str, str, bytes]] = []
+        # resourceVersion of the pod list, above the resourceVersion of every fixture pod
+        self.revision = 1000 + items
+        self.watches = 0
+        self._polls = collections.Counter()
+        self._bodies: Dict[Tuple, bytes] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # (revision, event) since the last compact()
+        self._events: List[Tuple[int, Dict]] = []
+        self._compacted = 0
+        # pods emitted since the fixtures were built, None once deleted
+        self._objects: Dict[str, Optional[Dict]] = {}
+
+    def _body(self, key: Tuple, build) -> bytes:
+        body = self._bodies.get(key)
+        if body is None: body = self._bodies[key] = json.dumps(build()).encode('utf-8')
+        return body
+
+    def reset_transitions(self):
+        with self._lock: self._polls.clear()
+
+    def _schema(self, api_version: str, headers: Dict[str, str]) -> Response:
+        build = (lambda: fixtures.v1_schema(self.host)) if api_version == 'v1' else (lambda: fixtures.v3_schema(self.host))
+        body = self._body(('schema', api_version), build)
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if headers.get('if-none-match') == etag: return 304, {'ETag': etag}, b''
+        return 200, {'ETag': etag}, body
+
+    def emit(self, kind: str, obj: Dict, record: bool = True) -> Dict:
+        """ Applies an ADDED, MODIFIED or DELETED pod to the pod list at the next revision, and streams it
+            to the watches unless record is False, ie. a change whose event was already compacted away.
+            Returns the pod as stored
+        """
+        obj = json.loads(json.dumps(obj))
+        with self._changed:
+            self.revision += 1
+            obj.setdefault('metadata', {})['resourceVersion'] = str(self.revision)
+            self._objects[obj['id']] = None if kind == 'DELETED' else obj
+            if record: self._events.append((self.revision, {'type': kind, 'object': obj}))
+            self._changed.notify_all()
+        return obj
+
+    def compact(self):
+        """ Drops the event history. Watches from an older resourceVersion get a 410 ERROR event and have to relist"""
+        with self._changed:
+            self._events.clear()
+            self._compacted = self.revision
+            self._changed.notify_all()
+
+    def _watch(self, query: Dict) -> Response:
+        since = int(query.get('resourceVersion', ['0'])[0] or 0)
+        timeout = min(float(query.get('timeoutSeconds', [self.watch_wait])[0]), self.watch_wait)
+        with self._changed:
+            self.watches += 1
+            self._changed.wait_for(lambda: 0 < since < self._compacted or any(rev > since for rev, _ in self._events), timeout)
+            if 0 < since < self._compacted: events = [{'type': 'ERROR', 'object': {'code': 410, 'reason': 'Expired', 'message': f'too old resource version: {since}'}}]
+            else: events = [event for rev, event in self._events if rev > since]
+        return 200, {}, b''.join(json.dumps(event).encode('utf-8') + b'\n' for event in events)
+
+    def _is_fixture(self, pod_id: str) -> bool:
+        name = pod_id.rsplit('/', 1)[-1]
+        return pod_id.startswith('default/pod-') and name[4:].isdigit() and int(name[4:]) < self.items
+
+    def _live(self, items: List[Dict], last: bool) -> List[Dict]:
+        """ items with the emitted pods applied, the added ones go to the last page"""
+        with self._lock: objects = dict(self._objects)
+        items = [objects[i['id']] if i['id'] in objects else i for i in items]
+        if last: items += [obj for pod_id, obj in objects.items() if obj is not None and not self._is_fixture(pod_id)]
+        return [i for i in items if i is not None]
+
+    def _pods(self, path: str, query: Dict) -> Response:
+        if 'id' in query:
+            ids = query['id']
+            items = [fixtures.pod(self.host, int(i.rsplit('-', 1)[1]), self._transition(i)) for i in ids]
+            return 200, {}, json.dumps(fixtures.collection(self.host, path, items)).encode('utf-8')
+        limit = int(query.get('limit', [self.items])[0])
+        start = int(query.get('continue', [0])[0])
+        end = min(start + limit, self.items)
+        next_url = f'{self.host}/v1/pods?limit={limit}&continue={end}' if end < self.items else None
+        # a namespace list, as the batched waits refresh from, reports the transitions like a GET of each pod
+        if path == '/v1/pods/default': return 200, {}, json.dumps(fixtures.collection(self.host, path, [fixtures.pod(self.host, i, self._transition(f'default/pod-{i}')) for i in range(start, end)], next_url)).encode('utf-8')
+        if self._objects:
+            page = fixtures.collection(self.host, path, self._live([fixtures.pod(self.host, i) for i in range(start, end)], next_url is None), next_url)
+            return 200, {}, json.dumps(dict(page, revision = str(self.revision))).encode('utf-8')
+        return 200, {}, self._body(('pods', self.items, start, end, self.revision), lambda: dict(fixtures.collection(self.host, path, [fixtures.pod(self.host, i) for i in range(start, end)], next_url), revision = str(self.revision)))
+
+    def _transition(self, pod_id: str) -> str:
+        with self._lock:
+            self._polls[pod_id] += 1
+            return 'yes' if self._polls[pod_id] <= self.transition_polls else 'no'
+
+    def handle(self, method: str, url: str, headers: Dict[str, str], body: bytes = b'') -> Response:
+        """ Returns the (status, headers, body) of a request"""
+        split = urlsplit(url)
+        path = ClusterPrefix.sub('', split.path, count = 1).rstrip('/')
+        query = parse_qs(split.query)
+        self.requests[method] += 1
+        self.history.append((method, path + (f'?{split.query}' if split.query else ''), body))
+        if method in {'POST', 'PUT', 'PATCH'}: return 200, {}, body or b'{}'
+        if method == 'DELETE': return 204, {}, b''
+        if path in {'/v1', '/v1/schemas'}: return self._schema('v1', headers)
+        if path in {'/v3', '/v3/schemas'}: return self._schema('v3', headers)
+        if path in {'/v1/pods', '/v1/pods/fleet-default', '/v1/pods/default'}: return self._watch(query) if query.get('watch') == ['true'] else self._pods(path, query)
+        if path.startswith('/v1/pods/default/'):
+            pod_id = path[len('/v1/pods/'):]
+            if pod_id in self._objects:
+                obj = self._objects[pod_id]
+                if obj is None: return 404, {}, json.dumps({'type': 'error', 'status': 404, 'code': 'NotFound', 'message': f'{pod_id} not found'}).encode('utf-8')
+                return 200, {}, json.dumps(obj).encode('utf-8')
+            index = int(pod_id.rsplit('-', 1)[1])
+            if index >= self.items: return 404, {}, json.dumps({'type': 'error', 'status': 404, 'code': 'NotFound', 'message': f'{pod_id} not found'}).encode('utf-8')
+            return 200, {}, json.dumps(fixtures.pod(self.host, index, self._transition(pod_id))).encode('utf-8')
+        if path == '/v3/clusters': return 200, {}, self._body(('clusters', self.clusters), lambda: fixtures.collection(self.host, path, [fixtures.cluster(self.host, i) for i in range(self.clusters)]))
+        if path.startswith('/v1/management.cattle.io.clusterregistrationtokens'):
+            return 200, {}, self._body(('tokens', self.clusters), lambda: fixtures.collection(self.host, path, [fixtures.registration_token(self.host, i) for i in range(self.clusters)]))
+        return 404, {}, json.dumps({'type': 'error', 'status': 404, 'code': 'NotFound', 'message': path}).encode('utf-8')
+
+    def _response(self, request: httpx.Request, status: int, headers: Dict, body: bytes) -> httpx.Response:
+        headers = {'Content-Type': 'application/json', **headers}
+        return httpx.Response(status, headers = headers, content = body, request = request)
+
+    def transport(self) -> httpx.MockTransport:
+        """ In-process transport for httpx.Client"""
+        def handler(request: httpx.Request):
+            if self.latency: time.sleep(self.latency)
+            return self._response(request, *self.handle(request.method, str(request.url), dict(request.headers), request.content))
+        return httpx.MockTransport(handler)
+
+    def async_transport(self) -> httpx.MockTransport:
+        """ In-process transport for httpx.AsyncClient, latency does not block the event loop"""
+        async def handler(request: httpx.Request):
+            if self.latency: await asyncio.sleep(self.latency)
+            args = (request.method, str(request.url), dict(request.headers), request.content)
+            # a watch waits for events, off the event loop
+            if request.url.params.get('watch') == 'true': return self._response(request, *(await asyncio.get_running_loop().run_in_executor(None, self.handle, *args)))
+            return self._response(request, *self.handle(*args))
+        return httpx.MockTransport(handler)
+
+    def serve(self, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+        """ Serves the fake over loopback HTTP from a daemon thread. Sets self.host to its url"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if fake.latency: time.sleep(fake.latency)
+                status, headers, content = fake.handle(self.command, fake.host + self.path, {k.lower(): v for k, v in self.headers.items()}, body)
+                self.send_response(status)
+                for k, v in {'Content-Type': 'application/json', **headers}.items(): self.send_header(k, v)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _reply
+
+            def log_message(self, *args): pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        self.host = f'http://{host}:{server.server_address[1]}'
+        self._bodies.clear()
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        return server
@@ -0,0 +1,134 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+"""
+Deterministic fixtures for the benchmarks.
+
+Schemas follow the shape of the v1 (steve) and v3 (norman) schema collections served by
+Rancher. A recorded schema can be used instead by saving the raw /v1 or /v3 response as
+fixtures/v1-schema.json or fixtures/v3-schema.json next to this file.
+"""
+
+FixturesDir = Path(__file__).parent.joinpath('fixtures')
+
+# core types every fixture has, the rest are generated to reach a realistic schema size
+V1CoreTypes = {
+    'pod': ('', 'v1', 'Pod', True),
+    'apps.deployment': ('apps', 'v1', 'Deployment', True),
+    'event': ('', 'v1', 'Event', True),
+    'management.cattle.io.clusterregistrationtoken': ('management.cattle.io', 'v3', 'ClusterRegistrationToken', True),
+}
+V3CoreTypes = ('cluster', 'project', 'user', 'token', 'node', 'nodePool')
+FilterModifiers = ['eq', 'ne', 'null', 'notnull', 'in', 'notin', 'prefix', 'like', 'notlike']
+
+
+def load_recorded(api_version: str) -> Optional[Dict]:
+    path = FixturesDir.joinpath(f'{api_version}-schema.json')
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def v1_schema(host: str, types: int = 600) -> Dict:
+    """ Returns a steve schema collection of `types` types"""
+    recorded = load_recorded('v1')
+    if recorded: return recorded
+    specs = dict(V1CoreTypes)
+    for i in range(types - len(specs)):
+        group = f'group{i // 20}.example.io'
+        specs[f'{group}.kind{i}'] = (group, 'v1', f'Kind{i}', i % 3 != 0)
+    data = []
+    for type_id, (group, version, kind, namespaced) in specs.items():
+        plural = type_id + 's'
+        data.append({
+            'id': type_id,
+            'type': 'schema',
+            'links': {'self': f'{host}/v1/schemas/{type_id}', 'collection': f'{host}/v1/{plural}'},
+            'pluralName': plural,
+            'resourceMethods': ['GET', 'DELETE', 'PUT', 'PATCH'],
+            'collectionMethods': ['GET', 'POST'],
+            'resourceFields': None,
+            'attributes': {'group': group, 'kind': kind, 'namespaced': namespaced, 'resource': plural, 'verbs': ['create', 'delete', 'get', 'list', 'patch', 'update', 'watch'], 'version': version},
+        })
+    return {'type': 'collection', 'links': {'self': f'{host}/v1/schemas'}, 'resourceType': 'schema', 'data': data}
+
+
+def v3_schema(host: str, types: int = 350, fields: int = 30) -> Dict:
+    """ Returns a norman schema collection of `types` types with `fields` resource fields each"""
+    recorded = load_recorded('v3')
+    if recorded: return recorded
+    names = list(V3CoreTypes) + [f'resource{i}' for i in range(types - len(V3CoreTypes))]
+    data = []
+    for name in names:
+        resource_fields = {f'field{j}': {'type': 'string' if j % 2 else 'int', 'nullable': True, 'create': True, 'update': j % 3 != 0} for j in range(fields)}
+        resource_fields['name'] = {'type': 'string', 'create': True, 'update': True}
+        data.append({
+            'id': name,
+            'type': 'schema',
+            'links': {'self': f'{host}/v3/schemas/{name.lower()}', 'collection': f'{host}/v3/{name.lower()}s'},
+            'pluralName': name + 's',
+            'resourceMethods': ['GET', 'PUT', 'DELETE'],
+            'collectionMethods': ['GET', 'POST'],
+            'resourceActions': {'refresh': {}},
+            'collectionActions': {},
+            'resourceFields': resource_fields,
+            'collectionFilters': {k: {'modifiers': FilterModifiers} for k in ('name', 'id', 'state', 'uuid', 'created')},
+        })
+    return {'type': 'collection', 'links': {'self': f'{host}/v3/schemas'}, 'resourceType': 'schema', 'data': data}
+
+
+def pod(host: str, i: int, transitioning: str = 'no') -> Dict:
+    """ Returns a v1 pod of about 1.5KB"""
+    name = f'pod-{i}'
+    return {
+        'id': f'default/{name}',
+        'type': 'pod',
+        'links': {'self': f'{host}/v1/pods/default/{name}', 'update': f'{host}/v1/pods/default/{name}', 'remove': f'{host}/v1/pods/default/{name}', 'view': f'{host}/api/v1/namespaces/default/pods/{name}'},
+        'actions': {},
+        'apiVersion': 'v1',
+        'kind': 'Pod',
+        'transitioning': transitioning,
+        'metadata': {
+            'name': name,
+            'namespace': 'default',
+            'uid': f'00000000-0000-0000-0000-{i:012d}',
+            'resourceVersion': str(1000 + i),
+            'creationTimestamp': '2021-01-01T00:00:00Z',
+            'labels': {'app': f'app-{i % 50}', 'tier': ('web', 'api', 'db')[i % 3], 'pod-template-hash': f'{i:010x}'},
+            'annotations': {'kubernetes.io/psp': 'global-unrestricted-psp', 'cni.projectcalico.org/podIP': f'10.42.{i // 256 % 256}.{i % 256}/32'},
+            'ownerReferences': [{'apiVersion': 'apps/v1', 'kind': 'ReplicaSet', 'name': f'app-{i % 50}-rs', 'uid': f'11111111-0000-0000-0000-{i % 50:012d}', 'controller': True}],
+            'state': {'error': False, 'message': '', 'name': 'running', 'transitioning': transitioning == 'yes'},
+        },
+        'spec': {
+            'containers': [{'name': 'main', 'image': f'registry.example.io/app-{i % 50}:1.{i % 7}', 'ports': [{'containerPort': 8080, 'protocol': 'TCP'}], 'resources': {'limits': {'cpu': '500m', 'memory': '256Mi'}, 'requests': {'cpu': '100m', 'memory': '128Mi'}}, 'env': [{'name': 'INDEX', 'value': str(i)}]}],
+            'nodeName': f'node-{i % 20}',
+            'restartPolicy': 'Always',
+            'serviceAccountName': 'default',
+        },
+        'status': {'phase': 'Running', 'podIP': f'10.42.{i // 256 % 256}.{i % 256}', 'hostIP': f'192.168.0.{i % 20}', 'startTime': '2021-01-01T00:00:05Z', 'conditions': [{'type': 'Ready', 'status': 'True'}, {'type': 'PodScheduled', 'status': 'True'}]},
+    }
+
+
+def cluster(host: str, i: int) -> Dict:
+    cluster_id = 'local' if i == 0 else f'c-m-{i:08d}'
+    return {'id': cluster_id, 'type': 'cluster', 'name': 'local' if i == 0 else f'cluster-{i}', 'state': 'active', 'links': {'self': f'{host}/v3/clusters/{cluster_id}'}, 'actions': {}}
+
+
+def registration_token(host: str, i: int) -> Dict:
+    cluster_id = 'local' if i == 0 else f'c-m-{i:08d}'
+    return {'id': f'{cluster_id}/default-token', 'type': 'management.cattle.io.clusterregistrationtoken', 'links': {'self': f'{host}/v1/management.cattle.io.clusterregistrationtokens/{cluster_id}/default-token'}, 'status': {'token': f'token-{i:08d}'}}
+
+
+def collection(host: str, path: str, items: List[Dict], next_url: str = None) -> Dict:
+    page = {'type': 'collection', 'links': {'self': f'{host}{path}'}, 'actions': {}, 'pagination': {}, 'revision': '1', 'data': items}
+    if next_url: page['pagination']['next'] = next_url
+    return page
+
+
+__all__ = [
+    'v1_schema',
+    'v3_schema',
+    'pod',
+    'cluster',
+    'registration_token',
+    'collection',
+]
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from typing import Callable, Dict, Iterator, List
+
+import httpx
+from fake_rancher import FakeRancher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from kctl.client import KctlBaseClient, KctlClient
+
+"""
+kctl benchmarks against a local fake Rancher server.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare results.json --threshold 0.1
+
+Every case is timed `repeat` times after a warmup run. Results are written as json
+(see write_results). --compare exits with 1 when the median of a case regressed by more
+than the threshold against a previous result file.
+"""
+
+Token = 'token-bench:benchmark'
+
+
+class Timer:
+    """ Times only the code inside `with timer:`, so each run can do its own setup"""
+    def __init__(self):
+        self.laps: List[float] = []
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.laps.append(time.perf_counter() - self._start)
+
+
+class Case:
+    def __init__(self, name: str, params: Dict, run: Callable[[Timer], None], items: int = None, repeat: int = None):
+        self.name = name
+        self.params = params
+        self.run = run
+        self.items = items
+        self.repeat = repeat
+
+
+def make_client(fake: FakeRancher, args, api_version: str = 'v1', cache_dir: str = None, **kwargs) -> KctlBaseClient:
+    kwargs.setdefault('metrics', False)
+    client = KctlBaseClient(host = fake.host, api_version = api_version, api_token = Token, cache_dir = cache_dir or tempfile.mkdtemp(prefix = 'kctl-bench-'), **kwargs)
+    if args.transport == 'mock':
+        client._client._web = httpx.Client(transport = fake.transport())
+        client._client._async = httpx.AsyncClient(transport = fake.async_transport())
+    return client
+
+
+def make_fake(args, **kwargs) -> FakeRancher:
+    fake = FakeRancher(**kwargs)
+    if args.transport == 'http': fake.serve()
+    return fake
+
+
+def schema_cases(args) -> Iterator[Case]:
+    fake = make_fake(args)
+    for api_version in ('v1', 'v3'):
+        def cold(t: Timer, api_version = api_version):
+            cache_dir = tempfile.mkdtemp(prefix = 'kctl-bench-')
+            client = make_client(fake, args, api_version, cache_dir)
+            with t: client._load_schemas()
+            shutil.rmtree(cache_dir, ignore_errors = True)
+        yield Case('load_schemas_cold', {'api_version': api_version}, cold)
+
+        warm_dir = tempfile.mkdtemp(prefix = 'kctl-bench-')
+        loaded = make_client(fake, args, api_version, warm_dir)
+        loaded._load_schemas()
+        def warm(t: Timer, api_version = api_version, warm_dir = warm_dir):
+            client = make_client(fake, args, api_version, warm_dir)
+            with t: client._load_schemas()
+        yield Case('load_schemas_warm', {'api_version': api_version, 'types': len(loaded.schema.index)}, warm)
+
+        def bind(t: Timer, client = loaded):
+            with t: client._bind_methods(client.schema)
+        yield Case('bind_methods', {'api_version': api_version, 'types': len(loaded.schema.index)}, bind)
+
+
+def decode_cases(args) -> Iterator[Case]:
+    for size in args.sizes:
+        repeat = args.repeat if size <= 10000 else max(1, args.repeat // 5)
+        fake = make_fake(args, items = size)
+        for mode, kwargs in (('object', {}), ('lazy', {'lazy_decode': True}), ('dict', {'response_mode': 'dict'})):
+            client = make_client(fake, args, **kwargs)
+            client._load_schemas()
+            def run(t: Timer, client = client):
+                with t: client.list('pod')
+            yield Case('list_decode', {'items': size, 'mode': mode, 'codec': client._codec.name}, run, items = size, repeat = repeat)
+
+        client = make_client(fake, args)
+        client._load_schemas()
+        page = client.list('pod', response_mode = 'dict')
+        def hook(t: Timer, client = client, page = page):
+            with t: client.object_hook(page)
+        yield Case('object_hook', {'items': size}, hook, items = size, repeat = repeat)
+
+        objs = client.object_hook(page).data
+        def marshall(t: Timer, client = client, objs = objs):
+            with t:
+                for obj in objs: client._to_dict(obj)
+        yield Case('to_dict', {'items': size}, marshall, items = size, repeat = repeat)
+
+
+def wait_cases(args) -> Iterator[Case]:
+    fake = make_fake(args, items = 1000, transition_polls = 3)
+    client = make_client(fake, args)
+    client._load_schemas()
+    def single(t: Timer):
+        fake.reset_transitions()
+        obj = client.by_id('pod', 'default/pod-1')
+        with t: client.wait_transitioning(obj, sleep = 0)
+    yield Case('wait_transitioning', {'polls': fake.transition_polls}, single, items = 1)
+
+    objs = [client.by_id('pod', f'default/pod-{i}') for i in range(100)]
+    def many(t: Timer):
+        fake.reset_transitions()
+        with t: client.wait_transitioning_many(objs, sleep = 0)
+    yield Case('wait_transitioning_many', {'objects': len(objs), 'polls': fake.transition_polls}, many, items = len(objs))
+
+
+def fanout_cases(args) -> Iterator[Case]:
+    fake = make_fake(args, items = 100, latency = args.latency)
+    client = make_client(fake, args)
+    client._load_schemas()
+    client._cfg.set_rancher_rows([{'cluster_name': f'cluster-{i}', 'cluster_id': f'c-m-{i:08d}', 'registration_token': ''} for i in range(1, args.clusters + 1)])
+    loop = asyncio.new_event_loop()
+    for concurrency in (10, args.clusters):
+        def run(t: Timer, concurrency = concurrency):
+            with t: results = loop.run_until_complete(KctlClient.async_fanout('list', 'pod', client = client, concurrency = concurrency, response_mode = 'dict'))
+            failed = [r for r in results.values() if not r.ok]
+            if failed: raise failed[0].error
+        yield Case('async_fanout', {'clusters': args.clusters, 'concurrency': concurrency, 'latency': args.latency}, run, items = args.clusters)
+
+
+Suites = {
+    'schema': schema_cases,
+    'decode': decode_cases,
+    'wait': wait_cases,
+    'fanout': fanout_cases,
+}
+
+
+def summarize(case: Case, laps: List[float]) -> Dict:
+    median = statistics.median(laps)
+    result = {
+        'name': case.name,
+        'params': case.params,
+        'repeat': len(laps),
+        'min': min(laps),
+        'max': max(laps),
+        'mean': statistics.mean(laps),
+        'median': median,
+        'stdev': statistics.stdev(laps) if len(laps) > 1 else 0.0,
+    }
+    if case.items: result['items_per_sec'] = case.items / median if median else None
+    return result
+
+
+def run_case(case: Case, repeat: int, warmup: bool = True) -> Dict:
+    if warmup: case.run(Timer())
+    timer = Timer()
+    for _ in range(case.repeat or repeat): case.run(timer)
+    return summarize(case, timer.laps)
+
+
+def case_key(result: Dict) -> str:
+    return result['name'] + ' ' + json.dumps(result['params'], sort_keys = True)
+
+
+def get_meta(args) -> Dict:
+    try: commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError): commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'transport': args.transport,
+        'repeat': args.repeat,
+    }
+
+
+def write_results(results: List[Dict], args):
+    """ {'meta': {...}, 'results': [{'name', 'params', 'repeat', 'min', 'max', 'mean', 'median', 'stdev', 'items_per_sec'}]}"""
+    data = json.dumps({'meta': get_meta(args), 'results': results}, indent = 2)
+    if args.output:
+        with open(args.output, 'w') as f: f.write(data)
+    else: print(data)
+
+
+def compare(results: List[Dict], baseline_path: str, threshold: float) -> bool:
+    """ Prints the median ratio of every case against the baseline. Returns False on a regression"""
+    with open(baseline_path) as f: baseline = {case_key(r): r for r in json.load(f)['results']}
+    ok = True
+    for result in results:
+        base = baseline.get(case_key(result))
+        if base is None: continue
+        ratio = result['median'] / base['median'] if base['median'] else float('inf')
+        regressed = ratio > 1 + threshold
+        ok = ok and not regressed
+        status = 'REGRESSED' if regressed else ('improved' if ratio < 1 - threshold else 'ok')
+        print(f'{status:>9} {ratio:6.2f}x  {case_key(result)}', file = sys.stderr)
+    return ok
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description = 'kctl benchmarks against a local fake Rancher server')
+    parser.add_argument('--suites', default = ','.join(Suites), help = 'comma separated suites: ' + ', '.join(Suites))
+    parser.add_argument('--only', default = None, help = 'only run the cases whose name contains this')
+    parser.add_argument('--sizes', default = '1000,10000,100000', help = 'pod collection sizes of the decode suite')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--transport', choices = ('mock', 'http'), default = 'mock', help = 'in-process mock transport, or a loopback http server')
+    parser.add_argument('--clusters', type = int, default = 50, help = 'clusters of the fanout suite')
+    parser.add_argument('--latency', type = float, default = 0.005, help = 'seconds of server latency in the fanout suite')
+    parser.add_argument('--output', default = None, help = 'json result file, stdout when not set')
+    parser.add_argument('--compare', default = None, help = 'previous json result file to compare the medians against')
+    parser.add_argument('--threshold', type = float, default = 0.1, help = 'allowed median slowdown when comparing, 0.1 = 10%%')
+    args = parser.parse_args(argv)
+    args.sizes = [int(i) for i in args.sizes.split(',') if i]
+    return args
+
+
+def main(argv = None):
+    args = parse_args(argv)
+    results = []
+    for suite in args.suites.split(','):
+        for case in Suites[suite](args):
+            if args.only and args.only not in case.name: continue
+            result = run_case(case, args.repeat)
+            print(f'{result["median"] * 1000:10.3f}ms  {case_key(result)}', file = sys.stderr)
+            results.append(result)
+    write_results(results, args)
+    if args.compare and not compare(results, args.compare, args.threshold): return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,16 @@
 from . import logz
 from . import static
+from . import cache
 from . import config
 from . import utils
+from . import codec
+from . import retry
+from . import metrics
+from . import singleflight
 from . import classes
+from . import schema_store
+from . import query
+from . import stream
+from . import informer
+from . import transport
 from . import client
@@ -0,0 +1,289 @@
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import collections
+from urllib.parse import urlsplit
+from lazycls.types import *
+from lazycls.utils import to_path, Path
+from .static import ClusterPathRegex
+from .logz import get_logger
+
+try: import fcntl
+except ImportError: fcntl = None
+
+try: import msvcrt
+except ImportError: msvcrt = None
+
+logger = get_logger()
+
+"""
+Process-safe on-disk cache shared by every client and process on a host,
+and the in-memory response cache of a single client.
+
+Files are written to a temp file in the same directory and renamed into place,
+so readers never see a partial write. Refreshes are serialized with an advisory
+file lock, so when many workers find the cache expired only one of them refetches
+while the others wait for it or keep serving their stale copy.
+"""
+
+
+def get_cache_dir(cache_dir: Union[Path, str] = None) -> Path:
+    """ Returns the first writable of cache_dir, $XDG_CACHE_HOME/kctl (~/.cache/kctl)
+        and a per-user temp directory. The package directory is never written to,
+        as site-packages is usually read only.
+    """
+    candidates = [cache_dir] if cache_dir else []
+    candidates.append(os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'kctl'))
+    candidates.append(os.path.join(tempfile.gettempdir(), f'kctl-{os.getuid() if hasattr(os, "getuid") else "user"}'))
+    for candidate in candidates:
+        path = to_path(candidate)
+        try:
+            path.mkdir(parents = True, exist_ok = True)
+            if os.access(path, os.W_OK): return path
+        except OSError: pass
+        logger.warning(f'Cache dir {path} is not writable')
+    raise OSError(f'No writable cache dir in {candidates}')
+
+
+def atomic_write(path: Union[Path, str], data: Union[str, bytes]):
+    """ Writes data to a temp file next to path, then renames it over path"""
+    path = to_path(path)
+    if isinstance(data, str): data = data.encode('utf-8')
+    fd, tmp = tempfile.mkstemp(dir = path.parent, prefix = f'.{path.name}.', suffix = '.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f: f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+
+
+class FileLock:
+    """ Exclusive advisory lock on path, held across processes and threads.
+        args:
+            - timeout: seconds to wait in acquire, None waits forever
+            - poll: seconds between attempts while waiting
+    """
+    def __init__(self, path: Union[Path, str], timeout: float = None, poll: float = 0.05):
+        self.path = to_path(path)
+        self.timeout = timeout
+        self.poll = poll
+        self._fd: int = None
+
+    @property
+    def locked(self): return self._fd is not None
+
+    def _try_lock(self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None: fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt is not None: msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def acquire(self, blocking: bool = True, timeout: float = None) -> bool:
+        """ Returns whether the lock was acquired"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        while not self._try_lock():
+            if not blocking or (timeout is not None and time.monotonic() - start >= timeout): return False
+            time.sleep(self.poll)
+        return True
+
+    async def async_acquire(self, blocking: bool = True, timeout: float = None) -> bool:
+        """ Like acquire, but waits without blocking the event loop"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        while not self._try_lock():
+            if not blocking or (timeout is not None and time.monotonic() - start >= timeout): return False
+            await asyncio.sleep(self.poll)
+        return True
+
+    def release(self):
+        if self._fd is None: return
+        try:
+            if fcntl is not None: fcntl.flock(self._fd, fcntl.LOCK_UN)
+            elif msvcrt is not None: msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        if not self.acquire(): raise TimeoutError(f'Timed out waiting for {self.path}')
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    async def __aenter__(self):
+        if not await self.async_acquire(): raise TimeoutError(f'Timed out waiting for {self.path}')
+        return self
+
+    async def __aexit__(self, *args):
+        self.release()
+
+
+class SharedCache:
+    """ Named files in cache_dir with atomic writes, ttl checks and per name refresh locks.
+        args:
+            - cache_dir: see get_cache_dir
+            - lock_timeout: max seconds to wait for another process to finish a refresh
+    """
+    def __init__(self, cache_dir: Union[Path, str] = None, lock_timeout: float = 60.0):
+        self.cache_dir = get_cache_dir(cache_dir)
+        self.lock_timeout = lock_timeout
+
+    def path(self, name: str) -> Path:
+        return self.cache_dir.joinpath(name)
+
+    def age(self, name: str) -> Optional[float]:
+        """ Seconds since name was written or touched, None if it does not exist"""
+        try: return time.time() - os.path.getmtime(self.path(name))
+        except OSError: return None
+
+    def is_fresh(self, name: str, ttl: float) -> bool:
+        age = self.age(name)
+        return age is not None and age < ttl
+
+    def read_bytes(self, name: str, ttl: float = None) -> Optional[bytes]:
+        if ttl is not None and not self.is_fresh(name, ttl): return None
+        try: return self.path(name).read_bytes()
+        except OSError: return None
+
+    def read_text(self, name: str, ttl: float = None) -> Optional[str]:
+        data = self.read_bytes(name, ttl)
+        return None if data is None else data.decode('utf-8')
+
+    def write(self, name: str, data: Union[str, bytes]):
+        atomic_write(self.path(name), data)
+
+    def touch(self, *names: str):
+        for name in names:
+            try: os.utime(self.path(name))
+            except OSError: pass
+
+    def remove(self, *names: str):
+        for name in names:
+            try: os.remove(self.path(name))
+            except OSError: pass
+
+    def lock(self, name: str, timeout: float = None) -> FileLock:
+        """ Lock guarding the refresh of name. Use as a (async) context manager, or acquire(blocking=False)
+            to only refresh when no other process already is.
+        """
+        return FileLock(self.path(f'{name}.lock'), timeout = self.lock_timeout if timeout is None else timeout)
+
+
+class CollectionIndex:
+    """ Finds the schema type of a url from the collection urls of the schema"""
+    def __init__(self):
+        # collection path -> type name, see set_collections
+        self.collections: Dict[str, str] = {}
+
+    def set_collections(self, collection_urls: Dict[str, str]):
+        """ Registers the {type name: collection url} of the schema, used to find the type of a url"""
+        self.collections = {self.path(url): type_name for type_name, url in collection_urls.items() if url}
+
+    @staticmethod
+    def path(url: str) -> str:
+        return ClusterPathRegex.sub('', urlsplit(url).path, count = 1).rstrip('/')
+
+    def resolve(self, url: str) -> Tuple[str, Optional[str]]:
+        """ Returns (collection path, type name) of url, by its longest registered collection prefix"""
+        path = self.path(url)
+        prefix = path
+        while prefix:
+            if prefix in self.collections: return prefix, self.collections[prefix]
+            prefix = prefix.rsplit('/', 1)[0]
+        return path, None
+
+
+class ResponseCache(CollectionIndex):
+    """ In-memory LRU of GET responses with per type ttls.
+        Entries are invalidated by the writes of their type, so a POST / PUT / DELETE
+        against a collection or one of its resources drops every cached read under it.
+        args:
+            - maxsize: max entries before the least recently used is evicted
+            - ttl: seconds a response is cached for, unless its type is in ttls
+            - ttls: {type name: seconds}, 0 disables caching of the type
+            - negative_ttl: seconds a 404 is cached for, 0 disables negative caching
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 5.0, ttls: Dict[str, float] = None, negative_ttl: float = 5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.negative_ttl = negative_ttl
+        super().__init__()
+        self.entries: 'collections.OrderedDict[Tuple, Tuple[float, str, Any]]' = collections.OrderedDict()
+        self.stats = collections.Counter()
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, params: Dict = None) -> Tuple:
+        items = []
+        for k, v in (params or {}).items():
+            if v is None: continue
+            items.append((k, tuple(v) if isinstance(v, (list, tuple)) else v))
+        return (url, tuple(sorted(items, key = str)))
+
+    def get(self, key: Tuple):
+        """ Returns the cached value of key, or None on a miss"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                self.stats['misses'] += 1
+                self.stats['expired'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['negative_hits' if isinstance(entry[2], Exception) else 'hits'] += 1
+            return entry[2]
+
+    def put(self, key: Tuple, value, negative: bool = False, generation: int = None):
+        """ Caches value for the ttl of its type. Skipped if an invalidation happened since generation was read"""
+        prefix, type_name = self.resolve(key[0])
+        ttl = self.negative_ttl if negative else self.ttls.get(type_name, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0: return
+        with self._lock:
+            if generation is not None and generation != self.generation: return
+            self.entries[key] = (time.monotonic() + ttl, prefix, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last = False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, url: str):
+        """ Drops every entry of the type of url, or under url itself if its type is unknown"""
+        prefix, _ = self.resolve(url)
+        with self._lock:
+            self.generation += 1
+            keys = [key for key, entry in self.entries.items() if entry[1] == prefix or entry[1].startswith(prefix + '/')]
+            for key in keys: del self.entries[key]
+            self.stats['invalidations'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def __len__(self): return len(self.entries)
+
+
+__all__ = [
+    'get_cache_dir',
+    'atomic_write',
+    'FileLock',
+    'SharedCache',
+    'CollectionIndex',
+    'ResponseCache',
+]
@@ -1,12 +1,24 @@
 from .static import *
-from lazycls.serializers import Json
+from typing import FrozenSet
 from lazycls.types import *
 from lazycls import create_lazycls, BaseModel
 from lazycls.funcs import timed_cache
 from .utils import create_clskey, convert_type_name
+from .codec import get_codec
 from types import coroutine
+from typing import Iterator
+from functools import partial
+
+# value of deleted fields in RestObject._changed_fields
+Deleted = object()
 
 class RestObject(object):
+    """ Decoded api object. Fields assigned or deleted after decoding are tracked,
+        see changes(), so updates can send only what was modified. Plain lists and maps
+        are copied when decoded (see freeze_fields), so changes made to them in place are found.
+    """
+    _private = ('_dirty', '_original', '_frozen')
+
     def __init__(self):
         pass
 
@@ -14,28 +26,89 @@ class RestObject(object):
         return self.__repr__()
     
     def __repr__(self):
-        data = {k: v for k, v in self.__dict__.items() if self._is_public(k, v)}
-        return repr(data)
+        return repr(self.data_dict())
 
     def __getattr__(self, k):
         if self._is_list() and k in LIST_METHODS: return getattr(self.data, k)
         return getattr(self.__dict__, k)
     
     def __setattr__(self, k, v):
+        self._snapshot(k)
         self.__dict__[k] = v
+        self._mark_dirty(k)
+
+    def __delattr__(self, k):
+        if k not in self.__dict__: raise AttributeError(k)
+        self._snapshot(k)
+        del self.__dict__[k]
+        self._mark_dirty(k)
+
+    def _mark_dirty(self, k):
+        dirty = self.__dict__.get('_dirty')
+        if dirty is None: dirty = self.__dict__['_dirty'] = set()
+        dirty.add(k)
+
+    def _field(self, k):
+        return self.__dict__.get(k)
+
+    def _snapshot(self, k):
+        """ Keeps the plain value a map field had before it was first assigned, see changes()"""
+        if k in (self.__dict__.get('_dirty') or ()): return
+        value = self._field(k)
+        if isinstance(value, (RestObject, dict)): self.__dict__.setdefault('_original', {})[k] = self._plain(value)
+
+    @staticmethod
+    def _plain(value):
+        if isinstance(value, RestObject): return {k: RestObject._plain(v) for k, v in value.data_dict().items()}
+        if isinstance(value, dict): return {k: RestObject._plain(v) for k, v in value.items()}
+        if isinstance(value, list): return [RestObject._plain(v) for v in value]
+        return value
+
+    @staticmethod
+    def _copy(value):
+        """ Copy of the plain lists and maps of value, objects are kept as they track their own changes"""
+        if isinstance(value, list): return [RestObject._copy(v) for v in value]
+        if isinstance(value, dict): return {k: RestObject._copy(v) for k, v in value.items()}
+        return value
+
+    @staticmethod
+    def _has_dirty(value) -> bool:
+        if isinstance(value, RestObject): return value.is_dirty
+        if isinstance(value, list): return any(RestObject._has_dirty(v) for v in value)
+        if isinstance(value, dict): return any(RestObject._has_dirty(v) for v in value.values())
+        return False
+
+    def freeze_fields(self):
+        """ Keeps a copy of the plain lists and maps of the fields, compared by changes() to find
+            the ones modified in place, ie. obj.spec.args.append(...)
+        """
+        frozen = {k: self._copy(v) for k, v in self.__dict__.items() if k not in self._private and isinstance(v, (list, dict))}
+        if frozen: self.__dict__['_frozen'] = frozen
+        else: self.__dict__.pop('_frozen', None)
+
+    def _modified_in_place(self, k, v) -> bool:
+        frozen = self.__dict__.get('_frozen') or {}
+        return (k in frozen and self._copy(v) != frozen[k]) or self._has_dirty(v)
+
+    @staticmethod
+    def _merge_value(original, value):
+        """ value as a merge patch of original, the keys original had and value lacks are nulled"""
+        if not isinstance(original, dict) or not isinstance(value, (RestObject, dict)): return value
+        value = RestObject._plain(value)
+        patch = {k: None for k in original if k not in value}
+        for k, v in value.items(): patch[k] = RestObject._merge_value(original.get(k), v)
+        return patch
 
     def __getitem__(self, key):
         return self.__dict__[key]
 
     def __iter__(self):
         if self._is_list(): return iter(self.data)
-        data = {k: v for k, v in self.__dict__.items() if self._is_public(k, v)}
-        return iter(data.keys())
+        return iter(self.data_dict().keys())
 
     def __len__(self):
         if self._is_list(): return len(self.data)
-        data = {k: v for k, v in self.__dict__.items() if self._is_public(k, v)}
-        return len(data)
+        return len(self.data_dict())
 
     @staticmethod
     def _is_public(k, v):
@@ -45,7 +118,62 @@ class RestObject(object):
         return 'data' in self.__dict__ and isinstance(self.data, list)
 
     def data_dict(self):
-        return {k: v for k, v in self.__dict__.items() if self._is_public(k, v)}
+        return {k: v for k, v in self.__dict__.items() if k not in self._private and self._is_public(k, v)}
+
+    def _changed_fields(self, path: Tuple = ()) -> Iterator[Tuple[Tuple, Any, Any]]:
+        """ Yields the (path, value, original) of each field assigned, deleted or modified in place since decoding,
+            Deleted for deleted fields. original is the plain value a reassigned or modified map field had, else None.
+        """
+        dirty = self.__dict__.get('_dirty') or ()
+        original = self.__dict__.get('_original') or {}
+        frozen = self.__dict__.get('_frozen') or {}
+        for k, v in self.__dict__.items():
+            if k in self._private or callable(v): continue
+            if k in dirty: yield path + (k,), v, original.get(k)
+            elif isinstance(v, RestObject): yield from v._changed_fields(path + (k,))
+            elif isinstance(v, (list, dict)) and self._modified_in_place(k, v): yield path + (k,), v, frozen.get(k) if isinstance(v, dict) else None
+        for k in dirty:
+            if k not in self.__dict__: yield path + (k,), Deleted, None
+
+    def changes(self) -> Dict:
+        """ Returns the JSON merge patch (RFC 7386) of the fields assigned, deleted or modified in place
+            since decoding, descending into nested objects. Lists are sent whole if they or any of their
+            objects changed. A reassigned map replaces the previous one, the keys it no longer has are sent as null.
+        """
+        patch = {}
+        for path, value, original in self._changed_fields():
+            node = patch
+            for k in path[:-1]: node = node.setdefault(k, {})
+            node[path[-1]] = None if value is Deleted else self._merge_value(original, value)
+        return patch
+
+    def json_patch(self) -> List[Dict]:
+        """ Returns the changes as JSON patch (RFC 6902) operations"""
+        ops = []
+        for path, value, original in self._changed_fields():
+            pointer = ''.join('/' + str(k).replace('~', '~0').replace('/', '~1') for k in path)
+            if value is Deleted: ops.append({'op': 'remove', 'path': pointer})
+            else: ops.append({'op': 'add' if original is None else 'replace', 'path': pointer, 'value': value})
+        return ops
+
+    @property
+    def is_dirty(self) -> bool: return next(self._changed_fields(), None) is not None
+
+    def reset_changes(self):
+        """ Marks every field as unmodified, ie. once the changes were sent"""
+        self.__dict__.pop('_dirty', None)
+        self.__dict__.pop('_original', None)
+        for k, v in self.__dict__.items():
+            if k not in self._private: self._reset_nested(v)
+        self.freeze_fields()
+
+    @staticmethod
+    def _reset_nested(value):
+        if isinstance(value, RestObject): value.reset_changes()
+        elif isinstance(value, list):
+            for v in value: RestObject._reset_nested(v)
+        elif isinstance(value, dict):
+            for v in value.values(): RestObject._reset_nested(v)
     
     @property
     def dict(self): return self.data_dict()
@@ -57,21 +185,26 @@ class RestObject(object):
     def values(self): return self.dict.values()
         
     @property
-    def json(self): return Json.dumps(self.data_dict(), ensure_ascii=False, indent=2)
+    def json(self): return get_codec().dumps(self.data_dict(), indent=2, default=self._json_default)
+
+    @staticmethod
+    def _json_default(obj):
+        if isinstance(obj, RestObject): return obj.data_dict()
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
     
     def update_data(self, client):
-        """ Method to update the obj using a PUT request.
+        """ Method to update the obj, with a PATCH of its changes where the schema allows it, else a PUT.
             args:
                 - client: likely KctlClient.v1
         """
-        client.update_data(self)
+        return client.update_data(self)
     
     async def async_update_data(self, client):
-        """ Async Method to update the obj using a PUT request.
+        """ Async Method to update the obj, with a PATCH of its changes where the schema allows it, else a PUT.
             args:
                 - client: likely KctlClient.v1
         """
-        await client.async_update_data(self)
+        return await client.async_update_data(self)
 
 
     @timed_cache(10)
@@ -90,20 +223,189 @@ class RestObject(object):
         return create_lazycls(clsname=clsname, data=d)
 
 
+class LazyRestObject(RestObject):
+    """ RestObject that keeps the decoded json dict and only resolves fields when accessed.
+        Nested dicts are wrapped on first access, and links / actions / pagination
+        are bound to the client on demand rather than eagerly as closures.
+    """
+    _private = ('_raw', '_client', '_dirty', '_original', '_frozen', '_deleted')
+
+    def __init__(self, raw: Dict = None, client = None):
+        self.__dict__['_raw'] = raw if raw is not None else {}
+        self.__dict__['_client'] = client
+
+    @classmethod
+    def wrap(cls, value, client = None):
+        if isinstance(value, dict): return cls(value, client)
+        if isinstance(value, list): return [cls.wrap(v, client) for v in value]
+        return value
+
+    def __getattr__(self, k):
+        raw = self.__dict__.get('_raw')
+        if raw is None or k.startswith('__'): raise AttributeError(k)
+        # raw fields deleted since decoding stay deleted
+        if k in raw and k not in (self.__dict__.get('_deleted') or ()): v = self.wrap(raw[k], self._client)
+        else:
+            v = self._resolve_callable(k)
+            if v is None:
+                if self._is_list() and k in LIST_METHODS: return getattr(self.data, k)
+                return getattr(self.data_dict(), k)
+        # raw lists are wrapped into new ones, kept so changes made to them in place are found
+        if isinstance(v, list): self.__dict__.setdefault('_frozen', {})[k] = self._copy(v)
+        self.__dict__[k] = v
+        return v
+
+    def __getitem__(self, key):
+        if key in self.__dict__ or key in self._raw: return getattr(self, key)
+        raise KeyError(key)
+
+    def __setattr__(self, k, v):
+        deleted = self.__dict__.get('_deleted')
+        if deleted: deleted.discard(k)
+        super().__setattr__(k, v)
+
+    def __delattr__(self, k):
+        deleted = self.__dict__.setdefault('_deleted', set())
+        if k in deleted or (k not in self.__dict__ and k not in self._raw): raise AttributeError(k)
+        self._snapshot(k)
+        self.__dict__.pop(k, None)
+        deleted.add(k)
+        self._mark_dirty(k)
+
+    def _field(self, k):
+        if k in self.__dict__: return self.__dict__[k]
+        if k in (self.__dict__.get('_deleted') or ()): return None
+        return self._raw.get(k)
+
+    def _resolve_callable(self, k):
+        client = self._client
+        if client is None: return None
+        raw = self._raw
+        if k in {'next', 'prev'}:
+            pagination = raw.get('pagination')
+            if isinstance(pagination, dict) and pagination.get(k) is not None: return partial(client._get, pagination[k])
+        if not isinstance(raw.get('type'), str): return None
+        links = raw.get('links') or {}
+        actions = raw.get('actions') or {}
+        if k in links: return None if k in raw else partial(client._follow_link, links[k])
+        if k.endswith('_link') and k[:-5] in links and k[:-5] in raw: return partial(client._follow_link, links[k[:-5]])
+        if k in actions: return None if k in raw else partial(client.action, self, k)
+        if k.endswith('_action') and k[:-7] in actions and (k[:-7] in raw or k[:-7] in links): return partial(client.action, self, k[:-7])
+        return None
+
+    def _is_list(self):
+        if 'data' in self.__dict__: return isinstance(self.__dict__['data'], list)
+        return isinstance(self._raw.get('data'), list)
+
+    def data_dict(self):
+        deleted = self.__dict__.get('_deleted') or ()
+        d = {k: getattr(self, k) for k in self._raw if k not in deleted}
+        for k, v in self.__dict__.items():
+            if k not in d and k not in self._private: d[k] = v
+        return {k: v for k, v in d.items() if self._is_public(k, v)}
 
 
 class Schema(object):
-    def __init__(self, text, obj = None):
-        self.text = text
-        self.types = {}
-        if obj and type(obj) != coroutine: self._sync_load(obj)
+    """ Rancher api schema.
+        `index` is a compact, plain dict view of every type (collection url, methods,
+        collectionFilters and resourceFields) that the client works from, while the
+        full RestObject `types` are only built from the raw text when first accessed.
+        args:
+            - text: raw schema json
+            - loader: reads the raw text on first access when text is not passed
+            - obj: unmarshalled schema collection, builds the full types eagerly
+            - index: precompiled index, see Schema.compile
+            - decoder: unmarshalls the raw text into RestObjects
+            - fingerprint: hash of the raw text, used to tell schema versions apart
+
+        A schema of the schema store is stored with its links under SchemaBase, see bind
+    """
+    index_fields = ('collectionMethods', 'resourceMethods', 'collectionFilters', 'resourceFields')
+
+    def __init__(self, text = None, obj = None, index: Dict[str, Dict] = None, loader: Callable = None, decoder: Callable = None, fingerprint: str = None):
+        self._text = text
+        self.fingerprint = fingerprint
+        self._loader = loader
+        self._decoder = decoder
+        self._types = None
+        self._filters: Dict[str, FrozenSet[str]] = {}
+        self.index: Dict[str, Dict] = index or {}
+        # base url that SchemaBase stands for in the index and text, None when they are absolute
+        self.base: str = None
+        # values the clients derive from the index, shared by every schema bound to the same one
+        self.shared: Dict[str, Any] = {}
+        if obj and type(obj) != coroutine:
+            self._sync_load(obj)
+            if not index: self.index = self.compile({'data': [self._plain(t) for t in self._types.values()]})
+
+    @classmethod
+    def compile(cls, data: Dict) -> Dict[str, Dict]:
+        """ Builds the compact index from the plain decoded schema collection"""
+        index = {}
+        for t in data.get('data') or []:
+            if t.get('type') != 'schema': continue
+            entry = {'id': t['id'], 'collection': (t.get('links') or {}).get('collection')}
+            for field in cls.index_fields: entry[field] = t.get(field) or ({} if field in {'collectionFilters', 'resourceFields'} else [])
+            # resource names in v1 API may contain '-' or '.'
+            index[convert_type_name(t['id'])] = entry
+        return index
+
+    def bind(self, base: str, decoder: Callable = None) -> 'Schema':
+        """ Returns this schema under the base url of a cluster. The index, filters and shared values
+            are not copied, only the raw text is rewritten once the types are built.
+        """
+        schema = Schema(index = self.index, loader = partial(self._rebased_text, base), decoder = decoder, fingerprint = self.fingerprint)
+        schema._filters = self._filters
+        schema.shared = self.shared
+        schema.base = base
+        return schema
+
+    def _rebased_text(self, base: str) -> Optional[str]:
+        text = self._text if self._text is not None else (self._loader() if self._loader is not None else None)
+        return text.replace(SchemaBase + '/', base + '/') if text else text
+
+    def url(self, url: str) -> str:
+        """ Resolves a url of the index or text against base"""
+        if self.base is None or not url or not url.startswith(SchemaBase): return url
+        return self.base + url[len(SchemaBase):]
+
+    def collection_url(self, type_name: str) -> str:
+        return self.url(self.index[type_name]['collection'])
+
+    def filters(self, type_name: str) -> FrozenSet[str]:
+        """ Returns the searchable params of type_name: each collectionFilter and its <name>_<modifier>.
+            Built once per type and schema version, so list validation is a set lookup.
+        """
+        filters = self._filters.get(type_name)
+        if filters is None:
+            names = set()
+            for name, spec in ((self.index.get(type_name) or {}).get('collectionFilters') or {}).items():
+                names.add(name)
+                names.update(f'{name}_{modifier}' for modifier in ((spec or {}).get('modifiers') or []))
+            filters = self._filters[type_name] = frozenset(names)
+        return filters
+
+    _plain = staticmethod(RestObject._plain)
+
+    @property
+    def text(self):
+        if self._text is None and self._loader is not None: self._text = self._loader()
+        return self._text
+
+    @property
+    def types(self) -> Dict[str, RestObject]:
+        if self._types is None:
+            if self._decoder is None or not self.text: return {}
+            self._sync_load(self._decoder(self.text))
+        return self._types
 
     async def _async_load(self, obj):
         await obj
+        self._types = {}
         for t in obj:
             if t.type != 'schema': continue
             # resource names in v1 API may contain '-' or '.'
-            self.types[convert_type_name(t.id)] = t
+            self._types[convert_type_name(t.id)] = t
             t.creatable = False
             try:
                 if POST_METHOD in t.collectionMethods: t.creatable = True
@@ -124,10 +426,11 @@ class Schema(object):
 
 
     def _sync_load(self, obj):
+        self._types = {}
         for t in obj:
             if t.type != 'schema': continue
             # resource names in v1 API may contain '-' or '.'
-            self.types[convert_type_name(t.id)] = t
+            self._types[convert_type_name(t.id)] = t
             
             t.creatable = False
             try:
@@ -158,9 +461,47 @@ class Schema(object):
         return repr(self.text)
 
 
+class ClusterResult(object):
+    """ Outcome of a fan-out call against a single cluster"""
+    def __init__(self, cluster_name: str, result = None, error: Exception = None, elapsed: float = 0.0):
+        self.cluster_name = cluster_name
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self): return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else f'error={self.error!r}'
+        return f'<ClusterResult {self.cluster_name} {status} {self.elapsed:.3f}s>'
+
+
+class BulkResult(object):
+    """ Outcome of one item of a bulk create / update / delete / action.
+        skipped is set for items never sent because an earlier item failed with stop_on_error.
+    """
+    def __init__(self, index: int, item = None, result = None, error: Exception = None, elapsed: float = 0.0, skipped: bool = False):
+        self.index = index
+        self.item = item
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+        self.skipped = skipped
+
+    @property
+    def ok(self): return self.error is None and not self.skipped
+
+    def __repr__(self):
+        status = 'skipped' if self.skipped else 'ok' if self.ok else f'error={self.error!r}'
+        return f'<BulkResult {self.index} {status} {self.elapsed:.3f}s>'
+
+
 class ApiError(Exception):
-    def __init__(self, obj):
+    def __init__(self, obj, response = None):
         self.error = obj
+        self.status_code = getattr(response, 'status_code', None) or getattr(obj, 'status', None)
+        self.headers = getattr(response, 'headers', None) or {}
         try:
             msg = '{} : {}\n\t{}'.format(obj.code, obj.message, obj)
             super(ApiError, self).__init__(self, msg)
@@ -1,29 +1,79 @@
-import os
 import re
-import json
+import inspect
 import time
+import asyncio
 import hashlib
+import threading
+import contextlib
+import contextvars
 import collections
-from lazyapi import ApiClient
+from functools import partial, wraps
+from typing import Iterable, Iterator, AsyncIterator
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from lazycls import classproperty
 from .utils import *
 from .classes import *
 from .config import KctlContextCfg
+from .static import ClusterPathRegex
+from .cache import CollectionIndex, ResponseCache
+from .metrics import metrics
+from .singleflight import SingleFlight, AsyncSingleFlight
+from .codec import get_codec
+from .retry import RetryPolicy
+from .informer import Informer
+from .query import Query, ReservedParams, project
+from .stream import CollectionParser
+from .schema_store import get_schema_base, normalize_schema, schema_store
+from .transport import PooledApiClient, get_transport_key, transports, kube_clients
 from kubernetes.client import ApiClient as KubernetesClient
 
 class KctlBaseClient:
     def __init__(self, host: str = "", api_version: str = None, *args, **kwargs):
         self._cfg = KctlContextCfg(host=host, api_version = api_version, *args, **kwargs)
-        self.url = self._cfg.url
-        self._client = ApiClient(headers = self._cfg.headers, verify = self._cfg.ssl_verify, module_name=f'kctl.{self._cfg.api_version}', default_resp = True)
-        self.schema = None
-        if self._cfg.is_enabled: self._load_schemas()
+        self._cluster_var = contextvars.ContextVar(f'kctl_cluster_{id(self)}', default = None)
+        self._informers: Dict[str, Informer] = {}
+        self._views: Dict[str, 'ClusterView'] = {}
+        self._schema: Schema = None
+        self._schema_loaded = False
+        self._schema_task: asyncio.Future = None
+        self._schema_expires: float = None
+        self._schema_lock = threading.Lock()
+        self._revalidating = False
+        # the loop only keeps weak references to its tasks
+        self._revalidate_task: asyncio.Task = None
+        self._transport_key: Tuple = None
+        self._configure()
+        if self._cfg.is_enabled and not self._cfg.lazy_connect: self._load_schemas()
     
     def reset_config(self, host: str = None, api_version: str = None, reset_schema: bool = True, *args, **kwargs):
         self._cfg = KctlContextCfg(host=host, api_version = api_version, *args, **kwargs)
-        self.url = self._cfg.url
-        self._client = ApiClient(headers = self._cfg.headers, verify = self._cfg.ssl_verify, module_name=f'kctl.{self._cfg.api_version}', default_resp = True)
+        self._configure()
         if reset_schema: self.reload_schema()
+
+    def _configure(self):
+        """ (Re)builds the url, http client, codec and retry policy from the current config"""
+        self.url = self._cfg.url
+        key = get_transport_key(self._cfg)
+        if key != self._transport_key:
+            transports.acquire(key)
+            if self._transport_key is not None: transports.release(self._transport_key)
+            self._transport_key = key
+        self._client = PooledApiClient(key, transports, headers = self._cfg.headers, module_name=f'kctl.{self._cfg.api_version}', default_resp = True)
+        self._codec = get_codec(self._cfg.json_codec)
+        self._retry = RetryPolicy.from_config(self._cfg)
+        self._metrics = metrics if self._cfg.metrics else None
+        if self._metrics is not None: self._retry.hooks.append(self._record_retry)
+        on_shared = self._record_coalesced if self._metrics is not None else None
+        self._flight = SingleFlight(on_shared) if self._cfg.coalesce_requests else None
+        self._async_flight = AsyncSingleFlight(on_shared) if self._cfg.coalesce_requests else None
+        self._cache = None
+        if self._cfg.response_cache:
+            ttls = {convert_type_name(k): v for k, v in self._cfg.response_cache_ttls.items()}
+            self._cache = ResponseCache(self._cfg.response_cache_size, self._cfg.response_cache_ttl, ttls, self._cfg.response_cache_negative_ttl)
+        # url -> type lookup of the cache and the metrics labels
+        self._url_types = self._cache if self._cache is not None else CollectionIndex()
+        if self.__dict__.get('_schema') is not None: self._url_types.set_collections({t: self._schema.collection_url(t) for t in self._schema.index})
     
     def set_cluster(self, cluster_name: str, reset_schema: bool = True):
         """ Sets the Base url property to the cluster"""
@@ -32,6 +82,73 @@ class KctlBaseClient:
 
     def reload_schema(self):
         self._load_schemas(force=True)
+
+    def close(self):
+        """ Stops the informers and releases the shared connection pool, closing it if no other client uses it"""
+        for informer in list(self._informers.values()): informer.stop()
+        if self._transport_key is not None: transports.release(self._transport_key)
+        self._transport_key = None
+
+    async def aclose(self):
+        for informer in list(self._informers.values()): informer.stop()
+        if self._transport_key is not None: await transports.async_release(self._transport_key)
+        self._transport_key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    async def __aenter__(self):
+        await self._async_ensure_schema()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    @property
+    def schema(self) -> Schema:
+        """ The api schema, loaded on first access when the client connects lazily"""
+        if self._schema is None:
+            if not self._schema_loaded and self._cfg.is_enabled: self._load_schemas()
+        elif self._schema_expires is not None and time.monotonic() > self._schema_expires: self._schedule_revalidate()
+        return self._schema
+
+    @schema.setter
+    def schema(self, schema: Schema):
+        self._schema = schema
+
+    async def _async_ensure_schema(self):
+        """ Loads the schema without blocking the event loop, sharing one load between concurrent callers"""
+        if self._schema is not None or self._schema_loaded or not self._cfg.is_enabled: return
+        if self._schema_task is None or self._schema_task.done(): self._schema_task = asyncio.ensure_future(self._async_load_schemas())
+        await self._schema_task
+
+    @contextlib.contextmanager
+    def cluster_scope(self, cluster_name: str):
+        """ Routes calls made within the current thread / task to cluster_name
+            without changing the client url or reloading the schema.
+        """
+        token = self._cluster_var.set(cluster_name)
+        try: yield self
+        finally: self._cluster_var.reset(token)
+
+    def cluster(self, cluster_name: str) -> 'ClusterView':
+        """ Returns an immutable view of the client bound to cluster_name.
+            It shares the connection pool, auth and schema of the client, so any number of
+            clusters can be used at once from threads or tasks without set_cluster.
+        """
+        view = self._views.get(cluster_name)
+        if view is not None: return view
+        if cluster_name not in self._cfg.rancher_ctxs: raise ClientApiError(f'{cluster_name} is not a known cluster')
+        return self._views.setdefault(cluster_name, ClusterView(self, cluster_name))
+
+    def _collection_url(self, type_name: str):
+        url = self.schema.collection_url(type_name)
+        cluster_name = self._cluster_var.get()
+        if cluster_name: url = self._cfg.rebase_url(url, cluster_name)
+        return url
     
     def valid(self):
         return self.url is not None and self.schema is not None
@@ -40,13 +157,19 @@ class KctlBaseClient:
         if isinstance(obj, list): return [self.object_hook(x) for x in obj]
         if isinstance(obj, dict):
             result = RestObject()
+            # written to __dict__ directly, so decoding does not mark the fields as changed
+            fields = result.__dict__
+            # plain lists are copied as well, so changes made to them in place are found, see RestObject.freeze_fields
+            frozen = {}
             for k, v in obj.items():
-                setattr(result, k, self.object_hook(v))
+                v = fields[k] = self.object_hook(v)
+                if isinstance(v, list): frozen[k] = RestObject._copy(v)
+            if frozen: fields['_frozen'] = frozen
 
             for link in ['next', 'prev']:
                 try:
                     url = getattr(result.pagination, link)
-                    if url is not None: setattr(result, link, lambda url=url: self._get(url))
+                    if url is not None: fields[link] = lambda url=url: self._get(url)
                 except AttributeError: pass
 
             if hasattr(result, 'type') and isinstance(getattr(result, 'type'), str):
@@ -54,16 +177,14 @@ class KctlBaseClient:
                     for link_name, link in result.links.items():
                         def cb_link(_link=link, **kw): 
                             return self._get(_link, data=kw)
-                        if hasattr(result, link_name): setattr(result, link_name + '_link', cb_link)
-                        else: setattr(result, link_name, cb_link)
+                        fields[link_name + '_link' if hasattr(result, link_name) else link_name] = cb_link
 
 
                 if hasattr(result, 'actions'):
                     for link_name, link in result.actions.items():
                         def cb_action(_link_name=link_name, _result=result, *args, **kw):
                             return self.action(_result, _link_name, *args, **kw)
-                        if hasattr(result, link_name): setattr(result, link_name + '_action', cb_action)
-                        else: setattr(result, link_name, cb_action)
+                        fields[link_name + '_action' if hasattr(result, link_name) else link_name] = cb_action
 
             return result
         return obj
@@ -74,114 +195,398 @@ class KctlBaseClient:
             ret[k] = v
         return self.object_hook(ret)
     
-    def _get(self, url: str, data=None):
-        return self._unmarshall(self._get_raw(url, data=data))
+    def _follow_link(self, url: str, **kw):
+        return self._get(url, data=kw)
+
+    def _get(self, url: str, data=None, mode: str = None, cache: bool = True):
+        binary = mode == 'bytes' or self._codec.binary
+        return self._unmarshall(self._get_raw(url, data=data, binary=binary, cache=cache), mode=mode, url=url)
     
-    async def _async_get(self, url: str, data=None):
-        return self._unmarshall(await self._async_get_raw(url, data=data))
+    async def _async_get(self, url: str, data=None, mode: str = None, cache: bool = True):
+        binary = mode == 'bytes' or self._codec.binary
+        return self._unmarshall(await self._async_get_raw(url, data=data, binary=binary, cache=cache), mode=mode, url=url)
+
+    def _error(self, text, response = None):
+        # gateways in front of rancher may answer with a non json body
+        try: obj = self._unmarshall(text)
+        except ValueError: obj = None
+        raise ApiError(obj, response)
 
-    def _error(self, text):
-        raise ApiError(self._unmarshall(text))
+    def _request(self, method: str, url: str, retry: bool = False, retries: int = None, headers: Dict = None, **kwargs):
+        """ Sends a request through the retry policy. Raises ApiError on a non 2xx response.
+            retry forces retries for non idempotent methods, retries overrides the max retries.
+            headers are added to the auth headers of the config.
+        """
+        func = getattr(self._client, method.lower())
+        write = method != GET_METHOD
+        if write: self._invalidate(url)
+        headers = {**self._cfg.headers, **headers} if headers else self._cfg.headers
+        start, r = time.perf_counter(), None
+        try: r = self._retry.call(method, func, url, force = retry, max_retries = retries, headers = headers, **kwargs)
+        finally:
+            # a GET started while the write was in flight may have read the old data
+            if write: self._invalidate(url)
+            if self._metrics is not None: self._record_request(method, url, start, r, kwargs.get('data'))
+        if r.status_code < 200 or r.status_code >= 300: self._error(r.text, r)
+        return r
+
+    async def _async_request(self, method: str, url: str, retry: bool = False, retries: int = None, headers: Dict = None, **kwargs):
+        func = getattr(self._client, f'async_{method.lower()}')
+        write = method != GET_METHOD
+        if write: self._invalidate(url)
+        headers = {**self._cfg.headers, **headers} if headers else self._cfg.headers
+        start, r = time.perf_counter(), None
+        try: r = await self._retry.async_call(method, func, url, force = retry, max_retries = retries, headers = headers, **kwargs)
+        finally:
+            if write: self._invalidate(url)
+            if self._metrics is not None: self._record_request(method, url, start, r, kwargs.get('data'))
+        if r.status_code < 200 or r.status_code >= 300: self._error(r.text, r)
+        return r
     
-    @timed_url
-    def _get_raw(self, url: str, data=None):
-        r = self._get_response(url, data)
-        return r.text
+    def _invalidate(self, url: str):
+        """ Called before and after a write to url. Bumping the cache generation again once the write
+            returned keeps GETs that started during the write from caching what they read, and detaching
+            the in-flight GETs of the type keeps later reads from joining one that started before the write
+        """
+        if self._cache is not None: self._cache.invalidate(url)
+        if self._flight is None: return
+        prefix = self._url_types.resolve(url)[0]
+        def match(key: Tuple) -> bool:
+            path = CollectionIndex.path(key[0])
+            return path == prefix or path.startswith(prefix + '/')
+        self._flight.forget(match)
+        self._async_flight.forget(match)
+
+    def _get_raw(self, url: str, data=None, binary: bool = False, cache: bool = True):
+        """ cache=False always sends a request of its own, bypassing both the response cache and coalescing"""
+        if not cache: r = self._get_response(url, data)
+        elif self._cache is not None: r = self._get_cached_response(url, data)
+        else: r = self._shared_get_response(url, data)
+        return r.content if binary else r.text
     
-    @timed_url
-    async def _async_get_raw(self, url: str, data=None):
-        r = await self._async_get_response(url, data)
-        return r.text
+    async def _async_get_raw(self, url: str, data=None, binary: bool = False, cache: bool = True):
+        if not cache: r = await self._async_get_response(url, data)
+        elif self._cache is not None: r = await self._async_get_cached_response(url, data)
+        else: r = await self._async_shared_get_response(url, data)
+        return r.content if binary else r.text
+
+    def _shared_get_response(self, url: str, data=None):
+        """ _get_response, sharing one in-flight request between identical concurrent calls.
+            Only the response is shared, every caller decodes its own objects.
+        """
+        if self._flight is None: return self._get_response(url, data)
+        return self._flight.do(ResponseCache.key(url, data), self._get_response, url, data)
+
+    async def _async_shared_get_response(self, url: str, data=None):
+        if self._async_flight is None: return await self._async_get_response(url, data)
+        return await self._async_flight.do(ResponseCache.key(url, data), self._async_get_response, url, data)
+
+    def _get_cached_response(self, url: str, data=None):
+        """ _get_response through the response cache, 404s are cached as well"""
+        key = self._cache.key(url, data)
+        hit = self._cache.get(key)
+        if self._metrics is not None: self._record_cache(url, hit)
+        if isinstance(hit, ApiError): raise hit.with_traceback(None)
+        if hit is not None: return hit
+        generation = self._cache.generation
+        try: r = self._shared_get_response(url, data)
+        except ApiError as e:
+            if e.status_code == 404: self._cache.put(key, e, negative = True, generation = generation)
+            raise
+        self._cache.put(key, r, generation = generation)
+        return r
+
+    async def _async_get_cached_response(self, url: str, data=None):
+        key = self._cache.key(url, data)
+        hit = self._cache.get(key)
+        if self._metrics is not None: self._record_cache(url, hit)
+        if isinstance(hit, ApiError): raise hit.with_traceback(None)
+        if hit is not None: return hit
+        generation = self._cache.generation
+        try: r = await self._async_shared_get_response(url, data)
+        except ApiError as e:
+            if e.status_code == 404: self._cache.put(key, e, negative = True, generation = generation)
+            raise
+        self._cache.put(key, r, generation = generation)
+        return r
+
+    def clear_cache(self):
+        """ Drops every cached GET response"""
+        if self._cache is not None: self._cache.clear()
     
+    #####  Metrics  #####
+    def _metric_labels(self, url: str) -> Tuple[str, str]:
+        """ Returns the (type, cluster) labels of url"""
+        match = ClusterPathRegex.match(urlsplit(url).path)
+        return self._url_types.resolve(url)[1] or 'unknown', match.group(0).rsplit('/', 1)[-1] if match else 'local'
+
+    def _record_request(self, method: str, url: str, start: float, response = None, data = None, received: int = None):
+        """ received is the size of a streamed body, otherwise the read body of response is measured"""
+        type_name, cluster = self._metric_labels(url)
+        status = str(response.status_code) if response is not None else 'error'
+        self._metrics.observe('kctl_request_duration_seconds', (method, type_name, cluster, status), time.perf_counter() - start)
+        if data: self._metrics.inc('kctl_request_bytes_total', (method, type_name, cluster), len(data.encode('utf-8') if isinstance(data, str) else data))
+        if response is not None: self._metrics.inc('kctl_response_bytes_total', (method, type_name, cluster), len(response.content) if received is None else received)
+
+    def _record_retry(self, method: str, url: str, attempt: int, delay: float, reason):
+        self._metrics.inc('kctl_retries_total', (method, *self._metric_labels(url), str(reason)))
+
+    def _record_cache(self, url: str, hit):
+        result = 'miss' if hit is None else ('negative_hit' if isinstance(hit, ApiError) else 'hit')
+        self._metrics.inc('kctl_cache_requests_total', (self._url_types.resolve(url)[1] or 'unknown', result))
+
+    def _record_coalesced(self, key: Tuple):
+        self._metrics.inc('kctl_cache_requests_total', (self._url_types.resolve(key[0])[1] or 'unknown', 'coalesced'))
+
     def _get_response(self, url: str, data=None):
-        r = self._client.get(url, params=data, headers=self._cfg.headers)
-        if r.status_code < 200 or r.status_code >= 300: self._error(r.text)
-        return r
+        return self._request(GET_METHOD, url, params=data)
     
     async def _async_get_response(self, url: str, data=None):
-        r = await self._client.async_get(url, params=data, headers=self._cfg.headers)
-        if r.status_code < 200 or r.status_code >= 300: self._error(r.text)
-        return r
+        return await self._async_request(GET_METHOD, url, params=data)
 
-    @timed_url
-    def _post(self, url: str, data=None):
-        r = self._client.post(url, data=self._marshall(data), headers=self._cfg.headers)
-        if r.status_code < 200 or r.status_code >= 300: self._error(r.text)
-        return self._unmarshall(r.text)
+    def _post(self, url: str, data=None, retry: bool = False, retries: int = None):
+        r = self._request(POST_METHOD, url, retry=retry, retries=retries, data=self._marshall(data))
+        return self._unmarshall(r.text, url=url)
     
-    @timed_url
-    async def _async_post(self, url: str, data=None):
-        r = await self._client.async_post(url, data=self._marshall(data), headers=self._cfg.headers)
-        if r.status_code < 200 or r.status_code >= 300: self._error(r.text)
-        return self._unmarshall(r.text)
-
-    @timed_url
-    def _put(self, url, data=None):
-        r = self._client.put(url, data=self._marshall(data), headers=self._cfg.headers)
-        if r.status_code < 200 or r.status_code >= 300: self._error(r.text)
-        return self._unmarshall(r.text)
+    async def _async_post(self, url: str, data=None, retry: bool = False, retries: int = None):
+        r = await self._async_request(POST_METHOD, url, retry=retry, retries=retries, data=self._marshall(data))
+        return self._unmarshall(r.text, url=url)
+
+    def _put(self, url, data=None, retries: int = None):
+        r = self._request(PUT_METHOD, url, retries=retries, data=self._marshall(data))
+        return self._unmarshall(r.text, url=url)
     
-    @timed_url
-    async def _async_put(self, url, data=None):
-        r = await self._client.async_put(url, data=self._marshall(data), headers=self._cfg.headers)
-        if r.status_code < 200 or r.status_code >= 300: self._error(r.text)
-        return self._unmarshall(r.text)
+    async def _async_put(self, url, data=None, retries: int = None):
+        r = await self._async_request(PUT_METHOD, url, retries=retries, data=self._marshall(data))
+        return self._unmarshall(r.text, url=url)
+
+    def _patch(self, url, data=None, patch_type: str = 'merge', retries: int = None):
+        """ PATCH of data as patch_type. Merge patches are idempotent, so they are retried like a PUT"""
+        r = self._request(PATCH_METHOD, url, retry=patch_type == 'merge', retries=retries, headers={'Content-Type': PatchContentTypes[patch_type]}, data=self._marshall(data))
+        return self._unmarshall(r.text, url=url)
+    
+    async def _async_patch(self, url, data=None, patch_type: str = 'merge', retries: int = None):
+        r = await self._async_request(PATCH_METHOD, url, retry=patch_type == 'merge', retries=retries, headers={'Content-Type': PatchContentTypes[patch_type]}, data=self._marshall(data))
+        return self._unmarshall(r.text, url=url)
 
-    @timed_url
     def _delete(self, url):
-        r = self._client.delete(url, headers=self._cfg.headers)
-        if r.status_code < 200 or r.status_code >= 300: self._error(r.text)
-        return self._unmarshall(r.text)
+        r = self._request(DELETE_METHOD, url)
+        return self._unmarshall(r.text, url=url)
     
-    @timed_url
     async def _async_delete(self, url):
-        r = await self._client.async_delete(url, headers=self._cfg.headers)
-        if r.status_code < 200 or r.status_code >= 300: self._error(r.text)
-        return self._unmarshall(r.text)
+        r = await self._async_request(DELETE_METHOD, url)
+        return self._unmarshall(r.text, url=url)
     
-    def _unmarshall(self, text):
-        if text is None or text == '': return text
-        return json.loads(text, object_hook=self.object_hook, object_pairs_hook=self.object_pairs_hook)
+    def _unmarshall(self, text, mode: str = None, url: str = None):
+        """ Decodes a response body with the client codec.
+            mode:
+                - object (default): RestObjects, lazy if enabled
+                - dict: plain decoded json
+                - bytes: the body as is
+            url: the request url, labels the decode time metrics
+        """
+        if not text or mode == 'bytes': return text
+        if self._metrics is None or url is None: return self._decode(self._codec.loads(text), mode=mode)
+        start = time.perf_counter()
+        try: return self._decode(self._codec.loads(text), mode=mode)
+        finally: self._metrics.observe('kctl_decode_duration_seconds', (self._url_types.resolve(url)[1] or 'unknown', mode or 'object'), time.perf_counter() - start)
+
+    def _decode(self, data, mode: str = None):
+        """ Converts already decoded json into the requested response mode"""
+        if mode == 'dict': return data
+        if mode == 'bytes': return self._codec.dumps(data).encode('utf-8')
+        if self._cfg.lazy_decode: return LazyRestObject.wrap(data, self)
+        return self.object_hook(data)
 
     def _marshall(self, obj, indent=None, sort_keys=True):
         if obj is None: return None
-        return json.dumps(self._to_dict(obj), indent=indent, sort_keys=sort_keys)
+        return self._codec.dumps(self._to_dict(obj), indent=indent, sort_keys=sort_keys)
 
     def _load_schemas(self, force=False):
-        if self.schema and not force: return
-        schema_text = self._get_cached_schema()
-        if force or not schema_text:
-            response = self._get_response(self.url)
-            schema_url = response.headers.get('X-API-Schemas')
-            if schema_url is not None and self.url != schema_url: schema_text = self._get_raw(schema_url)
-            else: schema_text = response.text
-            self._cache_schema(schema_text)
-
-        obj = self._unmarshall(schema_text)
-        schema = Schema(schema_text, obj)
-
-        if len(schema.types) > 0:
-            self._bind_methods(schema)
-            self.schema = schema    
+        """ Loads the compact schema index, from the cache when fresh. The full
+            RestObject schema types are only decoded when schema.types is accessed.
+            A stale cached schema is served right away and revalidated in the background.
+        """
+        if self._schema and not force: return
+        schema, stale = (None, False) if force else self._get_cached_schema_obj()
+        if schema is None:
+            # one process fetches, the others wait for the lock and read what it cached
+            with self._schema_file_lock():
+                schema, stale = (None, False) if force else self._get_cached_schema_obj()
+                if schema is None: schema = self._compile_schema(*self._fetch_schema())
+        self._set_schema(schema)
+        if stale: self._schedule_revalidate()
+
+    async def _async_load_schemas(self, force=False):
+        if self._schema and not force: return
+        schema, stale = (None, False) if force else self._get_cached_schema_obj()
+        if schema is None:
+            async with self._schema_file_lock():
+                schema, stale = (None, False) if force else self._get_cached_schema_obj()
+                if schema is None: schema = self._compile_schema(*(await self._async_fetch_schema()))
+        self._set_schema(schema)
+        if stale: self._schedule_revalidate()
+
+    def _fetch_schema(self):
+        """ Returns (text, url, etag) of the schema collection"""
+        response = self._get_response(self.url)
+        schema_url = response.headers.get('X-API-Schemas')
+        if schema_url is not None and self.url != schema_url: response = self._get_response(schema_url)
+        else: schema_url = self.url
+        return response.text, schema_url, response.headers.get('ETag')
+
+    async def _async_fetch_schema(self):
+        response = await self._async_get_response(self.url)
+        schema_url = response.headers.get('X-API-Schemas')
+        if schema_url is not None and self.url != schema_url: response = await self._async_get_response(schema_url)
+        else: schema_url = self.url
+        return response.text, schema_url, response.headers.get('ETag')
+
+    @property
+    def _schema_base(self) -> str:
+        return get_schema_base(self.url)
+
+    def _get_cached_schema_obj(self) -> Tuple[Optional[Schema], bool]:
+        """ Returns (schema, stale) from the cache. Nothing is returned past cache_stale_time.
+            The schema is shared with every client whose cluster serves the same content
+        """
+        name = self._get_cached_schema_name('meta.json')
+        if not self._cfg.cache.is_fresh(name, max(self._cfg.cache_time, self._cfg.cache_stale_time)): return None, False
+        fingerprint = self._read_cached_schema_meta().get('fingerprint')
+        schema = schema_store.get(self._cfg.cache, fingerprint, self._codec) if fingerprint else None
+        if schema is None: return None, False
+        return schema.bind(self._schema_base, self._unmarshall), not self._cfg.cache.is_fresh(name, self._cfg.cache_time)
+
+    def _compile_schema(self, schema_text: str, url: str = None, etag: str = None) -> Schema:
+        """ Stores the schema by content, it is only compiled if no other cluster served it before"""
+        base = self._schema_base
+        schema = schema_store.put(self._cfg.cache, normalize_schema(schema_text, base), self._codec)
+        self._cache_schema_meta({'url': url or self.url, 'etag': etag, 'fingerprint': schema.fingerprint})
+        schema_store.prune(self._cfg.cache, self._codec)
+        return schema.bind(base, self._unmarshall)
+
+    def _set_schema(self, schema: Schema):
+        self._schema_loaded = True
+        self._schema_expires = self._schema_deadline()
+        if len(schema.index) > 0: self._bind_methods(schema)
+
+    def _schema_deadline(self) -> float:
+        """ When the schema in memory is next revalidated, following the age of the shared cache"""
+        age = self._cfg.cache.age(self._get_cached_schema_name('meta.json')) or 0.0
+        return time.monotonic() + max(self._cfg.cache_time - age, 1.0)
+
+    #############################################################################
+    #                           Schema Revalidation                             #
+    #############################################################################
+
+    def _schema_fingerprint(self, text: str) -> str:
+        return schema_store.fingerprint(normalize_schema(text, self._schema_base))
+
+    def _schedule_revalidate(self):
+        """ Revalidates the schema in the background, as a task on the running loop or in a daemon thread"""
+        with self._schema_lock:
+            if self._revalidating or (self._revalidate_task is not None and not self._revalidate_task.done()): return
+            self._revalidating = True
+            self._schema_expires = time.monotonic() + self._cfg.cache_time
+        try: loop = asyncio.get_running_loop()
+        except RuntimeError: loop = None
+        if loop is not None: self._revalidate_task = loop.create_task(self._async_revalidate_schema())
+        else: threading.Thread(target = self._revalidate_schema, name = 'kctl-schema-revalidate', daemon = True).start()
+
+    def _revalidate_headers(self, meta: Dict):
+        headers = dict(self._cfg.headers)
+        if meta.get('etag'): headers['If-None-Match'] = meta['etag']
+        return headers
+
+    def _sync_from_cache(self) -> bool:
+        """ Adopts a fresh schema another process cached. Returns whether one was found"""
+        schema, stale = self._get_cached_schema_obj()
+        if schema is None or stale: return False
+        if schema.fingerprint != getattr(self._schema, 'fingerprint', None): self._set_schema(schema)
+        else: self._schema_expires = self._schema_deadline()
+        return True
+
+    def _apply_revalidation(self, response, url: str, meta: Dict) -> bool:
+        """ Swaps in the new schema only if it changed. Returns whether it did"""
+        current = getattr(self._schema, 'fingerprint', None)
+        if response.status_code == 304:
+            self._touch_cached_schema()
+            # the cached copy is current, but may be newer than the one in memory
+            return meta.get('fingerprint') != current and self._sync_from_cache()
+        if response.status_code < 200 or response.status_code >= 300: self._error(response.text, response)
+        etag = response.headers.get('ETag')
+        if self._schema is not None and self._schema_fingerprint(response.text) == current:
+            self._cache_schema_meta(dict(meta, etag = etag))
+            self._touch_cached_schema()
+            return False
+        logger.info(f'Schema for {self.url} changed, rebinding methods')
+        self._set_schema(self._compile_schema(response.text, url = url, etag = etag))
+        return True
+
+    def _revalidate_busy(self) -> bool:
+        """ Another process holds the refresh lock, its result is read from the cache on the next check"""
+        self._schema_expires = time.monotonic() + 1.0
+        return False
+
+    def _revalidate_schema(self) -> bool:
+        """ Conditionally refetches the schema (If-None-Match when an ETag is known),
+            unless another process refreshed the shared cache in the meantime.
+        """
+        lock = self._schema_file_lock()
+        try:
+            if self._sync_from_cache(): return False
+            if not lock.acquire(blocking = False): return self._revalidate_busy()
+            if self._sync_from_cache(): return False
+            meta = self._read_cached_schema_meta()
+            url = meta.get('url') or self.url
+            response = self._retry.call(GET_METHOD, self._client.get, url, headers = self._revalidate_headers(meta))
+            return self._apply_revalidation(response, url, meta)
+        except Exception as e:
+            logger.warning(f'Schema revalidation for {self.url} failed: {e}')
+            return False
+        finally:
+            lock.release()
+            self._revalidating = False
+
+    async def _async_revalidate_schema(self) -> bool:
+        lock = self._schema_file_lock()
+        try:
+            if self._sync_from_cache(): return False
+            if not lock.acquire(blocking = False): return self._revalidate_busy()
+            if self._sync_from_cache(): return False
+            meta = self._read_cached_schema_meta()
+            url = meta.get('url') or self.url
+            response = await self._retry.async_call(GET_METHOD, self._client.async_get, url, headers = self._revalidate_headers(meta))
+            return self._apply_revalidation(response, url, meta)
+        except Exception as e:
+            logger.warning(f'Schema revalidation for {self.url} failed: {e}')
+            return False
+        finally:
+            lock.release()
+            self._revalidating = False
 
     #############################################################################
     #                             Base Methods                                  #
     #############################################################################
 
     def by_id(self, type, id, **kw):
+        mode = kw.pop('response_mode', None) or self._cfg.response_mode
         id = str(id)
+        cache = kw.get('from_cache', True)
+        informer = self._cached_informer(type, kw)
+        if informer: return informer.get(id, mode=mode)
         type_name = convert_type_name(type)
-        url = self.schema.types[type_name].links.collection
+        url = self._collection_url(type_name)
         if url.endswith('/'): url += id
         else: url = '/'.join([url, id])
-        try: return self._get(url, self._to_dict(**kw))
+        try: return self._get(url, self._to_dict(**kw), mode=mode, cache=cache)
         except ApiError as e:
-            if e.error.status == 404: return None
+            if e.status_code == 404: return None
             else: raise e
     
     def update_by_id(self, type, id, *args, **kw):
         type_name = convert_type_name(type)
-        url = self.schema.types[type_name].links.collection
+        url = self._collection_url(type_name)
         url = url + id if url.endswith('/') else '/'.join([url, id])
         return self._put_and_retry(url, *args, **kw)
 
@@ -190,52 +595,160 @@ class KctlBaseClient:
         return self._put_and_retry(url, *args, **kw)
     
     def update_data(self, obj, *args, **kw):
+        """ Saves obj. Where its type allows PATCH, only the changes of obj (see RestObject.changes) and
+            args / kw are sent as kw patch_type, defaulting to the patch_type config. Otherwise obj is PUT whole.
+            Returns obj itself, without a request, when nothing changed.
+        """
         url = obj.links.self
-        return self._put_and_retry(url, obj, *args, **kw)
+        patch_type = self._get_patch_type(obj, kw.pop('patch_type', None))
+        if patch_type is None: return self._put_and_retry(url, obj, *args, **kw)
+        retries = kw.pop('retries', None)
+        body = self._patch_body(obj, patch_type, *args, **kw)
+        if not body: return obj
+        result = self._patch(url, data=body, patch_type=patch_type, retries=retries)
+        obj.reset_changes()
+        return result
+
+    def _get_patch_type(self, obj, patch_type: str = None) -> Optional[str]:
+        """ Returns the patch type to update obj with, None if it should be PUT"""
+        patch_type = self._cfg.patch_type if patch_type is None else patch_type
+        if not patch_type or patch_type == 'none' or not isinstance(obj, RestObject): return None
+        if patch_type not in PatchContentTypes: raise ClientApiError(f'{patch_type} is not a valid patch_type: {", ".join(PatchContentTypes)}')
+        type_name = getattr(obj, 'type', None)
+        entry = self.schema.index.get(convert_type_name(type_name)) if isinstance(type_name, str) else None
+        return patch_type if entry and PATCH_METHOD in entry['resourceMethods'] else None
+
+    def _patch_body(self, obj, patch_type: str, *args, **kw):
+        """ The changes of obj plus the fields of args / kw, as a merge patch dict or json patch operations"""
+        fields = self._to_dict(*args, **kw)
+        if patch_type != 'json': return {**obj.changes(), **fields}
+        return obj.json_patch() + [{'op': 'add', 'path': '/' + k.replace('~', '~0').replace('/', '~1'), 'value': v} for k, v in fields.items()]
 
     def _put_and_retry(self, url, *args, **kw):
-        retries = kw.get('retries', 3)
-        for i in range(retries):
-            try: return self._put(url, data=self._to_dict(*args, **kw))
-            except ApiError as e:
-                if i == retries-1: raise e
-                if e.error.status == 409: time.sleep(.1)
-                else: raise e
+        retries = kw.pop('retries', None)
+        return self._put(url, data=self._to_dict(*args, **kw), retries=retries)
     
     def _post_and_retry(self, url, *args, **kw):
-        retries = kw.get('retries', 3)
-        for i in range(retries):
-            try: return self._post(url, data=self._to_dict(*args, **kw))
-            except ApiError as e:
-                if i == retries-1: raise e
-                if e.error.status == 409: time.sleep(.1)
-                else: raise e
+        retries = kw.pop('retries', None)
+        return self._post(url, data=self._to_dict(*args, **kw), retry=True, retries=retries)
     
     def _validate_list(self, type, **kw):
         if not self._cfg.strict: return
-        type_name = convert_type_name(type)
-        collection_filters = self.schema.types[type_name].collectionFilters
+        filters = self.schema.filters(convert_type_name(type))
         for k in kw:
-            if hasattr(collection_filters, k): return
-            for filter_name, filter_value in collection_filters.items():
-                for m in filter_value.modifiers:
-                    if k == '_'.join([filter_name, m]): return
-            raise ClientApiError(k + ' is not searchable field')
+            if k not in filters and k not in ReservedParams: raise ClientApiError(k + ' is not searchable field')
 
-    def list(self, type, **kw):
+    def _list_url(self, type, **kw):
         type_name = convert_type_name(type)
-        if type_name not in self.schema.types: raise ClientApiError(type_name + ' is not a valid type')
+        if type_name not in self.schema.index: raise ClientApiError(type_name + ' is not a valid type')
         self._validate_list(type_name, **kw)
-        collection_url = self.schema.types[type_name].links.collection
-        collection_url = self._cfg.validate_fleet_url(collection_url)
-        return self._get(collection_url, data=self._to_dict(**kw))
+        collection_url = self._collection_url(type_name)
+        return self._cfg.validate_fleet_url(collection_url)
+
+    def _query_params(self, kw: Dict) -> List[str]:
+        """ Compiles the `query` of list / iter into kw. Returns the fields to project the items to"""
+        query: Query = kw.pop('query', None)
+        if query is None: return []
+        kw.update(query.compile(self._cfg.api_version))
+        return query.selected
+
+    @staticmethod
+    def _project_page(page: Dict, fields: List[str]) -> Dict:
+        if not fields or not isinstance(page, dict): return page
+        return {**page, 'data': [project(item, fields) for item in page.get('data') or []]}
+
+    def list(self, type, **kw):
+        """ args:
+                - query: Query compiled into server-side params, ie. Query().labels(app = 'web').limit(100)
+        """
+        mode = kw.pop('response_mode', None) or self._cfg.response_mode
+        fields = self._query_params(kw)
+        cache = kw.get('from_cache', True)
+        informer = self._cached_informer(type, kw)
+        if informer: return informer.collection(mode=mode)
+        collection_url = self._list_url(type, **kw)
+        if not fields or mode == 'bytes': return self._get(collection_url, data=self._to_dict(**kw), mode=mode, cache=cache)
+        page = self._get(collection_url, data=self._to_dict(**kw), mode='dict', cache=cache)
+        return self._decode(self._project_page(page, fields), mode=mode)
+
+    def _iter_params(self, type, page_size: int = None, **kw):
+        """ Returns the first page url, query params, item mode and projected fields for iter / async_iter"""
+        mode = kw.pop('response_mode', None) or self._cfg.response_mode
+        if mode == 'bytes': raise ClientApiError('bytes response_mode is not supported when iterating')
+        fields = self._query_params(kw)
+        collection_url = self._list_url(type, **kw)
+        data = self._to_dict(**kw)
+        if page_size: data['limit'] = page_size
+        return collection_url, data, mode, fields
+
+    @staticmethod
+    def _next_page_url(page: Dict):
+        return (page.get('pagination') or {}).get('next')
+
+    def _page_items(self, page: Dict, mode: str, fields: List[str] = None):
+        for item in page.get('data') or []: yield self._decode(project(item, fields) if fields else item, mode=mode)
+
+    def iter(self, type, page_size: int = None, **kw):
+        """ Yields every item of `type`, following pagination.next until the last page.
+            Only a single page is held in memory at a time.
+            args:
+                - page_size: sent as the `limit` query param
+                - query: Query compiled into server-side params
+        """
+        url, data, mode, fields = self._iter_params(type, page_size = page_size, **kw)
+        while url:
+            page = self._get(url, data=data, mode='dict', cache=False)
+            # the next url already carries the query params
+            url, data = self._next_page_url(page), None
+            yield from self._page_items(page, mode, fields)
     
+    def stream(self, type, page_size: int = None, **kw):
+        """ Like iter, but the items of each page are decoded one by one as the body is received,
+            so neither the body nor the page are ever held in memory as a whole.
+            args:
+                - page_size: sent as the `limit` query param, unlimited pages are fine
+                - query: Query compiled into server-side params
+                - response_mode: object (default) or dict
+        """
+        url, data, mode, fields = self._iter_params(type, page_size = page_size, **kw)
+        while url:
+            rest = yield from self._stream_page(url, data, mode, fields)
+            url, data = self._next_page_url(rest), None
+
+    def _open_stream(self, url: str, data=None):
+        """ Sends a GET through the retry policy and returns the response with its body unread"""
+        client = self._client.client
+        def send(url, **kwargs):
+            r = client.send(client.build_request(GET_METHOD, url, **kwargs), stream = True)
+            # error bodies are small, reading them releases the connection before a retry
+            if r.status_code < 200 or r.status_code >= 300:
+                r.read()
+                r.close()
+            return r
+        r = self._retry.call(GET_METHOD, send, url, headers = self._cfg.headers, params = data)
+        if r.status_code < 200 or r.status_code >= 300: self._error(r.text, r)
+        return r
+
+    def _stream_page(self, url: str, data, mode: str, fields: List[str] = None):
+        """ Yields the decoded items of the collection at url, returns the rest of the collection"""
+        start, received, parser = time.perf_counter(), 0, CollectionParser()
+        r = self._open_stream(url, data)
+        try:
+            for chunk in r.iter_bytes():
+                received += len(chunk)
+                for item in parser.feed(chunk): yield self._decode(project(item, fields) if fields else item, mode=mode)
+            for item in parser.feed(b'', final = True): yield self._decode(project(item, fields) if fields else item, mode=mode)
+        finally:
+            r.close()
+            if self._metrics is not None: self._record_request(GET_METHOD, url, start, r, received = received)
+        return parser.close()
+
     def reload(self, obj):
-        return self.by_id(obj.type, obj.id)
+        return self.by_id(obj.type, obj.id, response_mode='object', from_cache=False)
 
     def create(self, type, *args, **kw):
         type_name = convert_type_name(type)
-        collection_url = self.schema.types[type_name].links.collection
+        collection_url = self._collection_url(type_name)
         collection_url = self._cfg.validate_fleet_url(collection_url)
         return self._post(collection_url, data=self._to_dict(*args, **kw))
 
@@ -247,25 +760,189 @@ class KctlBaseClient:
         url = getattr(obj.actions, action_name)
         return self._post_and_retry(url, *args, **kw)
     
+    #############################################################################
+    #                             Bulk Operations                               #
+    #############################################################################
+
+    def _bulk(self, func: Callable, items: Iterable, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None) -> List[BulkResult]:
+        """ Calls func(item) for every item from a bounded thread pool. Returns a BulkResult per item, in order.
+            args:
+                - concurrency: max requests in flight
+                - stop_on_error: items not yet started after a failure are skipped
+                - progress: called with (done, total, result) as each item finishes
+        """
+        items = list(items)
+        if not items: return []
+        results: List[BulkResult] = [None] * len(items)
+        stop = threading.Event()
+
+        def run(index, item):
+            if stop.is_set(): return BulkResult(index, item, skipped = True)
+            start = time.time()
+            try: return BulkResult(index, item, result = func(item), elapsed = time.time() - start)
+            except Exception as e:
+                if stop_on_error: stop.set()
+                return BulkResult(index, item, error = e, elapsed = time.time() - start)
+
+        with ThreadPoolExecutor(max_workers = max(min(concurrency, len(items)), 1)) as pool:
+            # each item runs in a copy of the caller's context, so cluster_scope applies
+            futures = [pool.submit(contextvars.copy_context().run, run, index, item) for index, item in enumerate(items)]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results[result.index] = result
+                if progress: progress(done, len(items), result)
+        return results
+
+    async def _async_bulk(self, func: Callable, items: Iterable, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None) -> List[BulkResult]:
+        """ Async version of _bulk, func(item) should return an awaitable"""
+        items = list(items)
+        if not items: return []
+        results: List[BulkResult] = [None] * len(items)
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        stop = asyncio.Event()
+
+        async def run(index, item):
+            async with semaphore:
+                if stop.is_set(): return BulkResult(index, item, skipped = True)
+                start = time.time()
+                try: return BulkResult(index, item, result = await func(item), elapsed = time.time() - start)
+                except Exception as e:
+                    if stop_on_error: stop.set()
+                    return BulkResult(index, item, error = e, elapsed = time.time() - start)
+
+        tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+        try:
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                result = await task
+                results[result.index] = result
+                if progress: progress(done, len(items), result)
+        finally:
+            for task in tasks:
+                if not task.done(): task.cancel()
+        return results
+
+    @staticmethod
+    def _self_link(obj) -> Optional[str]:
+        """ The self link of an object or of its dict (response_mode='dict')"""
+        links = obj.get('links') if isinstance(obj, dict) else getattr(obj, 'links', None)
+        return links.get('self') if isinstance(links, dict) else getattr(links, 'self', None)
+
+    def _delete_item(self, item):
+        """ delete_many items are objects or their dicts, deleted through their self link"""
+        url = self._self_link(item)
+        if not url: raise ClientApiError(f'{type(item).__name__} item has no self link to delete')
+        return self._delete(url)
+
+    async def _async_delete_item(self, item):
+        url = self._self_link(item)
+        if not url: raise ClientApiError(f'{type(item).__name__} item has no self link to delete')
+        return await self._async_delete(url)
+
+    def _update_item(self, item):
+        """ update_many items are either objects, saved with update_data, or (obj, changes) pairs"""
+        if isinstance(item, tuple): return self.update(item[0], item[1])
+        return self.update_data(item)
+
+    async def _async_update_item(self, item):
+        if isinstance(item, tuple): return await self.async_update(item[0], item[1])
+        return await self.async_update_data(item)
+
+    def create_many(self, type, items: Iterable, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None) -> List[BulkResult]:
+        """ Creates an object of `type` from each item (dict or RestObject)"""
+        return self._bulk(partial(self.create, type), items, concurrency = concurrency, stop_on_error = stop_on_error, progress = progress)
+
+    def update_many(self, items: Iterable, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None) -> List[BulkResult]:
+        """ Updates each item, either an object saved with update_data or an (obj, changes) pair"""
+        return self._bulk(self._update_item, items, concurrency = concurrency, stop_on_error = stop_on_error, progress = progress)
+
+    def delete_many(self, items: Iterable, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None) -> List[BulkResult]:
+        return self._bulk(self._delete_item, items, concurrency = concurrency, stop_on_error = stop_on_error, progress = progress)
+
+    def action_many(self, items: Iterable, action_name: str, *args, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None, **kw) -> List[BulkResult]:
+        """ Runs action_name on each object, with the same args"""
+        return self._bulk(lambda obj: self.action(obj, action_name, *args, **kw), items, concurrency = concurrency, stop_on_error = stop_on_error, progress = progress)
+
+    async def async_create_many(self, type, items: Iterable, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None) -> List[BulkResult]:
+        return await self._async_bulk(partial(self.async_create, type), items, concurrency = concurrency, stop_on_error = stop_on_error, progress = progress)
+
+    async def async_update_many(self, items: Iterable, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None) -> List[BulkResult]:
+        return await self._async_bulk(self._async_update_item, items, concurrency = concurrency, stop_on_error = stop_on_error, progress = progress)
+
+    async def async_delete_many(self, items: Iterable, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None) -> List[BulkResult]:
+        return await self._async_bulk(self._async_delete_item, items, concurrency = concurrency, stop_on_error = stop_on_error, progress = progress)
+
+    async def async_action_many(self, items: Iterable, action_name: str, *args, concurrency: int = 10, stop_on_error: bool = False, progress: Callable = None, **kw) -> List[BulkResult]:
+        return await self._async_bulk(lambda obj: self.async_action(obj, action_name, *args, **kw), items, concurrency = concurrency, stop_on_error = stop_on_error, progress = progress)
+
+    #############################################################################
+    #                               Informers                                   #
+    #############################################################################
+
+    def _informer_key(self, type):
+        """ Informers are kept per type and cluster scope"""
+        cluster_name = self._cluster_var.get()
+        type_name = convert_type_name(type)
+        return f'{cluster_name}:{type_name}' if cluster_name else type_name
+
+    def _informer_client(self):
+        """ The informer runs in its own thread / task, outside of the caller's cluster_scope"""
+        cluster_name = self._cluster_var.get()
+        return self.cluster(cluster_name) if cluster_name else self
+
+    def _cached_informer(self, type, kw: Dict) -> Optional[Informer]:
+        """ Returns the synced informer of `type` if the call can be answered from its store.
+            Pops from_cache from kw, calls with any other query params always go to the server.
+        """
+        from_cache = kw.pop('from_cache', True)
+        if not from_cache or kw or not self._informers: return None
+        informer = self._informers.get(self._informer_key(type))
+        if informer is not None and informer.has_synced: return informer
+        return None
+
+    def informer(self, type, start: bool = True, wait: bool = True, **kw) -> Informer:
+        """ Returns the informer of `type`, creating and starting it in a background thread if needed.
+            While it is synced, list / by_id of the type without query params read from its store.
+            kw are passed to Informer, ie. watch, poll_interval or list query params.
+        """
+        key = self._informer_key(type)
+        if key not in self._informers: self._informers[key] = Informer(self._informer_client(), type, **kw)
+        informer = self._informers[key]
+        if start: informer.start(wait=wait)
+        return informer
+
+    async def async_informer(self, type, start: bool = True, wait: bool = True, **kw) -> Informer:
+        """ Same as informer, running as a task on the current event loop"""
+        key = self._informer_key(type)
+        if key not in self._informers: self._informers[key] = Informer(self._informer_client(), type, **kw)
+        informer = self._informers[key]
+        if start: await informer.async_start(wait=wait)
+        return informer
+
     #############################################################################
     #                             Async Methods                                 #
     #############################################################################
 
     async def async_by_id(self, type, id, **kw):
+        await self._async_ensure_schema()
+        mode = kw.pop('response_mode', None) or self._cfg.response_mode
         id = str(id)
+        cache = kw.get('from_cache', True)
+        informer = self._cached_informer(type, kw)
+        if informer: return informer.get(id, mode=mode)
         type_name = convert_type_name(type)
-        url = self.schema.types[type_name].links.collection
+        url = self._collection_url(type_name)
 
         if url.endswith('/'): url += id
         else: url = '/'.join([url, id])
-        try: return await self._async_get(url, self._to_dict(**kw))
+        try: return await self._async_get(url, self._to_dict(**kw), mode=mode, cache=cache)
         except ApiError as e:
-            if e.error.status == 404: return None
+            if e.status_code == 404: return None
             else: raise e
     
     async def async_update_by_id(self, type, id, *args, **kw):
+        await self._async_ensure_schema()
         type_name = convert_type_name(type)
-        url = self.schema.types[type_name].links.collection
+        url = self._collection_url(type_name)
         url = url + id if url.endswith('/') else '/'.join([url, id])
         return await self._async_put_and_retry(url, *args, **kw)
 
@@ -274,41 +951,95 @@ class KctlBaseClient:
         return await self._async_put_and_retry(url, *args, **kw)
     
     async def async_update_data(self, obj, *args, **kw):
+        await self._async_ensure_schema()
         url = obj.links.self
-        return await self._async_put_and_retry(url, obj, *args, **kw)
+        patch_type = self._get_patch_type(obj, kw.pop('patch_type', None))
+        if patch_type is None: return await self._async_put_and_retry(url, obj, *args, **kw)
+        retries = kw.pop('retries', None)
+        body = self._patch_body(obj, patch_type, *args, **kw)
+        if not body: return obj
+        result = await self._async_patch(url, data=body, patch_type=patch_type, retries=retries)
+        obj.reset_changes()
+        return result
     
     async def _async_put_and_retry(self, url, *args, **kw):
-        retries = kw.get('retries', 3)
-        for i in range(retries):
-            try: return await self._async_put(url, data=self._to_dict(*args, **kw))
-            except ApiError as e:
-                if i == retries-1: raise e
-                if e.error.status == 409: time.sleep(.1)
-                else: raise e
+        retries = kw.pop('retries', None)
+        return await self._async_put(url, data=self._to_dict(*args, **kw), retries=retries)
     
     async def _async_post_and_retry(self, url, *args, **kw):
-        retries = kw.get('retries', 3)
-        for i in range(retries):
-            try: return await self._async_post(url, data=self._to_dict(*args, **kw))
-            except ApiError as e:
-                if i == retries-1: raise e
-                if e.error.status == 409: time.sleep(.1)
-                else: raise e
+        retries = kw.pop('retries', None)
+        return await self._async_post(url, data=self._to_dict(*args, **kw), retry=True, retries=retries)
 
     async def async_list(self, type, **kw):
-        type_name = convert_type_name(type)
-        if type_name not in self.schema.types: raise ClientApiError(type_name + ' is not a valid type')
-        self._validate_list(type_name, **kw)
-        collection_url = self.schema.types[type_name].links.collection
-        collection_url = self._cfg.validate_fleet_url(collection_url)
-        return await self._async_get(collection_url, data=self._to_dict(**kw))
+        await self._async_ensure_schema()
+        mode = kw.pop('response_mode', None) or self._cfg.response_mode
+        fields = self._query_params(kw)
+        cache = kw.get('from_cache', True)
+        informer = self._cached_informer(type, kw)
+        if informer: return informer.collection(mode=mode)
+        collection_url = self._list_url(type, **kw)
+        if not fields or mode == 'bytes': return await self._async_get(collection_url, data=self._to_dict(**kw), mode=mode, cache=cache)
+        page = await self._async_get(collection_url, data=self._to_dict(**kw), mode='dict', cache=cache)
+        return self._decode(self._project_page(page, fields), mode=mode)
+
+    async def async_iter(self, type, page_size: int = None, **kw):
+        """ Async version of iter. The next page is fetched in the background
+            while the items of the current page are being consumed.
+        """
+        await self._async_ensure_schema()
+        url, data, mode, fields = self._iter_params(type, page_size = page_size, **kw)
+        task = asyncio.ensure_future(self._async_get(url, data=data, mode='dict', cache=False))
+        try:
+            while task is not None:
+                page = await task
+                url = self._next_page_url(page)
+                task = asyncio.ensure_future(self._async_get(url, mode='dict', cache=False)) if url else None
+                for item in self._page_items(page, mode, fields): yield item
+        finally:
+            if task is not None and not task.done(): task.cancel()
     
+    async def async_stream(self, type, page_size: int = None, **kw):
+        """ Async version of stream"""
+        await self._async_ensure_schema()
+        url, data, mode, fields = self._iter_params(type, page_size = page_size, **kw)
+        while url:
+            rest = {}
+            async for item in self._async_stream_page(url, data, mode, fields, rest): yield item
+            url, data = self._next_page_url(rest), None
+
+    async def _async_open_stream(self, url: str, data=None):
+        client = self._client.aclient
+        async def send(url, **kwargs):
+            r = await client.send(client.build_request(GET_METHOD, url, **kwargs), stream = True)
+            if r.status_code < 200 or r.status_code >= 300:
+                await r.aread()
+                await r.aclose()
+            return r
+        r = await self._retry.async_call(GET_METHOD, send, url, headers = self._cfg.headers, params = data)
+        if r.status_code < 200 or r.status_code >= 300: self._error(r.text, r)
+        return r
+
+    async def _async_stream_page(self, url: str, data, mode: str, fields: List[str], rest: Dict):
+        """ Async generators cannot return a value, the rest of the collection is set into rest"""
+        start, received, parser = time.perf_counter(), 0, CollectionParser()
+        r = await self._async_open_stream(url, data)
+        try:
+            async for chunk in r.aiter_bytes():
+                received += len(chunk)
+                for item in parser.feed(chunk): yield self._decode(project(item, fields) if fields else item, mode=mode)
+            for item in parser.feed(b'', final = True): yield self._decode(project(item, fields) if fields else item, mode=mode)
+        finally:
+            await r.aclose()
+            if self._metrics is not None: self._record_request(GET_METHOD, url, start, r, received = received)
+        rest.update(parser.close())
+
     async def async_reload(self, obj):
-        return await self.async_by_id(obj.type, obj.id)
+        return await self.async_by_id(obj.type, obj.id, response_mode='object', from_cache=False)
 
     async def async_create(self, type, *args, **kw):
+        await self._async_ensure_schema()
         type_name = convert_type_name(type)
-        collection_url = self.schema.types[type_name].links.collection
+        collection_url = self._collection_url(type_name)
         collection_url = self._cfg.validate_fleet_url(collection_url)
         return await self._async_post(collection_url, data=self._to_dict(*args, **kw))
 
@@ -326,7 +1057,7 @@ class KctlBaseClient:
     
     def _is_list(self, obj):
         if isinstance(obj, list): return True
-        if isinstance(obj, RestObject) and 'type' in obj.__dict__ and obj.type == 'collection': return True
+        if isinstance(obj, RestObject) and getattr(obj, 'type', None) == 'collection': return True
         return False
 
     def _to_value(self, value):
@@ -340,11 +1071,10 @@ class KctlBaseClient:
 
         if isinstance(value, RestObject):
             ret = {}
-            for k, v in vars(value).items():
-                if not isinstance(v, RestObject) and not callable(v):
-                    if not k.startswith('_'): ret[k] = self._to_value(v)
-                elif isinstance(v, RestObject):
-                    if not k.startswith('_'): ret[k] = self._to_dict(v)
+            for k, v in value.data_dict().items():
+                if k.startswith('_'): continue
+                if isinstance(v, RestObject): ret[k] = self._to_dict(v)
+                else: ret[k] = self._to_value(v)
             return ret
 
         return value
@@ -373,46 +1103,105 @@ class KctlBaseClient:
         if python_name != name: ret.append(python_name.lower())
         return ret
 
+    # Per type methods resolved by __getattr__, ie. list_pod -> list('pod')
+    # method prefix: (schema methods field, required http method)
+    _method_bindings = {
+        'list': ('collectionMethods', GET_METHOD),
+        'by_id': ('collectionMethods', GET_METHOD),
+        'create': ('collectionMethods', POST_METHOD),
+        'create_many': ('collectionMethods', POST_METHOD),
+        'update_by_id': ('resourceMethods', PUT_METHOD),
+        'iter': ('collectionMethods', GET_METHOD),
+        'stream': ('collectionMethods', GET_METHOD),
+        'async_list': ('collectionMethods', GET_METHOD),
+        'async_by_id': ('collectionMethods', GET_METHOD),
+        'async_create': ('collectionMethods', POST_METHOD),
+        'async_create_many': ('collectionMethods', POST_METHOD),
+        'async_update_by_id': ('resourceMethods', PUT_METHOD),
+        'async_iter': ('collectionMethods', GET_METHOD),
+        'async_stream': ('collectionMethods', GET_METHOD),
+    }
+    # longest first so update_by_id_x is not read as by_id of 'x'
+    _method_prefixes = sorted(_method_bindings, key = len, reverse = True)
+
     def _bind_methods(self, schema):
-        bindings = [
-            ('list', 'collectionMethods', GET_METHOD, self.list),
-            ('by_id', 'collectionMethods', GET_METHOD, self.by_id),
-            ('create', 'collectionMethods', POST_METHOD, self.create),
-            #('update', 'resourceMethods', PUT_METHOD, self.update),
-            ('update_by_id', 'resourceMethods', PUT_METHOD, self.update_by_id),
-            #('update_data', 'resourceMethods', PUT_METHOD, self.update),
-        ]
-        async_bindings = [
-            ('async_list', 'collectionMethods', GET_METHOD, self.async_list),
-            ('async_by_id', 'collectionMethods', GET_METHOD, self.async_by_id),
-            ('async_create', 'collectionMethods', POST_METHOD, self.async_create),
-            #('async_update', 'resourceMethods', PUT_METHOD, self.async_update),
-            ('async_update_by_id', 'resourceMethods', PUT_METHOD, self.async_update_by_id),
-        ]
-
-        for type_name, typ in schema.types.items():
-            for name_variant in self._type_name_variants(type_name):
-                for (method_name, type_collection, test_method, m), (async_method_name, async_type_collection, async_test_method, async_m) in zip(bindings, async_bindings):
-                    # double lambda for lexical binding hack, I'm sure there's
-                    # a better way to do this
-                    def cb_bind(type_name=type_name, method=m):
-                        def _cb(*args, **kw):
-                            return method(type_name, *args, **kw)
-                        return _cb
-                    def async_cb_bind(type_name=type_name, method=async_m):
-                        async def _cb(*args, **kw):
-                            return await method(type_name, *args, **kw)
-                        return _cb
-
-                    if test_method in getattr(typ, type_collection, []): setattr(self, '_'.join([method_name, name_variant]), cb_bind())
-                    if async_test_method in getattr(typ, async_type_collection, []): setattr(self, '_'.join([async_method_name, name_variant]), async_cb_bind())
-
-                #for method_name, type_collection, test_method, m in async_bindings:
-                #    def cb_bind(type_name=type_name, method=m):
-                #        def _cb(*args, **kw):
-                #            return method(type_name, *args, **kw)
-                #        return  _cb
-                #    if test_method in getattr(typ, type_collection, []): setattr(self, '_'.join([method_name, name_variant]), cb_bind())
+        """ Builds the name variant -> type lookup table for schema and drops previously
+            resolved methods. The methods themselves are created on first access.
+        """
+        variants = schema.shared.get('variants')
+        if variants is None:
+            variants = {}
+            for type_name in schema.index:
+                for name_variant in self._type_name_variants(type_name): variants[name_variant] = type_name
+            schema.shared['variants'] = variants
+        # swapped in one assignment each, so concurrent lookups see either the old or the new schema
+        stale = self.__dict__.get('_bound_methods', ())
+        self._schema = schema
+        self._type_variants = variants
+        self._bound_methods = set()
+        self._url_types.set_collections({t: schema.collection_url(t) for t in schema.index})
+        for name in stale: self.__dict__.pop(name, None)
+
+    def _resolve_method(self, name: str):
+        if '_cfg' not in self.__dict__ or not any(name.startswith(prefix + '_') for prefix in self._method_prefixes): return None
+        # the first generated method used connects a lazy client
+        schema = self.schema
+        variants = self.__dict__.get('_type_variants')
+        if not variants or schema is None: return None
+        for prefix in self._method_prefixes:
+            if not name.startswith(prefix + '_'): continue
+            type_name = variants.get(name[len(prefix) + 1:])
+            if type_name is None: continue
+            field, http_method = self._method_bindings[prefix]
+            entry = schema.index.get(type_name)
+            if entry is None or http_method not in entry[field]: return None
+            return partial(getattr(self, prefix), type_name)
+        return None
+
+    def _schema_pending(self) -> bool:
+        """ True until a lazily connecting client has loaded its schema"""
+        fields = self.__dict__
+        return '_cfg' in fields and fields.get('_schema') is None and not fields.get('_schema_loaded') and self._cfg.is_enabled
+
+    def _deferred_method(self, name: str):
+        """ async_* method of a client that has not loaded its schema yet. It is resolved once the
+            schema was loaded with _async_ensure_schema, so the load does not block the event loop.
+        """
+        if name.startswith(('async_iter_', 'async_stream_')):
+            async def deferred(*args, **kw):
+                await self._async_ensure_schema()
+                async for item in getattr(self, name)(*args, **kw): yield item
+        else:
+            async def deferred(*args, **kw):
+                await self._async_ensure_schema()
+                return await getattr(self, name)(*args, **kw)
+        deferred.__name__ = name
+        return deferred
+
+    def __getattr__(self, name: str):
+        # only reached when regular attribute lookup fails
+        if name.startswith('async_') and self._schema_pending() and any(name.startswith(prefix + '_') for prefix in self._method_prefixes):
+            # not memoized, the method is looked up again once the schema is loaded
+            return self._deferred_method(name)
+        method = None if name.startswith('_') else self._resolve_method(name)
+        if method is None: raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        # memoized on the instance, so later lookups skip __getattr__
+        self.__dict__[name] = method
+        self._bound_methods.add(name)
+        return method
+
+    def _schema_method_names(self):
+        schema = self.schema
+        variants = self.__dict__.get('_type_variants') or {}
+        if schema is None: return []
+        names = []
+        for name_variant, type_name in variants.items():
+            typ = schema.index[type_name]
+            names += [f'{prefix}_{name_variant}' for prefix, (field, http_method) in self._method_bindings.items() if http_method in typ[field]]
+        return names
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(self._schema_method_names()))
 
     def _get_schema_hash(self):
         h = hashlib.new('sha1')
@@ -420,22 +1209,28 @@ class KctlBaseClient:
         if self._cfg.token is not None: h.update(self._cfg.token.encode('utf-8'))
         return h.hexdigest()
 
-    def _get_cached_schema_file_name(self):
-        h = self._get_schema_hash()
-        return self._cfg.cache_dir.joinpath('schema-' + h + '.json')
-
-    def _cache_schema(self, text):
-        cached_schema = self._get_cached_schema_file_name()
-        if not cached_schema: return None
-        cached_schema.write_text(text, encoding='utf-8')
-
-    def _get_cached_schema(self):
-        cached_schema = self._get_cached_schema_file_name()
-        if not cached_schema: return None
-        if os.path.exists(cached_schema):
-            mod_time = os.path.getmtime(cached_schema)
-            if time.time() - mod_time < self._cfg.cache_time: return cached_schema.read_text(encoding='utf-8')
-        return None
+    def _get_cached_schema_name(self, suffix: str = 'json'):
+        return f'schema-{self._get_schema_hash()}.{suffix}'
+
+    def _schema_file_lock(self):
+        """ Serializes schema refreshes across processes sharing the cache dir"""
+        return self._cfg.cache.lock(self._get_cached_schema_name())
+
+    def _cache_schema_meta(self, meta: Dict):
+        """ url, etag and content fingerprint of the cached schema, used to find and revalidate it.
+            Written after the content, its age is the age of the cached schema
+        """
+        self._cfg.cache.write(self._get_cached_schema_name('meta.json'), self._codec.dumps(meta))
+
+    def _read_cached_schema_meta(self) -> Dict:
+        data = self._cfg.cache.read_bytes(self._get_cached_schema_name('meta.json'))
+        if not data: return {}
+        try: return self._codec.loads(data)
+        except ValueError: return {}
+
+    def _touch_cached_schema(self):
+        """ Renews the ttl of a cached schema that was revalidated as unchanged"""
+        self._cfg.cache.touch(self._get_cached_schema_name('meta.json'))
 
     def wait_success(self, obj, timeout=-1):
         obj = self.wait_transitioning(obj, timeout)
@@ -459,15 +1254,312 @@ class KctlBaseClient:
 
         return obj
 
+    #############################################################################
+    #                             Batched Waiters                               #
+    #############################################################################
+
+    @staticmethod
+    def _transition_state(item: Dict):
+        """ Returns (transitioning, message) of a v3 object or a v1 object with metadata.state"""
+        if 'transitioning' in item: return item['transitioning'], item.get('transitioningMessage')
+        state = (item.get('metadata') or {}).get('state') or {}
+        if state.get('error'): return 'error', state.get('message')
+        return ('yes' if state.get('transitioning') else 'no'), state.get('message')
+
+    def _wait_url(self, obj) -> str:
+        """ The self link of obj, so the refresh does not depend on its namespace or list filters"""
+        url = self._self_link(obj)
+        if url: return url
+        url = self._collection_url(convert_type_name(obj.type))
+        return url + str(obj.id) if url.endswith('/') else '/'.join([url, str(obj.id)])
+
+    def _wait_key(self, obj) -> Tuple[str, str, str]:
+        """ (list url, self link, id) of obj. The list url is the parent of the self link, ie. the
+            namespace of a v1 object, so one list refreshes every pending object of a type and namespace.
+        """
+        url = self._wait_url(obj)
+        return url.rsplit('/', 1)[0], url, str(obj.id)
+
+    def _wait_groups(self, pending: Dict[int, Tuple[str, str, str]]) -> Tuple[Dict[str, Dict[str, str]], Dict[str, List[int]]]:
+        """ ({list url: {self link: id}}, {self link: indexes}), an object passed more than once is refreshed once per tick"""
+        lists: Dict[str, Dict[str, str]] = collections.defaultdict(dict)
+        links: Dict[str, List[int]] = collections.defaultdict(list)
+        for i, (list_url, url, id) in pending.items():
+            lists[list_url][url] = id
+            links[url].append(i)
+        return lists, links
+
+    def _wait_fetch(self, url: str) -> Optional[Dict]:
+        """ Returns the object at its self link, None once it is gone"""
+        try: return self._get(url, mode='dict', cache=False)
+        except ApiError as e:
+            if e.status_code == 404: return None
+            raise e
+
+    async def _async_wait_fetch(self, url: str) -> Optional[Dict]:
+        try: return await self._async_get(url, mode='dict', cache=False)
+        except ApiError as e:
+            if e.status_code == 404: return None
+            raise e
+
+    @staticmethod
+    def _wait_items(page) -> Dict[str, Dict]:
+        if not isinstance(page, dict): return {}
+        return {item.get('id'): item for item in page.get('data') or [] if isinstance(item, dict)}
+
+    def _wait_list(self, url: str) -> Dict[str, Dict]:
+        """ The items of the list at url by id, {} when it cannot be listed so its objects are fetched one by one"""
+        try: return self._wait_items(self._get(url, mode='dict', cache=False))
+        except ApiError: return {}
+
+    async def _async_wait_list(self, url: str) -> Dict[str, Dict]:
+        try: return self._wait_items(await self._async_get(url, mode='dict', cache=False))
+        except ApiError: return {}
+
+    @staticmethod
+    def _wait_batched(lists: Dict[str, Dict[str, str]]) -> List[str]:
+        """ The list urls of a tick, a single pending object is cheaper to GET than its list"""
+        return [url for url, objs in lists.items() if len(objs) > 1]
+
+    @staticmethod
+    def _wait_found(lists: Dict[str, Dict[str, str]], batched: List[str], listed: List[Dict[str, Dict]]) -> Tuple[Dict[str, Dict], List[str]]:
+        """ Matches the listed items to the pending objects by id. Returns ({self link: item}, self links missing from the lists)"""
+        found = {}
+        for url, items in zip(batched, listed):
+            for link, id in lists[url].items():
+                if id in items: found[link] = items[id]
+        return found, [link for objs in lists.values() for link in objs if link not in found]
+
+    def _wait_settle(self, objs: List, links: Dict[str, List[int]], found: Dict[str, Dict], pending: Dict, results: List, states: List, on_settled: Callable = None):
+        """ Releases every object of a tick that is no longer transitioning, or returned a 404"""
+        for url, idxs in links.items():
+            item = found.get(url)
+            state = self._transition_state(item) if item is not None else ('removed', None)
+            if state[0] == 'yes': continue
+            obj = self._decode(item, mode='object') if item is not None else None
+            for i in idxs:
+                results[i], states[i] = obj, state
+                pending.pop(i)
+                if on_settled: on_settled(objs[i], obj)
+
+    def _wait_timeout(self, objs: List, pending: Dict, delta: float):
+        names = ', '.join(f'[{objs[i].type}:{objs[i].id}]' for i in list(pending)[:10])
+        return Exception(f'Timeout waiting for {len(pending)} objects {names} to be done after {delta} seconds')
+
+    def _wait_many(self, objs: List, timeout=-1, sleep=0.01, on_settled: Callable = None, concurrency: int = 10):
+        timeout = _get_timeout(timeout)
+        start = time.time()
+        pending = {i: self._wait_key(obj) for i, obj in enumerate(objs)}
+        results, states = [None] * len(objs), [None] * len(objs)
+        with ThreadPoolExecutor(max_workers = max(min(concurrency, len(pending)), 1)) as pool:
+            while pending:
+                lists, links = self._wait_groups(pending)
+                batched = self._wait_batched(lists)
+                found, missing = self._wait_found(lists, batched, list(pool.map(self._wait_list, batched)))
+                found.update(zip(missing, pool.map(self._wait_fetch, missing)))
+                self._wait_settle(objs, links, found, pending, results, states, on_settled)
+                if not pending: break
+                delta = time.time() - start
+                if delta > timeout: raise self._wait_timeout(objs, pending, delta)
+                time.sleep(min(sleep, max(timeout - delta, 0)))
+                sleep = min(sleep * 2, 2)
+        return results, states
+
+    def wait_transitioning_many(self, objs: List, timeout=-1, sleep=0.01, on_settled: Callable = None, concurrency: int = 10):
+        """ Waits for many objects at once. Every tick lists each type and namespace holding pending
+            objects once, GETs the self links of the objects those lists did not return, and releases
+            objects as soon as they stop transitioning.
+            args:
+                - timeout: one deadline for the whole batch
+                - on_settled: called with (original, refreshed) as each object settles
+                - concurrency: max requests in flight
+            Returns the refreshed objects in input order, None for objects that were removed (404).
+        """
+        return self._wait_many(objs, timeout=timeout, sleep=sleep, on_settled=on_settled, concurrency=concurrency)[0]
+
+    def wait_success_many(self, objs: List, timeout=-1, sleep=0.01, on_settled: Callable = None, concurrency: int = 10):
+        results, states = self._wait_many(objs, timeout=timeout, sleep=sleep, on_settled=on_settled, concurrency=concurrency)
+        failed = [f'[{obj.type}:{obj.id}] {state[1]}' for obj, state in zip(objs, states) if state[0] != 'no']
+        if failed: raise ClientApiError('; '.join(failed))
+        return results
+
+    async def _async_wait_many(self, objs: List, timeout=-1, sleep=0.01, on_settled: Callable = None, concurrency: int = 10):
+        timeout = _get_timeout(timeout)
+        start = time.time()
+        pending = {i: self._wait_key(obj) for i, obj in enumerate(objs)}
+        results, states = [None] * len(objs), [None] * len(objs)
+        semaphore = asyncio.Semaphore(concurrency)
+        async def limited(func: Callable, url: str):
+            async with semaphore: return await func(url)
+        while pending:
+            lists, links = self._wait_groups(pending)
+            batched = self._wait_batched(lists)
+            found, missing = self._wait_found(lists, batched, await asyncio.gather(*[limited(self._async_wait_list, url) for url in batched]))
+            found.update(zip(missing, await asyncio.gather(*[limited(self._async_wait_fetch, url) for url in missing])))
+            self._wait_settle(objs, links, found, pending, results, states, on_settled)
+            if not pending: break
+            delta = time.time() - start
+            if delta > timeout: raise self._wait_timeout(objs, pending, delta)
+            await asyncio.sleep(min(sleep, max(timeout - delta, 0)))
+            sleep = min(sleep * 2, 2)
+        return results, states
+
+    async def async_wait_transitioning_many(self, objs: List, timeout=-1, sleep=0.01, on_settled: Callable = None, concurrency: int = 10):
+        return (await self._async_wait_many(objs, timeout=timeout, sleep=sleep, on_settled=on_settled, concurrency=concurrency))[0]
+
+    async def async_wait_success_many(self, objs: List, timeout=-1, sleep=0.01, on_settled: Callable = None, concurrency: int = 10):
+        results, states = await self._async_wait_many(objs, timeout=timeout, sleep=sleep, on_settled=on_settled, concurrency=concurrency)
+        failed = [f'[{obj.type}:{obj.id}] {state[1]}' for obj, state in zip(objs, states) if state[0] != 'no']
+        if failed: raise ClientApiError('; '.join(failed))
+        return results
+
+
+class ClusterView:
+    """ A KctlBaseClient bound to one cluster. Attributes are read from the parent client
+        and its methods run within parent.cluster_scope(cluster_name), including the
+        iteration of the generators and the awaiting of the coroutines they return.
+        Only the base url differs, nothing is copied.
+    """
+    __slots__ = ('_parent', 'cluster_name')
+
+    def __init__(self, parent: KctlBaseClient, cluster_name: str):
+        object.__setattr__(self, '_parent', parent)
+        object.__setattr__(self, 'cluster_name', cluster_name)
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.cluster_name} {self.url}>'
+
+    @property
+    def url(self): return self._parent._cfg.get_url(cluster_name = self.cluster_name)
+
+    def cluster(self, cluster_name: str) -> 'ClusterView':
+        return self._parent.cluster(cluster_name)
+
+    def set_cluster(self, *args, **kwargs):
+        raise ClientApiError('A cluster view cannot change its cluster, use client.cluster(cluster_name)')
+
+    def reset_config(self, *args, **kwargs):
+        raise ClientApiError('A cluster view cannot change its config, reset the parent client instead')
+
+    # the connection pools belong to the parent client
+    def close(self): pass
+
+    async def aclose(self): pass
+
+    def __enter__(self): return self
+
+    def __exit__(self, *args): pass
+
+    async def __aenter__(self):
+        await self._async_ensure_schema()
+        return self
+
+    async def __aexit__(self, *args): pass
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._parent, name)
+        if inspect.ismethod(attr) or inspect.isfunction(attr) or isinstance(attr, partial): return self._scoped(attr)
+        return attr
+
+    def _scoped(self, func: Callable):
+        @wraps(func)
+        def call(*args, **kwargs):
+            with self._parent.cluster_scope(self.cluster_name): result = func(*args, **kwargs)
+            if inspect.isgenerator(result): return self._scoped_iter(result)
+            if inspect.isasyncgen(result): return self._scoped_async_iter(result)
+            if inspect.iscoroutine(result): return self._scoped_await(result)
+            return result
+        return call
+
+    def _scoped_iter(self, gen: Iterator):
+        try:
+            while True:
+                with self._parent.cluster_scope(self.cluster_name):
+                    try: item = next(gen)
+                    except StopIteration as e: return e.value
+                yield item
+        finally: gen.close()
+
+    async def _scoped_async_iter(self, gen: AsyncIterator):
+        try:
+            while True:
+                with self._parent.cluster_scope(self.cluster_name):
+                    try: item = await gen.__anext__()
+                    except StopAsyncIteration: return
+                yield item
+        finally: await gen.aclose()
+
+    async def _scoped_await(self, coro):
+        with self._parent.cluster_scope(self.cluster_name): return await coro
+
+
+class LazyClient:
+    """ Class attribute that creates the client on first access, so importing kctl does no work"""
+    def __init__(self, api_version: str):
+        self.api_version = api_version
+        self.client: KctlBaseClient = None
+        self._lock = threading.Lock()
+
+    def __get__(self, obj, owner = None) -> KctlBaseClient:
+        if self.client is None:
+            with self._lock:
+                if self.client is None: self.client = KctlBaseClient(api_version = self.api_version)
+        return self.client
+
 
 class KctlClient:
-    v1: KctlBaseClient = KctlBaseClient(api_version='v1')
-    v3: KctlBaseClient = KctlBaseClient(api_version='v3')
+    v1: KctlBaseClient = LazyClient(api_version='v1')
+    v3: KctlBaseClient = LazyClient(api_version='v3')
 
     @classmethod
     def build_rancher_ctx(cls):
         cls.v1._cfg.build_rancher_ctx(v1_client=cls.v1, v3_client=cls.v3)
-        cls.v3._cfg.build_rancher_ctx(v1_client=cls.v1, v3_client=cls.v3)
+        cls.v3._cfg.rancher_ctxs = cls.v1._cfg.rancher_ctxs
+        cls.v3._cfg.rancher_default_cluster = cls.v1._cfg.rancher_default_cluster
+
+    @classmethod
+    async def async_build_rancher_ctx(cls):
+        """ Async version of build_rancher_ctx, the clusters and registration tokens are fetched concurrently"""
+        await cls.v1._cfg.async_build_rancher_ctx(v1_client=cls.v1, v3_client=cls.v3)
+        cls.v3._cfg.rancher_ctxs = cls.v1._cfg.rancher_ctxs
+        cls.v3._cfg.rancher_default_cluster = cls.v1._cfg.rancher_default_cluster
+
+    @classmethod
+    async def async_init(cls, build_ctx: bool = True):
+        """ Connects both clients without blocking the event loop.
+            The v1 and v3 schemas, clusters and registration tokens are fetched concurrently.
+            args:
+                - build_ctx: also build the rancher cluster contexts
+        """
+        if build_ctx: await cls.async_build_rancher_ctx()
+        else: await asyncio.gather(cls.v1._async_ensure_schema(), cls.v3._async_ensure_schema())
+        return cls
+
+    @classmethod
+    def _clients(cls) -> List[KctlBaseClient]:
+        """ The clients that were created, without creating the others"""
+        clients = []
+        for attr in (cls.__dict__.get('v1'), cls.__dict__.get('v3')):
+            client = attr.client if isinstance(attr, LazyClient) else attr
+            if client is not None: clients.append(client)
+        return clients
+
+    @classmethod
+    def close(cls):
+        """ Releases the connection pools of v1 and v3, and closes the kubernetes clients"""
+        for client in cls._clients(): client.close()
+        kube_clients.close()
+
+    @classmethod
+    async def aclose(cls):
+        for client in cls._clients(): await client.aclose()
+        kube_clients.close()
 
     @classmethod
     def reset_context(cls, host: str = None, reset_schema: bool = True, *args, **kwargs):
@@ -479,7 +1571,98 @@ class KctlClient:
         cls.v1.set_cluster(cluster_name = cluster_name, *args, **kwargs)
         #cls.v3.set_cluster(cluster_name = cluster_name, *args, **kwargs)
 
+    #############################################################################
+    #                           Multi-Cluster Fan-Out                           #
+    #############################################################################
+
+    @classmethod
+    def _fanout_clusters(cls, client: KctlBaseClient, clusters: List[str] = None):
+        if not client._cfg.rancher_ctxs: cls.build_rancher_ctx()
+        return clusters or list(client._cfg.rancher_ctxs.keys())
+
+    @classmethod
+    def _fanout_call(cls, client: KctlBaseClient, cluster_name: str, method: Union[str, Callable], *args, **kwargs) -> ClusterResult:
+        start = time.time()
+        if cluster_name not in client._cfg.rancher_ctxs: return ClusterResult(cluster_name, error = ClientApiError(f'{cluster_name} is not a known cluster'))
+        try:
+            with client.cluster_scope(cluster_name):
+                func = getattr(client, method) if isinstance(method, str) else partial(method, client)
+                result = func(*args, **kwargs)
+                # generators have to be consumed while the cluster scope is active
+                if inspect.isgenerator(result): result = list(result)
+            return ClusterResult(cluster_name, result = result, elapsed = time.time() - start)
+        except Exception as e: return ClusterResult(cluster_name, error = e, elapsed = time.time() - start)
+
+    @classmethod
+    async def _async_fanout_call(cls, client: KctlBaseClient, cluster_name: str, method: Union[str, Callable], timeout: float = None, *args, **kwargs) -> ClusterResult:
+        start = time.time()
+        if cluster_name not in client._cfg.rancher_ctxs: return ClusterResult(cluster_name, error = ClientApiError(f'{cluster_name} is not a known cluster'))
+        try:
+            with client.cluster_scope(cluster_name):
+                if isinstance(method, str): func = getattr(client, method if method.startswith('async_') else f'async_{method}')
+                else: func = partial(method, client)
+                result = func(*args, **kwargs)
+                if inspect.isasyncgen(result): result = [i async for i in result]
+                elif inspect.isawaitable(result): result = await asyncio.wait_for(result, timeout)
+            return ClusterResult(cluster_name, result = result, elapsed = time.time() - start)
+        except Exception as e: return ClusterResult(cluster_name, error = e, elapsed = time.time() - start)
+
+    @classmethod
+    def fanout_iter(cls, method: Union[str, Callable], *args, clusters: List[str] = None, concurrency: int = 10, client: KctlBaseClient = None, **kwargs) -> Iterator[ClusterResult]:
+        """ Runs the same operation against many clusters concurrently, yielding results as they finish.
+            args:
+                - method: client method name (ie. 'list', 'by_id', 'list_pod') or a callable(client, *args, **kwargs)
+                - clusters: defaults to all enabled clusters from the rancher context
+                - concurrency: max clusters queried at once
+                - client: defaults to KctlClient.v1
+        """
+        client = client or cls.v1
+        clusters = cls._fanout_clusters(client, clusters)
+        with ThreadPoolExecutor(max_workers = max(min(concurrency, len(clusters)), 1)) as pool:
+            futures = [pool.submit(cls._fanout_call, client, cluster_name, method, *args, **kwargs) for cluster_name in clusters]
+            for future in as_completed(futures): yield future.result()
+
+    @classmethod
+    def fanout(cls, method: Union[str, Callable], *args, clusters: List[str] = None, concurrency: int = 10, client: KctlBaseClient = None, **kwargs) -> Dict[str, ClusterResult]:
+        """ Runs the same operation against many clusters concurrently. Returns {cluster_name: ClusterResult}"""
+        return {r.cluster_name: r for r in cls.fanout_iter(method, *args, clusters = clusters, concurrency = concurrency, client = client, **kwargs)}
+
+    @classmethod
+    async def async_fanout_iter(cls, method: Union[str, Callable], *args, clusters: List[str] = None, concurrency: int = 10, timeout: float = None, client: KctlBaseClient = None, **kwargs) -> AsyncIterator[ClusterResult]:
+        """ Async version of fanout_iter. String methods resolve to their async_ variant
+            and a callable should return an awaitable. timeout applies per cluster.
+        """
+        client = client or cls.v1
+        if not client._cfg.rancher_ctxs: await cls.async_build_rancher_ctx()
+        clusters = clusters or list(client._cfg.rancher_ctxs.keys())
+        semaphore = asyncio.Semaphore(concurrency)
+        async def run(cluster_name: str):
+            async with semaphore: return await cls._async_fanout_call(client, cluster_name, method, timeout, *args, **kwargs)
+        tasks = [asyncio.ensure_future(run(cluster_name)) for cluster_name in clusters]
+        try:
+            for task in asyncio.as_completed(tasks): yield await task
+        finally:
+            for task in tasks:
+                if not task.done(): task.cancel()
+
+    @classmethod
+    async def async_fanout(cls, method: Union[str, Callable], *args, clusters: List[str] = None, concurrency: int = 10, timeout: float = None, client: KctlBaseClient = None, **kwargs) -> Dict[str, ClusterResult]:
+        return {r.cluster_name: r async for r in cls.async_fanout_iter(method, *args, clusters = clusters, concurrency = concurrency, timeout = timeout, client = client, **kwargs)}
+
     @classproperty
     def api(cls) -> KubernetesClient:
-        return KubernetesClient(cls.v1._cfg.config)
+        """ Native kubernetes client of the current cluster, reused across calls and set_cluster"""
+        return cls.api_for()
+
+    @classmethod
+    def api_for(cls, cluster_name: str = None) -> KubernetesClient:
+        """ Native kubernetes client of cluster_name, defaults to the current cluster.
+            Clients are cached per cluster and credentials, and closed when evicted or on close()
+            Raises ClientApiError for an unknown cluster_name rather than returning the client of another cluster.
+        """
+        cfg = cls.v1._cfg
+        if cluster_name:
+            if not cfg.rancher_ctxs: cls.build_rancher_ctx()
+            if cluster_name not in cfg.rancher_ctxs: raise ClientApiError(f'{cluster_name} is not a known cluster')
+        return kube_clients.get(cfg.get_config(cluster_name or cfg.rancher_default_cluster))
 
@@ -0,0 +1,101 @@
+import json as _json
+from lazycls.types import *
+from .logz import get_logger
+
+try: import orjson
+except ImportError: orjson = None
+
+try: import simdjson
+except ImportError: simdjson = None
+
+try: import ujson
+except ImportError: ujson = None
+
+logger = get_logger()
+
+"""
+Pluggable JSON Codecs used to (un)marshall Rancher API payloads.
+The fastest installed backend is picked unless one is explicitly requested.
+"""
+
+class JsonCodec:
+    name: str = 'json'
+    # binary codecs prefer the raw response bytes over the decoded text
+    binary: bool = False
+
+    @classmethod
+    def loads(cls, data: Union[str, bytes]):
+        return _json.loads(data)
+
+    @classmethod
+    def dumps(cls, obj, indent: int = None, sort_keys: bool = False, default: Callable = None) -> str:
+        return _json.dumps(obj, indent=indent, sort_keys=sort_keys, default=default, ensure_ascii=False)
+
+
+class OrJsonCodec(JsonCodec):
+    name: str = 'orjson'
+    binary: bool = True
+
+    @classmethod
+    def loads(cls, data: Union[str, bytes]):
+        return orjson.loads(data)
+
+    @classmethod
+    def dumps(cls, obj, indent: int = None, sort_keys: bool = False, default: Callable = None) -> str:
+        # orjson only supports an indent of 2
+        option = (orjson.OPT_INDENT_2 if indent else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=default, option=option).decode('utf-8')
+
+
+class SimdJsonCodec(JsonCodec):
+    """ simdjson only accelerates decoding, encoding falls back to stdlib"""
+    name: str = 'simdjson'
+    binary: bool = True
+
+    @classmethod
+    def loads(cls, data: Union[str, bytes]):
+        return simdjson.loads(data)
+
+
+class UJsonCodec(JsonCodec):
+    name: str = 'ujson'
+
+    @classmethod
+    def loads(cls, data: Union[str, bytes]):
+        return ujson.loads(data)
+
+    @classmethod
+    def dumps(cls, obj, indent: int = None, sort_keys: bool = False, default: Callable = None) -> str:
+        return ujson.dumps(obj, indent=indent or 0, sort_keys=sort_keys, default=default, ensure_ascii=False)
+
+
+# Ordered by preference when resolving 'auto'
+Codecs: Dict[str, Type[JsonCodec]] = {
+    'orjson': OrJsonCodec if orjson is not None else None,
+    'simdjson': SimdJsonCodec if simdjson is not None else None,
+    'ujson': UJsonCodec if ujson is not None else None,
+    'json': JsonCodec,
+}
+
+
+def get_codec(name: str = 'auto') -> Type[JsonCodec]:
+    """ Returns the codec for `name`, or the fastest available one for 'auto'.
+        Falls back to stdlib json if the requested backend is not installed.
+    """
+    name = (name or 'auto').lower()
+    if name == 'auto': return next(c for c in Codecs.values() if c is not None)
+    codec = Codecs.get(name)
+    if codec is None:
+        logger.warning(f'JSON Codec {name} is not available. Falling back to json')
+        return JsonCodec
+    return codec
+
+
+__all__ = [
+    'JsonCodec',
+    'OrJsonCodec',
+    'SimdJsonCodec',
+    'UJsonCodec',
+    'Codecs',
+    'get_codec',
+]
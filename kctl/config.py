@@ -1,3 +1,8 @@
+import json
+import asyncio
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor
 from lazycls.envs import *
 from lazycls.types import *
 from lazycls import BaseModel, classproperty
@@ -5,8 +10,12 @@ from lazycls.funcs import timed_cache
 from lazycls.serializers import Base
 from kubernetes.client import Configuration
 from lazycls.base import set_modulename
-from lazycls.utils import get_parent_path, to_path, Path
+from lazycls.utils import Path
 from .logz import get_logger
+from .static import ClusterPathRegex, PatchContentTypes
+from .cache import SharedCache
+from .query import Query
+from .classes import ClientApiError
 
 
 DefaultHeaders = {
@@ -14,9 +23,12 @@ DefaultHeaders = {
     'Content-Type': 'application/json'
 }
 
-DefaultCacheDir = get_parent_path(__file__).joinpath('.kctlcache')
 logger = get_logger()
 
+RegistrationTokenType = 'management.cattle.io.clusterregistrationtoken'
+# A refresh fetching the tokens of more new clusters than this lists every token instead
+RancherCtxIncrementalMax = 10
+
 set_modulename('kctl')
 
 # This is the base KctlCfg class that you can access natively without requiring initialization.
@@ -105,11 +117,35 @@ class KctlContextCfg:
         ssl_verify: bool = True,
         strict: bool = False,
         cache_time: int = 86400,
-        cache_dir: Union[Path, str] = DefaultCacheDir,
+        cache_stale_time: int = 604800,
+        cache_dir: Union[Path, str] = None,
         rancher_default_cluster: str = None,
         rancher_fleet_name: str = 'fleet-default',
+        rancher_ctx_ttl: int = 3600,
         clusters_enabled: List[str] = [],
-        clusters_disabled: List[str] = []
+        clusters_disabled: List[str] = [],
+        lazy_decode: bool = False,
+        json_codec: str = 'auto',
+        response_mode: str = 'object',
+        retry_max: int = 3,
+        retry_backoff: float = 0.1,
+        retry_backoff_max: float = 10.0,
+        retry_budget: int = 100,
+        lazy_connect: bool = True,
+        http_timeout: float = 30.0,
+        http2: bool = True,
+        compression: bool = True,
+        pool_max_connections: int = 200,
+        pool_max_keepalive: int = 50,
+        pool_keepalive_expiry: float = 30.0,
+        response_cache: bool = False,
+        response_cache_size: int = 1024,
+        response_cache_ttl: float = 5.0,
+        response_cache_ttls: Dict[str, float] = None,
+        response_cache_negative_ttl: float = 5.0,
+        coalesce_requests: bool = True,
+        metrics: bool = True,
+        patch_type: str = 'merge',
         ):
         self.host = host or KctlCfg.host
         self.token = api_token or KctlCfg.api_token
@@ -117,33 +153,172 @@ class KctlContextCfg:
         self.ssl_verify = envToBool('KCTL_SSL_VERIFY', str(ssl_verify))
         self.strict = envToBool('KCTL_STRICT', str(strict))
         self.cache_time = envToInt('KCTL_CACHE_TIME', cache_time)
-        self.cache_dir = to_path(envToStr('KCTL_CACHE_DIR', None) or cache_dir)
-        self.cache_dir.mkdir(parents = True, exist_ok = True)
+        # A cached schema older than cache_time is still used while it is revalidated in the background, up to this age
+        self.cache_stale_time = envToInt('KCTL_CACHE_STALE_TIME', cache_stale_time)
+        # Shared by every process on the host, defaults to ~/.cache/kctl rather than the package dir
+        self.cache = SharedCache(envToStr('KCTL_CACHE_DIR', None) or cache_dir)
+        self.cache_dir = self.cache.cache_dir
+        # Resolve fields, links and actions on access rather than building them all on decode.
+        self.lazy_decode = envToBool('KCTL_LAZY_DECODE', str(lazy_decode))
+        # One of auto, orjson, simdjson, ujson, json
+        self.json_codec = envToStr('KCTL_JSON_CODEC', json_codec)
+        # What list / by_id return: object (RestObject), dict or bytes
+        self.response_mode = envToStr('KCTL_RESPONSE_MODE', response_mode)
+        # Exponential backoff for 409/429/502/503/504 and connection errors
+        self.retry_max = envToInt('KCTL_RETRY_MAX', retry_max)
+        self.retry_backoff = envToFloat('KCTL_RETRY_BACKOFF', retry_backoff)
+        self.retry_backoff_max = envToFloat('KCTL_RETRY_BACKOFF_MAX', retry_backoff_max)
+        # Max retries per minute for a client, 0 disables the budget
+        self.retry_budget = envToInt('KCTL_RETRY_BUDGET', retry_budget)
+        # Defer fetching the schema until the client is first used
+        self.lazy_connect = envToBool('KCTL_LAZY_CONNECT', str(lazy_connect))
+        # Connection pools are shared by all clients of a host with the same settings
+        self.http_timeout = envToFloat('KCTL_HTTP_TIMEOUT', http_timeout)
+        # HTTP/2 on the async path, requires h2 (pip install httpx[http2])
+        self.http2 = envToBool('KCTL_HTTP2', str(http2))
+        # Accept gzip / deflate (and br if brotli is installed) encoded responses
+        self.compression = envToBool('KCTL_COMPRESSION', str(compression))
+        self.pool_max_connections = envToInt('KCTL_POOL_MAX_CONNECTIONS', pool_max_connections)
+        self.pool_max_keepalive = envToInt('KCTL_POOL_MAX_KEEPALIVE', pool_max_keepalive)
+        self.pool_keepalive_expiry = envToFloat('KCTL_POOL_KEEPALIVE_EXPIRY', pool_keepalive_expiry)
+        # In-memory LRU of GET responses, invalidated by writes of the same type. Pass from_cache=False to bypass it
+        self.response_cache = envToBool('KCTL_RESPONSE_CACHE', str(response_cache))
+        self.response_cache_size = envToInt('KCTL_RESPONSE_CACHE_SIZE', response_cache_size)
+        self.response_cache_ttl = envToFloat('KCTL_RESPONSE_CACHE_TTL', response_cache_ttl)
+        # Per type ttls, ie. KCTL_RESPONSE_CACHE_TTLS=pod=1,cluster=60
+        self.response_cache_ttls = {k: float(v) for k, v in (i.split('=', 1) for i in envToList('KCTL_RESPONSE_CACHE_TTLS') if '=' in i)} or response_cache_ttls or {}
+        # by_id of a missing object is answered from the cache for this long
+        self.response_cache_negative_ttl = envToFloat('KCTL_RESPONSE_CACHE_NEGATIVE_TTL', response_cache_negative_ttl)
+        # Identical GETs in flight at the same time share one request, from_cache=False opts out
+        self.coalesce_requests = envToBool('KCTL_COALESCE_REQUESTS', str(coalesce_requests))
+        # Records request / decode timings, bytes, retries and cache hits in kctl.metrics.metrics
+        self.metrics = envToBool('KCTL_METRICS', str(metrics))
+        # update_data sends only the changed fields as a merge (default), strategic or json patch where the type allows PATCH.
+        # none always PUTs the whole object
+        self.patch_type = envToStr('KCTL_PATCH_TYPE', patch_type or 'merge').lower()
+        if self.patch_type not in PatchContentTypes:
+            if self.patch_type != 'none': logger.warning(f'Unknown patch_type {self.patch_type}, updates will PUT the whole object')
+            self.patch_type = None
 
         self.rancher_default_cluster = envToStr('KCTL_RANCHER_DEFAULT_CLUSTER', rancher_default_cluster)
         self.rancher_fleet_name = envToStr('KCTL_RANCHER_FLEET_NAME', rancher_fleet_name)
+        # Discovered clusters are cached on disk this long. Past it only the clusters are relisted,
+        # and registration tokens are fetched for the clusters that were added
+        self.rancher_ctx_ttl = envToInt('KCTL_RANCHER_CTX_TTL', rancher_ctx_ttl)
         # If both are empty, then it will assume all clusters are enabled.
-        self.clusters_enabled = envToList('KCTL_CLUSTERS_ENABLED', clusters_enabled)
-        self.clusters_disabled = envToList('KCTL_CLUSTERS_DISABLED', clusters_disabled)
+        self.clusters_enabled = envToList('KCTL_CLUSTERS_ENABLED', default = clusters_enabled)
+        self.clusters_disabled = envToList('KCTL_CLUSTERS_DISABLED', default = clusters_disabled)
         self.rancher_ctxs: Dict[str, RancherCtx] = {}
     
-    def build_rancher_ctx(self, v1_client, v3_client):
-        """After rancher client initialization, will populate the cluster-ids from calling the api"""
-        clusters = v3_client.list_cluster()
-        registration_tokens = v1_client.list_management_cattle_io_clusterregistrationtoken()
+    @property
+    def rancher_ctx_cache_name(self):
+        h = hashlib.sha1(f'{self.host}|{self.token}'.encode('utf-8')).hexdigest()
+        return f'rancher-ctx-{h}.json'
+
+    def build_rancher_ctx(self, v1_client, v3_client, force: bool = False):
+        """After rancher client initialization, will populate the cluster-ids from calling the api.
+           The discovered clusters are shared through the on-disk cache for rancher_ctx_ttl,
+           and only one process refetches them when it expires.
+           args:
+                - force: refetch every cluster and registration token, ignoring the cache
+        """
+        if not force and self.load_rancher_ctx(): return
+        with self.cache.lock(self.rancher_ctx_cache_name):
+            if not force and self.load_rancher_ctx(): return
+            known = None if force else self.read_rancher_rows()
+            if known is None:
+                with ThreadPoolExecutor(max_workers = 2) as pool:
+                    clusters = pool.submit(v3_client.list, 'cluster', response_mode = 'object')
+                    registration_tokens = pool.submit(v1_client.list, RegistrationTokenType, response_mode = 'object')
+                    return self.set_rancher_ctx(clusters.result(), registration_tokens.result())
+            clusters = v3_client.list('cluster', response_mode = 'object')
+            missing = self.missing_token_ids(clusters.data, known)
+            if len(missing) > RancherCtxIncrementalMax: registration_tokens = v1_client.list(RegistrationTokenType, response_mode = 'object').data
+            elif missing:
+                with ThreadPoolExecutor(max_workers = len(missing)) as pool:
+                    registration_tokens = [t for page in pool.map(lambda cluster_id: v1_client.list(RegistrationTokenType, query = Query().where('metadata.namespace', cluster_id), response_mode = 'object').data, missing) for t in page]
+            else: registration_tokens = []
+            self.set_rancher_ctx(clusters, registration_tokens, known)
+
+    async def async_build_rancher_ctx(self, v1_client, v3_client, force: bool = False):
+        """Async version of build_rancher_ctx"""
+        if not force and self.load_rancher_ctx(): return
+        async with self.cache.lock(self.rancher_ctx_cache_name):
+            if not force and self.load_rancher_ctx(): return
+            known = None if force else self.read_rancher_rows()
+            if known is None:
+                clusters, registration_tokens = await asyncio.gather(v3_client.async_list('cluster', response_mode = 'object'), v1_client.async_list(RegistrationTokenType, response_mode = 'object'))
+                return self.set_rancher_ctx(clusters, registration_tokens)
+            clusters = await v3_client.async_list('cluster', response_mode = 'object')
+            missing = self.missing_token_ids(clusters.data, known)
+            if len(missing) > RancherCtxIncrementalMax: registration_tokens = (await v1_client.async_list(RegistrationTokenType, response_mode = 'object')).data
+            else:
+                pages = await asyncio.gather(*[v1_client.async_list(RegistrationTokenType, query = Query().where('metadata.namespace', cluster_id), response_mode = 'object') for cluster_id in missing])
+                registration_tokens = [t for page in pages for t in page.data]
+            self.set_rancher_ctx(clusters, registration_tokens, known)
+
+    @staticmethod
+    def missing_token_ids(clusters: List, known: List[Dict[str, str]]) -> List[str]:
+        """Returns the ids of the clusters without a known registration token, ie. the ones added since known was cached"""
+        tokens = {row['cluster_id'] for row in known if row.get('registration_token')}
+        return [cluster.id for cluster in clusters if cluster.id not in tokens]
+
+    @staticmethod
+    def index_registration_tokens(registration_tokens: List) -> Dict[str, str]:
+        """Returns {cluster id: token}. Registration tokens live in the namespace of their cluster, ie. c-m-xxxx/default-token"""
+        index = {}
+        for t in registration_tokens:
+            status = getattr(t, 'status', None)
+            token = getattr(status, 'token', None) if status is not None else None
+            if token: index.setdefault(t.id.split('/', 1)[0], token)
+        return index
+
+    def set_rancher_ctx(self, clusters, registration_tokens, known: List[Dict[str, str]] = None):
+        """Populates the rancher ctxs from a cluster list (v3) and a registration token list (v1), and caches them.
+           Clusters without a listed token keep their token from known rows
+        """
+        tokens = self.index_registration_tokens(getattr(registration_tokens, 'data', registration_tokens))
+        known = {row['cluster_id']: row for row in known or []}
+        rows = []
+        for cluster in getattr(clusters, 'data', clusters):
+            token = tokens.get(cluster.id) or known.get(cluster.id, {}).get('registration_token') or ''
+            rows.append({'cluster_name': cluster.name, 'cluster_id': cluster.id, 'registration_token': token})
+        if known:
+            ids = {row['cluster_id'] for row in rows}
+            added, removed = ids.difference(known), set(known).difference(ids)
+            if added or removed: logger.info(f'Rancher clusters changed, added: {sorted(added)}, removed: {sorted(removed)}')
+        self.cache.write(self.rancher_ctx_cache_name, json.dumps(rows))
+        self.set_rancher_rows(rows)
+
+    def read_rancher_rows(self, ttl: float = None) -> Optional[List[Dict[str, str]]]:
+        """Returns the cached {cluster_name, cluster_id, registration_token} rows, None if missing or older than ttl"""
+        data = self.cache.read_bytes(self.rancher_ctx_cache_name, ttl = ttl)
+        if data is None: return None
+        try: return json.loads(data)
+        except ValueError: return None
+
+    def load_rancher_ctx(self) -> bool:
+        """Populates the rancher ctxs from the on-disk cache if it is fresh"""
+        rows = self.read_rancher_rows(ttl = self.rancher_ctx_ttl)
+        if rows is None: return False
+        self.set_rancher_rows(rows)
+        return True
+
+    def set_rancher_rows(self, rows: List[Dict[str, str]]):
+        """Builds the ctxs of the enabled clusters from plain {cluster_name, cluster_id, registration_token} rows.
+           Clusters missing from rows are dropped
+        """
         all_enabled = not self.clusters_disabled and not self.clusters_enabled
-        for cluster in clusters.data:
-            if not all_enabled and (cluster.name in self.clusters_disabled or (self.clusters_enabled and cluster.name not in self.clusters_enabled)): continue
-            if not self.rancher_default_cluster: self.rancher_default_cluster = cluster.name
-            token = [t.status.token for t in registration_tokens.data if cluster.id in t.id]
-            token = token[0] if token else ''
-            self.rancher_ctxs[cluster.name] = RancherCtx(
-                host = self.host,
-                cluster_name = cluster.name,
-                cluster_id = cluster.id,
-                registration_token = token
-            )
-    
+        ctxs = {}
+        for row in rows:
+            name = row['cluster_name']
+            if not all_enabled and (name in self.clusters_disabled or (self.clusters_enabled and name not in self.clusters_enabled)): continue
+            if not self.rancher_default_cluster: self.rancher_default_cluster = name
+            ctxs[name] = RancherCtx(host = self.host, **row)
+        # updated in place, the dict is shared with the v3 client
+        self.rancher_ctxs.clear()
+        self.rancher_ctxs.update(ctxs)
+
     def get_kctx(self, cluster_name: str = None, set_default: bool = False):
         if not cluster_name and not self.rancher_ctxs and not self.rancher_default_cluster: return None
         if not self.rancher_ctxs.get(cluster_name) and self.rancher_default_cluster:
@@ -175,6 +350,21 @@ class KctlContextCfg:
         if not url.endswith(self.api_version): url += f'/{self.api_version}'
         return url
     
+    def rebase_url(self, url: str, cluster_name: str):
+        """ Rewrites an api url of any cluster onto the base url of cluster_name
+            https://localhost/v1/pods -> https://localhost/k8s/clusters/c-m-xxxx/v1/pods
+            Urls of another origin (ie. a rancher server-url that differs from host) are rebased by their path.
+            Raises ClientApiError rather than returning a url of another cluster.
+        """
+        ctx = self.rancher_ctxs.get(cluster_name)
+        if not ctx: raise ClientApiError(f'{cluster_name} is not a known cluster')
+        split = urlsplit(url)
+        if not split.scheme or not split.netloc: raise ClientApiError(f'Cannot rebase {url} onto cluster {cluster_name}')
+        host_path = urlsplit(self.host).path.rstrip('/')
+        path = split.path[len(host_path):] if host_path and split.path.startswith(host_path) else split.path
+        path = ClusterPathRegex.sub('', path, count = 1)
+        return urlunsplit(('', '', ctx.cluster_url + path, split.query, split.fragment))
+
     @property
     def headers(self): return KctlCfg.get_headers(api_token = self.token)
     
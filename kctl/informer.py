@@ -0,0 +1,351 @@
+import time
+import asyncio
+import threading
+import collections
+import httpx
+from typing import Set
+from lazycls.types import *
+from .classes import ApiError
+from .static import GET_METHOD
+from .logz import get_logger
+
+logger = get_logger()
+
+"""
+Informer-style local cache for a single resource type.
+
+An initial list fills the store, then a watch stream keeps it current.
+Both kubernetes watch events ({"type": "ADDED", "object": {...}}) and
+rancher subscribe events ({"name": "resource.change", "data": {...}}) are
+understood, one json event per line. If the server does not support watching,
+the informer falls back to relisting every poll_interval and diffing objects
+by their resourceVersion.
+"""
+
+EventKinds = {
+    'ADDED': 'add',
+    'MODIFIED': 'update',
+    'DELETED': 'delete',
+    'resource.create': 'add',
+    'resource.change': 'update',
+    'resource.remove': 'delete',
+}
+# Status codes that mean the collection cannot be watched at all
+WatchUnsupported = {400, 404, 405, 501}
+# Watches in a row that end early without an event before the informer falls back to polling
+WatchMaxIdle = 3
+
+
+class WatchExpired(Exception):
+    """ The watched resourceVersion is too old (410 Gone), a relist is required"""
+    pass
+
+
+def get_object_key(obj: Dict) -> str:
+    if obj.get('id'): return obj['id']
+    meta = obj.get('metadata') or {}
+    return '/'.join(i for i in [meta.get('namespace'), meta.get('name')] if i)
+
+def get_resource_version(obj: Dict) -> Optional[str]:
+    return (obj.get('metadata') or {}).get('resourceVersion')
+
+
+class Informer:
+    """ Keeps an in-memory copy of every object of `type`, indexed by namespace and labels.
+        args:
+            - client: KctlBaseClient
+            - type: schema type name, ie. 'pod' or 'apps.deployment'
+            - watch: use a watch stream, otherwise poll every poll_interval seconds
+            - watch_timeout: seconds before a quiet watch stream is reconnected
+            - params: extra list query params, ie. labelSelector
+    """
+    def __init__(self, client, type: str, watch: bool = True, poll_interval: float = 5.0, watch_timeout: float = 300.0, **params):
+        self.client = client
+        self.type = type
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.watch_timeout = watch_timeout
+        self.params = params
+        self.revision: Optional[str] = None
+        self.store: Dict[str, Dict] = {}
+        self.namespace_index: Dict[str, Set[str]] = collections.defaultdict(set)
+        self.label_index: Dict[Tuple[str, str], Set[str]] = collections.defaultdict(set)
+        self.handlers: Dict[str, List[Callable]] = {'add': [], 'update': [], 'delete': []}
+        self.synced = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.RLock()
+        self._thread: threading.Thread = None
+        self._task: asyncio.Task = None
+        # watches in a row that ended early without an event
+        self._idle_watches = 0
+
+    @property
+    def has_synced(self): return self.synced.is_set()
+
+    @property
+    def url(self): return self.client._list_url(self.type, **self.params)
+
+    def add_handler(self, on_add: Callable = None, on_update: Callable = None, on_delete: Callable = None):
+        """ on_add(obj), on_update(old, new) and on_delete(obj) are called from the informer thread / task"""
+        if on_add: self.handlers['add'].append(on_add)
+        if on_update: self.handlers['update'].append(on_update)
+        if on_delete: self.handlers['delete'].append(on_delete)
+        return self
+
+    #############################################################################
+    #                                 Store                                     #
+    #############################################################################
+
+    def _index(self, key: str, obj: Dict, remove: bool = False):
+        meta = obj.get('metadata') or {}
+        entries = [self.namespace_index[meta.get('namespace') or '']]
+        entries += [self.label_index[(k, v)] for k, v in (meta.get('labels') or {}).items()]
+        for entry in entries:
+            if remove: entry.discard(key)
+            else: entry.add(key)
+
+    def _upsert(self, obj: Dict):
+        key = get_object_key(obj)
+        with self._lock:
+            old = self.store.get(key)
+            if old is not None:
+                if get_resource_version(old) == get_resource_version(obj) and get_resource_version(obj) is not None: return
+                self._index(key, old, remove = True)
+            self.store[key] = obj
+            self._index(key, obj)
+        if old is None: self._notify('add', obj)
+        else: self._notify('update', old, obj)
+
+    def _remove(self, obj: Dict):
+        key = get_object_key(obj)
+        with self._lock:
+            old = self.store.pop(key, None)
+            if old is not None: self._index(key, old, remove = True)
+        if old is not None: self._notify('delete', old)
+
+    def _replace(self, items: List[Dict], revision: str = None):
+        """ Applies a full relist, emitting the add / update / delete diff against the store"""
+        keys = set()
+        for obj in items:
+            keys.add(get_object_key(obj))
+            self._upsert(obj)
+        with self._lock: removed = [obj for key, obj in self.store.items() if key not in keys]
+        for obj in removed: self._remove(obj)
+        self._set_revision(revision, items)
+        self.synced.set()
+
+    def _set_revision(self, revision: str = None, items: List[Dict] = None):
+        if revision: self.revision = str(revision)
+        elif items:
+            versions = [int(v) for v in (get_resource_version(i) for i in items) if v and v.isdigit()]
+            if versions: self.revision = str(max(versions))
+
+    def _notify(self, kind: str, *objs):
+        if not self.handlers[kind]: return
+        objs = [self.client._decode(obj, mode = self._mode()) for obj in objs]
+        for handler in self.handlers[kind]:
+            try: handler(*objs)
+            except Exception as e: logger.error(f'Informer {self.type} {kind} handler failed: {e}')
+
+    def _apply_event(self, event: Dict) -> bool:
+        """ Returns whether event was a watch event, ie. not a plain collection of a server ignoring watch=true"""
+        kind = EventKinds.get(event.get('type') or event.get('name'))
+        obj = event.get('object') or event.get('data')
+        if kind is None:
+            if event.get('type') == 'ERROR' or event.get('name') == 'resource.error':
+                if isinstance(obj, dict) and obj.get('code') == 410: raise WatchExpired()
+                logger.error(f'Informer {self.type} watch error: {obj}')
+            return False
+        if not isinstance(obj, dict): return False
+        if kind == 'delete': self._remove(obj)
+        else: self._upsert(obj)
+        self._set_revision(get_resource_version(obj))
+        return True
+
+    def _mode(self, mode: str = None):
+        return mode or self.client._cfg.response_mode
+
+    def get(self, key: str, mode: str = None):
+        """ Object by id. In dict mode the stored dicts are returned, treat them as read only"""
+        with self._lock: obj = self.store.get(key)
+        return None if obj is None else self.client._decode(obj, mode = self._mode(mode))
+
+    def keys(self, namespace: str = None, labels: Dict[str, str] = None) -> List[str]:
+        with self._lock:
+            keys = set(self.namespace_index.get(namespace, ())) if namespace is not None else set(self.store.keys())
+            for k, v in (labels or {}).items(): keys &= self.label_index.get((k, v), set())
+        return sorted(keys)
+
+    def list(self, namespace: str = None, labels: Dict[str, str] = None, mode: str = None):
+        """ Objects from the store, optionally filtered by namespace and exact label matches"""
+        with self._lock: items = [self.store[key] for key in self.keys(namespace, labels)]
+        mode = self._mode(mode)
+        return [self.client._decode(obj, mode = mode) for obj in items]
+
+    def collection(self, mode: str = None):
+        """ The store as a collection, shaped like a list response"""
+        with self._lock: data = [self.store[key] for key in sorted(self.store)]
+        return self.client._decode({'type': 'collection', 'resourceType': self.type, 'revision': self.revision, 'data': data}, mode = self._mode(mode))
+
+    def __len__(self): return len(self.store)
+
+    #############################################################################
+    #                              Sync Runner                                  #
+    #############################################################################
+
+    def _pages(self, page: Dict):
+        yield page
+        url = self.client._next_page_url(page)
+        while url:
+            page = self.client._get(url, mode = 'dict', cache = False)
+            url = self.client._next_page_url(page)
+            yield page
+
+    def relist(self):
+        page = self.client.list(self.type, response_mode = 'dict', from_cache = False, **self.params)
+        revision, items = page.get('revision'), []
+        for p in self._pages(page): items.extend(p.get('data') or [])
+        self._replace(items, revision)
+
+    def _watch_params(self):
+        params = dict(self.client._to_dict(**self.params), watch = 'true', timeoutSeconds = int(self.watch_timeout))
+        if self.revision: params['resourceVersion'] = self.revision
+        return params
+
+    def _check_watch_response(self, r):
+        if r.status_code in WatchUnsupported:
+            logger.warning(f'Informer {self.type} cannot watch ({r.status_code}), falling back to polling')
+            self.watch = False
+            return False
+        if r.status_code == 410: raise WatchExpired()
+        if r.status_code >= 300: raise ApiError(None, r)
+        return True
+
+    def _watch_idle(self, events: int, elapsed: float) -> Optional[float]:
+        """ Returns the seconds to wait before the next watch, None when it can reconnect right away.
+            A watch that ends without an event well before timeoutSeconds (ie. the server ignored watch=true
+            or closed the stream) is backed off, and after WatchMaxIdle of them the informer polls instead.
+        """
+        if events or elapsed >= self.watch_timeout / 2:
+            self._idle_watches = 0
+            return None
+        self._idle_watches += 1
+        if self._idle_watches >= WatchMaxIdle:
+            logger.warning(f'Informer {self.type} watch keeps ending without events, falling back to polling')
+            self.watch = False
+            self._idle_watches = 0
+            return None
+        return min(2.0 ** self._idle_watches, 30.0)
+
+    def _watch_once(self) -> int:
+        """ Returns the number of watch events applied"""
+        timeout = httpx.Timeout(self.watch_timeout + 5, connect = 10.0)
+        events = 0
+        with self.client._client.client.stream(GET_METHOD, self.url, params = self._watch_params(), headers = self.client._cfg.headers, timeout = timeout) as r:
+            if not self._check_watch_response(r): return events
+            for line in r.iter_lines():
+                if self._stop.is_set(): return events
+                if line.strip() and self._apply_event(self.client._codec.loads(line)): events += 1
+        return events
+
+    def run(self):
+        """ Blocks until stop() is called, keeping the store current"""
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                if not self.has_synced: self.relist()
+                if self.watch:
+                    start = time.monotonic()
+                    wait = self._watch_idle(self._watch_once(), time.monotonic() - start)
+                    if wait and self._stop.wait(wait): break
+                else:
+                    if self._stop.wait(self.poll_interval): break
+                    self.relist()
+                backoff = 1.0
+            except WatchExpired: self.synced.clear()
+            except httpx.ReadTimeout: pass
+            except Exception as e:
+                logger.error(f'Informer {self.type} failed: {e}. Retrying in {backoff}s')
+                self.synced.clear()
+                if self._stop.wait(backoff): break
+                backoff = min(backoff * 2, 30.0)
+
+    def start(self, wait: bool = True, timeout: float = None):
+        """ Runs the informer in a daemon thread. Waits for the initial list unless wait is False"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target = self.run, name = f'kctl-informer-{self.type}', daemon = True)
+            self._thread.start()
+        if wait: self.synced.wait(timeout)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None and not self._task.done(): self._task.cancel()
+        self.client._informers.pop(self.client._informer_key(self.type), None)
+
+    #############################################################################
+    #                              Async Runner                                 #
+    #############################################################################
+
+    async def async_relist(self):
+        page = await self.client.async_list(self.type, response_mode = 'dict', from_cache = False, **self.params)
+        revision, items = page.get('revision'), list(page.get('data') or [])
+        url = self.client._next_page_url(page)
+        while url:
+            page = await self.client._async_get(url, mode = 'dict', cache = False)
+            items.extend(page.get('data') or [])
+            url = self.client._next_page_url(page)
+        self._replace(items, revision)
+
+    async def _async_watch_once(self) -> int:
+        timeout = httpx.Timeout(self.watch_timeout + 5, connect = 10.0)
+        events = 0
+        async with self.client._client.aclient.stream(GET_METHOD, self.url, params = self._watch_params(), headers = self.client._cfg.headers, timeout = timeout) as r:
+            if not self._check_watch_response(r): return events
+            async for line in r.aiter_lines():
+                if self._stop.is_set(): return events
+                if line.strip() and self._apply_event(self.client._codec.loads(line)): events += 1
+        return events
+
+    async def async_run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                if not self.has_synced: await self.async_relist()
+                if self.watch:
+                    start = time.monotonic()
+                    wait = self._watch_idle(await self._async_watch_once(), time.monotonic() - start)
+                    if wait: await asyncio.sleep(wait)
+                else:
+                    await asyncio.sleep(self.poll_interval)
+                    await self.async_relist()
+                backoff = 1.0
+            except WatchExpired: self.synced.clear()
+            except httpx.ReadTimeout: pass
+            except asyncio.CancelledError: raise
+            except Exception as e:
+                logger.error(f'Informer {self.type} failed: {e}. Retrying in {backoff}s')
+                self.synced.clear()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    async def async_start(self, wait: bool = True, timeout: float = None):
+        """ Runs the informer as a task on the current loop. Waits for the initial list unless wait is False"""
+        if self._task is None or self._task.done():
+            self._stop.clear()
+            self._task = asyncio.ensure_future(self.async_run())
+        if wait:
+            start = time.time()
+            while not self.has_synced:
+                if self._task.done(): self._task.result()
+                if timeout is not None and time.time() - start > timeout: break
+                await asyncio.sleep(0.01)
+        return self
+
+
+__all__ = [
+    'EventKinds',
+    'WatchExpired',
+    'Informer',
+]
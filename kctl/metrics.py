@@ -0,0 +1,160 @@
+import bisect
+import threading
+from lazycls.types import *
+from .static import TIME
+from .logz import get_logger
+
+logger = get_logger()
+
+"""
+Request metrics shared by every client of the process.
+
+Histograms and counters are labelled by http method, resource type, cluster and
+status code. Export them with MetricsRegistry.to_prometheus() (text exposition
+format), read them with snapshot(), or forward every observation to a custom
+sink with add_hook(hook), called as hook(name, labels, value).
+"""
+
+DefaultBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name: (kind, help, label names)
+MetricSpecs = {
+    'kctl_request_duration_seconds': ('histogram', 'Time until the final response of a request, retries included', ('method', 'type', 'cluster', 'status')),
+    'kctl_decode_duration_seconds': ('histogram', 'Time spent decoding response bodies', ('type', 'mode')),
+    'kctl_request_bytes_total': ('counter', 'Request body bytes sent', ('method', 'type', 'cluster')),
+    'kctl_response_bytes_total': ('counter', 'Response body bytes received', ('method', 'type', 'cluster')),
+    'kctl_retries_total': ('counter', 'Requests retried by the retry policy', ('method', 'type', 'cluster', 'reason')),
+    'kctl_cache_requests_total': ('counter', 'GET requests answered without a request of their own', ('type', 'result')),
+}
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float] = DefaultBuckets):
+        self.buckets = buckets
+        # per bucket, not cumulative. Values above the last bucket only count towards +Inf
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts): self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """ Returns the (le, count) pairs of the prometheus buckets"""
+        result, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((repr(float(bound)), total))
+        result.append(('+Inf', self.count))
+        return result
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str], values: Tuple, extra: str = None) -> str:
+    labels = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra: labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class MetricsRegistry:
+    """ Thread-safe store of the MetricSpecs series.
+        args:
+            - buckets: upper bounds in seconds of the histogram buckets
+    """
+    def __init__(self, buckets: Tuple[float] = DefaultBuckets):
+        self.buckets = tuple(sorted(buckets))
+        # Called with (name, {label: value}, value) for every observation
+        self.hooks: List[Callable] = []
+        self._series: Dict[str, Dict[Tuple, Union[float, Histogram]]] = {name: {} for name in MetricSpecs}
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable):
+        if hook not in self.hooks: self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable):
+        if hook in self.hooks: self.hooks.remove(hook)
+
+    def _notify(self, name: str, labels: Tuple, value: float):
+        names = MetricSpecs[name][2]
+        for hook in list(self.hooks):
+            try: hook(name, dict(zip(names, labels)), value)
+            except Exception as e: logger.error(f'Metrics hook {hook} failed: {e}')
+
+    def inc(self, name: str, labels: Tuple, value: float = 1):
+        """ Adds value to the counter series of labels (ordered as the MetricSpecs label names)"""
+        series = self._series[name]
+        with self._lock: series[labels] = series.get(labels, 0) + value
+        if self.hooks: self._notify(name, labels, value)
+
+    def observe(self, name: str, labels: Tuple, value: float):
+        """ Records value in the histogram series of labels"""
+        series = self._series[name]
+        with self._lock:
+            histogram = series.get(labels)
+            if histogram is None: histogram = series[labels] = Histogram(self.buckets)
+            histogram.observe(value)
+        if self.hooks: self._notify(name, labels, value)
+
+    def snapshot(self) -> Dict[str, List[Dict]]:
+        """ Returns {name: [{'labels': {...}, 'value': n} or {'labels': {...}, 'count': n, 'sum': s, 'buckets': {le: n}}]}"""
+        result = {}
+        with self._lock:
+            for name, series in self._series.items():
+                names, rows = MetricSpecs[name][2], []
+                for labels, value in series.items():
+                    row = {'labels': dict(zip(names, labels))}
+                    if isinstance(value, Histogram): row.update(count = value.count, sum = value.sum, buckets = dict(value.cumulative()))
+                    else: row['value'] = value
+                    rows.append(row)
+                result[name] = rows
+        return result
+
+    def to_prometheus(self) -> str:
+        """ Renders every series in the prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in self._series.items():
+                kind, help, names = MetricSpecs[name]
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in sorted(series.items(), key = lambda i: tuple(map(str, i[0]))):
+                    if not isinstance(value, Histogram):
+                        lines.append(f'{name}{_format_labels(names, labels)} {value}')
+                        continue
+                    for le, count in value.cumulative():
+                        bucket = _format_labels(names, labels, f'le="{le}"')
+                        lines.append(f'{name}_bucket{bucket} {count}')
+                    lines.append(f'{name}_sum{_format_labels(names, labels)} {value.sum}')
+                    lines.append(f'{name}_count{_format_labels(names, labels)} {value.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            for series in self._series.values(): series.clear()
+
+
+def log_hook(name: str, labels: Dict[str, str], value: float):
+    """ Logs the request durations, installed when TIME_API is set"""
+    if name == 'kctl_request_duration_seconds': logger.info(f'{value:.4f}s {labels["method"]} {labels["type"]} {labels["cluster"]} {labels["status"]}')
+
+
+metrics = MetricsRegistry()
+if TIME: metrics.add_hook(log_hook)
+
+
+__all__ = [
+    'DefaultBuckets',
+    'MetricSpecs',
+    'Histogram',
+    'MetricsRegistry',
+    'log_hook',
+    'metrics',
+]
@@ -0,0 +1,144 @@
+from typing import Iterable
+from lazycls.types import *
+from .classes import ClientApiError
+
+"""
+Server-side query builder for list / iter.
+
+    Query(state = 'active').labels(app = 'web', tier = ['a', 'b']).fields(metadata__namespace = 'default').sort('-metadata.name').limit(100)
+
+compiles to the params of the api version it is sent to:
+    - v1 (steve): filter, labelSelector, fieldSelector, sort, limit, exclude
+    - v3 (norman): <field>[_<modifier>] collection filters, sort / order, limit
+"""
+
+# Params every collection accepts, never validated against collectionFilters
+ReservedParams = frozenset({
+    'limit', 'marker', 'continue', 'revision', 'sort', 'order', 'filter', 'labelSelector',
+    'fieldSelector', 'exclude', 'include', 'page', 'pagesize', 'projectsornamespaces',
+})
+# Always kept by a projection, so the result still works as an object
+ProjectionKeys = ('id', 'type', 'links', 'actions', 'metadata.name', 'metadata.namespace')
+# Collection filter modifiers of norman, the suffix of a keyword filter, ie. name_ne
+FilterModifiers = ('eq', 'ne', 'null', 'notnull', 'in', 'notin', 'prefix', 'like', 'notlike')
+
+
+def to_field(name: str) -> str:
+    """ Keyword arguments cannot hold dots: metadata__namespace -> metadata.namespace"""
+    return name.replace('__', '.')
+
+
+def split_modifier(name: str) -> Tuple[str, str]:
+    """ name_ne -> (name, ne), names without a modifier suffix are an eq filter"""
+    field, _, modifier = name.rpartition('_')
+    if field and modifier in FilterModifiers: return field, modifier
+    return name, 'eq'
+
+
+def project(item: Dict, fields: Iterable[str]) -> Dict:
+    """ Copies only the dotted fields (and ProjectionKeys) of item"""
+    result = {}
+    for field in list(ProjectionKeys) + list(fields):
+        src, dst, parts = item, result, field.split('.')
+        for part in parts[:-1]:
+            if not isinstance(src, dict) or part not in src: break
+            src = src[part]
+            dst = dst.setdefault(part, {})
+        else:
+            if isinstance(src, dict) and parts[-1] in src: dst[parts[-1]] = src[parts[-1]]
+    return result
+
+
+class Query:
+    """ Chainable server-side query. Keyword filters use the norman names, ie. name_ne = 'x',
+        v1 only supports the eq and ne modifiers. Pass it to list / iter as query = Query(...)
+    """
+    def __init__(self, **filters):
+        self.filters: List[Tuple[str, str, Any]] = []
+        self.label_selectors: List[str] = []
+        self.field_selectors: List[str] = []
+        self.sort_fields: List[str] = []
+        self.excluded: List[str] = []
+        self.selected: List[str] = []
+        self.page_size: int = None
+        self.where(**filters)
+
+    def where(self, field: str = None, value = None, modifier: str = 'eq', **filters):
+        """ where('metadata.name', 'x', 'ne') or where(name_ne = 'x')"""
+        if field is not None: self.filters.append((field, modifier or 'eq', value))
+        for k, v in filters.items(): self.filters.append((*split_modifier(k), v))
+        return self
+
+    def labels(self, selector: str = None, **labels):
+        """ Label selector. A list value matches any of its values, None only requires the label to exist"""
+        if selector: self.label_selectors.append(selector)
+        for k, v in labels.items():
+            k = to_field(k)
+            if v is None: self.label_selectors.append(k)
+            elif isinstance(v, (list, tuple, set)): self.label_selectors.append(f'{k} in ({",".join(str(i) for i in v)})')
+            else: self.label_selectors.append(f'{k}={v}')
+        return self
+
+    def fields(self, selector: str = None, **fields):
+        """ Field selector, ie. fields(metadata__namespace = 'default')"""
+        if selector: self.field_selectors.append(selector)
+        for k, v in fields.items(): self.field_selectors.append(f'{to_field(k)}={v}')
+        return self
+
+    def sort(self, *fields: str):
+        """ Sort fields, prefixed with - for descending"""
+        self.sort_fields.extend(fields)
+        return self
+
+    def limit(self, page_size: int):
+        self.page_size = page_size
+        return self
+
+    def exclude(self, *fields: str):
+        """ Fields the server leaves out of every item (v1), ie. metadata.managedFields"""
+        self.excluded.extend(fields)
+        return self
+
+    def select(self, *fields: str):
+        """ Fields kept on every item, applied once the page is received"""
+        self.selected.extend(fields)
+        return self
+
+    def compile(self, api_version: str = 'v1') -> Dict[str, Any]:
+        """ Returns the query params of api_version"""
+        params: Dict[str, Any] = {}
+        if api_version == 'v1':
+            expressions = []
+            for field, modifier, value in self.filters:
+                if modifier == 'eq': expressions.append(f'{to_field(field)}={value}')
+                elif modifier == 'ne': expressions.append(f'{to_field(field)}!={value}')
+                else: raise ClientApiError(f'The {modifier} modifier is not supported by the v1 api')
+            if expressions: params['filter'] = expressions
+            if self.sort_fields: params['sort'] = ','.join(self.sort_fields)
+            if self.excluded: params['exclude'] = list(self.excluded)
+            if self.label_selectors: params['labelSelector'] = ','.join(self.label_selectors)
+            if self.field_selectors: params['fieldSelector'] = ','.join(self.field_selectors)
+        else:
+            # norman ignores selectors, the query would silently return every object
+            if self.label_selectors or self.field_selectors: raise ClientApiError('Label and field selectors are not supported by the v3 api, use where() filters')
+            for field, modifier, value in self.filters:
+                params[field if modifier == 'eq' else f'{field}_{modifier}'] = value
+            if self.sort_fields:
+                field = self.sort_fields[0]
+                params['sort'] = field.lstrip('-')
+                if field.startswith('-'): params['order'] = 'desc'
+        if self.page_size: params['limit'] = self.page_size
+        return params
+
+    def __repr__(self):
+        return f'<Query {self.compile()}>'
+
+
+__all__ = [
+    'ReservedParams',
+    'FilterModifiers',
+    'to_field',
+    'split_modifier',
+    'project',
+    'Query',
+]
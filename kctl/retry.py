@@ -0,0 +1,180 @@
+import time
+import random
+import asyncio
+import threading
+import collections
+import httpx
+from email.utils import parsedate_to_datetime
+from lazycls.types import *
+from .static import GET_METHOD, PUT_METHOD, DELETE_METHOD, POST_METHOD
+from .logz import get_logger
+
+logger = get_logger()
+
+"""
+Retry / Backoff Policy shared by the sync and async request paths
+"""
+
+RetryStatuses = (409, 429, 502, 503, 504)
+RetryMethods = (GET_METHOD, PUT_METHOD, DELETE_METHOD, 'HEAD')
+# Raised before a response is received, ie. connect / read timeouts and refused connections
+ConnectionErrors = (httpx.TransportError,)
+# A forced POST may already have run when it timed out or a gateway failed, so it is only retried
+# when the request was never sent or the server turned it down
+UnsafeMethods = (POST_METHOD,)
+UnsafeRetryStatuses = (409, 429, 503)
+UnsentErrors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def get_retry_after(response) -> Optional[float]:
+    """ Parses the Retry-After header as either delay-seconds or an HTTP-date"""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value: return None
+    try: return max(float(value), 0.0)
+    except ValueError: pass
+    try: return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError): return None
+
+
+class RetryBudget:
+    """ Token bucket that caps how many retries a client may issue per window,
+        so an unhealthy server is not hammered by every in-flight request.
+    """
+    def __init__(self, size: int = 100, window: float = 60.0):
+        self.size = size
+        self.window = window
+        self.tokens = float(size)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        if self.size <= 0: return True
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.size, self.tokens + (now - self.updated) * self.size / self.window)
+            self.updated = now
+            if self.tokens < 1: return False
+            self.tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    """ Exponential backoff with full jitter.
+        args:
+            - max_retries: retries after the first attempt
+            - backoff: base delay in seconds, doubled each attempt
+            - backoff_max: upper bound of the computed delay
+            - retry_after_max: upper bound when honoring a Retry-After header
+            - statuses: response codes that are retried
+            - methods: http methods retried without being forced (POST is not idempotent)
+            - unsafe_methods: forced methods only retried on unsafe_statuses and UnsentErrors
+            - budget: max retries per budget_window seconds for this policy, 0 to disable
+    """
+    def __init__(self, max_retries: int = 3, backoff: float = 0.1, backoff_max: float = 10.0, retry_after_max: float = 60.0, jitter: bool = True, statuses: Tuple[int] = RetryStatuses, methods: Tuple[str] = RetryMethods, unsafe_methods: Tuple[str] = UnsafeMethods, unsafe_statuses: Tuple[int] = UnsafeRetryStatuses, retry_connection_errors: bool = True, budget: int = 100, budget_window: float = 60.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.jitter = jitter
+        self.statuses = set(statuses)
+        self.methods = set(methods)
+        self.unsafe_methods = set(unsafe_methods)
+        self.unsafe_statuses = set(unsafe_statuses)
+        self.retry_connection_errors = retry_connection_errors
+        self.budget = RetryBudget(budget, budget_window)
+        self.stats = collections.Counter()
+        # Called with (method, url, attempt, delay, reason) before each retry
+        self.hooks: List[Callable] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(max_retries = cfg.retry_max, backoff = cfg.retry_backoff, backoff_max = cfg.retry_backoff_max, budget = cfg.retry_budget)
+
+    def get_delay(self, attempt: int, response = None) -> float:
+        retry_after = get_retry_after(response)
+        if retry_after is not None: return min(retry_after, self.retry_after_max)
+        delay = min(self.backoff_max, self.backoff * (2 ** attempt))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def _can_retry(self, method: str, attempt: int, max_retries: int, force: bool, response = None, error: Exception = None) -> bool:
+        if attempt >= max_retries:
+            self._record('exhausted')
+            return False
+        if not force and method not in self.methods: return False
+        if method in self.unsafe_methods and not (isinstance(error, UnsentErrors) if error is not None else response.status_code in self.unsafe_statuses):
+            self._record('unsafe')
+            return False
+        if not self.budget.acquire():
+            self._record('budget_exhausted')
+            return False
+        return True
+
+    def _record(self, key: str, value: float = 1):
+        with self._lock: self.stats[key] += value
+
+    def _before_retry(self, method: str, url: str, attempt: int, delay: float, reason):
+        self._record('retries')
+        self._record(f'retries_{reason}')
+        self._record('sleep_seconds', delay)
+        logger.debug(f'Retrying {method} {url} in {delay:.3f}s after {reason} (attempt {attempt + 1})')
+        for hook in self.hooks: hook(method, url, attempt, delay, reason)
+
+    def _check(self, method: str, url: str, attempt: int, max_retries: int, force: bool, response = None, error: Exception = None) -> Optional[float]:
+        """ Returns the delay before the next attempt, or None if the outcome should be returned / raised"""
+        if error is not None:
+            if not self.retry_connection_errors or not self._can_retry(method, attempt, max_retries, force, error = error): return None
+            reason = type(error).__name__
+        else:
+            if response.status_code not in self.statuses or not self._can_retry(method, attempt, max_retries, force, response = response): return None
+            reason = response.status_code
+        delay = self.get_delay(attempt, response)
+        self._before_retry(method, url, attempt, delay, reason)
+        return delay
+
+    def call(self, method: str, func: Callable, url: str, force: bool = False, max_retries: int = None, **kwargs):
+        """ Calls func(url, **kwargs) until it returns a non retryable response.
+            The last response is returned as is, connection errors are re-raised.
+            force allows retrying methods that are not considered idempotent, unsafe methods only
+            when they cannot have run.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            self._record('requests')
+            try: response, error = func(url, **kwargs), None
+            except ConnectionErrors as e: response, error = None, e
+            delay = self._check(method, url, attempt, max_retries, force, response, error)
+            if delay is None:
+                if error is not None: raise error
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    async def async_call(self, method: str, func: Callable, url: str, force: bool = False, max_retries: int = None, **kwargs):
+        """ Async version of call, sleeping without blocking the event loop"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            self._record('requests')
+            try: response, error = await func(url, **kwargs), None
+            except ConnectionErrors as e: response, error = None, e
+            delay = self._check(method, url, attempt, max_retries, force, response, error)
+            if delay is None:
+                if error is not None: raise error
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+__all__ = [
+    'RetryStatuses',
+    'RetryMethods',
+    'ConnectionErrors',
+    'UnsafeMethods',
+    'UnsafeRetryStatuses',
+    'UnsentErrors',
+    'get_retry_after',
+    'RetryBudget',
+    'RetryPolicy',
+]
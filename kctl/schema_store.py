@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import weakref
+from functools import partial
+from urllib.parse import urlsplit
+from lazycls.types import *
+from .static import ClusterPathRegex, SchemaBase
+from .classes import Schema
+from .cache import SharedCache
+from .logz import get_logger
+
+logger = get_logger()
+
+"""
+Content-addressed schema store shared by every client of the process.
+
+The schemas of two clusters usually only differ in the base url of their links
+(https://host/k8s/clusters/<id>/v1/...). That base is replaced with SchemaBase before
+the schema is hashed, so every cluster serving the same schema shares one
+schema-content-<sha1>.json / .index.json pair on disk and one parsed index in memory.
+Clients bind the shared Schema to their own base url with Schema.bind.
+
+Which content a cluster serves is recorded in its own schema-<hash>.meta.json, whose
+age is the age of the cached schema of that cluster. Content no meta.json refers to
+anymore is pruned once a new revision is stored.
+"""
+
+# content files younger than this are kept by prune, their meta.json may not be written yet
+PruneGrace = 300.0
+
+
+def get_schema_base(url: str) -> str:
+    """ https://host/k8s/clusters/c-m-xxxx/v1 -> https://host/k8s/clusters/c-m-xxxx"""
+    split = urlsplit(url)
+    match = ClusterPathRegex.match(split.path)
+    return f'{split.scheme}://{split.netloc}' + (match.group() if match else '')
+
+
+def normalize_schema(text: str, base: str) -> str:
+    """ Replaces base in the links of a raw schema with SchemaBase"""
+    return text.replace(base + '/', SchemaBase + '/')
+
+
+class SchemaStore:
+    """ Parsed schemas by content fingerprint. An entry lives as long as a client uses it,
+        after which it is read back from the content files of the SharedCache.
+    """
+    def __init__(self):
+        self._schemas: 'weakref.WeakValueDictionary[str, Schema]' = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(text: Union[str, bytes]) -> str:
+        if isinstance(text, str): text = text.encode('utf-8')
+        return hashlib.sha1(text).hexdigest()
+
+    @staticmethod
+    def content_name(fingerprint: str, suffix: str = 'json') -> str:
+        return f'schema-content-{fingerprint}.{suffix}'
+
+    def _intern(self, schema: Schema) -> Schema:
+        with self._lock: return self._schemas.setdefault(schema.fingerprint, schema)
+
+    def get(self, cache: SharedCache, fingerprint: str, codec) -> Optional[Schema]:
+        """ Returns the schema of fingerprint, None if it is neither in memory nor in cache"""
+        schema = self._schemas.get(fingerprint)
+        if schema is not None: return schema
+        data = cache.read_bytes(self.content_name(fingerprint, 'index.json'))
+        if not data: return None
+        try: index = codec.loads(data)
+        except ValueError: return None
+        return self._intern(Schema(index = index, loader = partial(cache.read_text, self.content_name(fingerprint)), fingerprint = fingerprint))
+
+    def put(self, cache: SharedCache, text: str, codec) -> Schema:
+        """ Stores a normalized schema text, compiling it only if its content is new.
+            The content files are only written once, the index last as readers look for it.
+        """
+        fingerprint = self.fingerprint(text)
+        schema = self._schemas.get(fingerprint)
+        if schema is None: schema = self._intern(Schema(index = Schema.compile(codec.loads(text)), loader = partial(cache.read_text, self.content_name(fingerprint)), fingerprint = fingerprint))
+        if not cache.path(self.content_name(fingerprint, 'index.json')).exists():
+            cache.write(self.content_name(fingerprint), text)
+            cache.write(self.content_name(fingerprint, 'index.json'), codec.dumps(schema.index))
+        # referenced again, so prune keeps it until the meta.json is written
+        else: cache.touch(self.content_name(fingerprint), self.content_name(fingerprint, 'index.json'))
+        return schema
+
+    def prune(self, cache: SharedCache, codec, grace: float = PruneGrace) -> int:
+        """ Removes the content no schema-<hash>.meta.json refers to and no client holds in memory.
+            Returns the number of schema revisions removed
+        """
+        with self._lock: referenced = set(self._schemas.keys())
+        for path in cache.cache_dir.glob('schema-*.meta.json'):
+            try: referenced.add(codec.loads(path.read_bytes()).get('fingerprint'))
+            except (OSError, ValueError, AttributeError): continue
+        removed = 0
+        for path in cache.cache_dir.glob(self.content_name('*', 'index.json')):
+            fingerprint = path.name[len('schema-content-'):-len('.index.json')]
+            if fingerprint in referenced or (cache.age(path.name) or 0.0) < grace: continue
+            # the index first, as readers look for it
+            cache.remove(self.content_name(fingerprint, 'index.json'), self.content_name(fingerprint))
+            removed += 1
+        return removed
+
+    def __len__(self): return len(self._schemas)
+
+
+schema_store = SchemaStore()
+
+
+__all__ = [
+    'PruneGrace',
+    'get_schema_base',
+    'normalize_schema',
+    'SchemaStore',
+    'schema_store',
+]
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import collections
+from typing import Hashable, Awaitable
+from lazycls.types import *
+
+"""
+Request coalescing: concurrent calls with the same key share a single execution.
+
+The first caller of a key runs the call, callers arriving while it is in flight
+wait for it and receive the same result or exception. Nothing is cached once the
+call returns, the next caller runs it again. forget() detaches in-flight calls, so
+later callers do not join a call that started before a write.
+"""
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """ Thread-safe coalescing of sync calls.
+        on_shared is called with the key each time a caller joins an in-flight call.
+    """
+    def __init__(self, on_shared: Callable = None):
+        self.stats = collections.Counter()
+        self.on_shared = on_shared
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader: call = self._calls[key] = _Call()
+            self.stats['calls' if leader else 'shared'] += 1
+        if not leader:
+            if self.on_shared is not None: self.on_shared(key)
+            call.event.wait()
+            if call.error is not None: raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call: self._calls.pop(key)
+            call.event.set()
+
+    def forget(self, match: Callable[[Hashable], bool]):
+        """ Detaches the in-flight calls whose key matches. Their current callers still get their result"""
+        with self._lock:
+            for key in [key for key in self._calls if match(key)]: self._calls.pop(key)
+
+
+class AsyncSingleFlight:
+    """ Coalescing of coroutine calls on the running loop.
+        The call runs as its own task, so a cancelled caller does not cancel it for the others.
+    """
+    def __init__(self, on_shared: Callable = None):
+        self.stats = collections.Counter()
+        self.on_shared = on_shared
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable], *args, **kwargs):
+        # tasks cannot be awaited from another loop
+        loop_key = (id(asyncio.get_running_loop()), key)
+        task = self._calls.get(loop_key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[loop_key] = task
+            task.add_done_callback(lambda t, k = loop_key: self._calls.pop(k, None) if self._calls.get(k) is t else None)
+            self.stats['calls'] += 1
+        else:
+            self.stats['shared'] += 1
+            if self.on_shared is not None: self.on_shared(key)
+        return await asyncio.shield(task)
+
+    def forget(self, match: Callable[[Hashable], bool]):
+        """ Detaches the in-flight calls whose key matches, on every loop"""
+        for loop_key in [loop_key for loop_key in self._calls if match(loop_key[1])]: self._calls.pop(loop_key, None)
+
+
+__all__ = [
+    'SingleFlight',
+    'AsyncSingleFlight',
+]
@@ -1,3 +1,4 @@
+import re
 from lazycls.envs import envToBool
 
 
@@ -17,5 +18,19 @@ JSON = False
 GET_METHOD = 'GET'
 POST_METHOD = 'POST'
 PUT_METHOD = 'PUT'
+PATCH_METHOD = 'PATCH'
 DELETE_METHOD = 'DELETE'
 
+# content type of each patch_type
+PatchContentTypes = {
+    'merge': 'application/merge-patch+json',
+    'strategic': 'application/strategic-merge-patch+json',
+    'json': 'application/json-patch+json',
+}
+
+# cluster prefix of downstream cluster api urls, ie. /k8s/clusters/c-m-xxxx
+ClusterPathRegex = re.compile(r'^/k8s/clusters/[^/]+')
+
+# stands for the base url of a cluster (https://host or https://host/k8s/clusters/c-m-xxxx) in stored schemas
+SchemaBase = 'kctl-base:'
+
@@ -0,0 +1,117 @@
+import re
+import json
+import codecs
+from lazycls.types import *
+
+"""
+Incremental decoding of collection responses.
+
+The items of the top-level "data" array are decoded one at a time as the body
+arrives, so a listing never has to be held in memory as a whole, neither as text
+nor as a decoded tree. Everything outside of "data" (pagination, revision, ...)
+is kept and decoded once the body is complete.
+"""
+
+_StringRe = re.compile(r'["\\]')
+_StructRe = re.compile(r'["{}\[\]:]')
+_SkipRe = re.compile(r'[\s,]*')
+
+
+class CollectionParser:
+    """ Feed the body chunks in order, each feed returns the data items completed by the chunk.
+        Items are decoded with json.JSONDecoder.raw_decode, which finds the end of an item and
+        decodes it in a single C pass.
+    """
+    def __init__(self, key: str = 'data'):
+        self.key = key
+        self.state = 'seek'
+        self.buffer = ''
+        # parts of the body outside of the data array
+        self._rest: List[str] = []
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        # seek state, positions are offsets into buffer
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._last_string: str = None
+        self._key: str = None
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[Dict]:
+        text = self._text.decode(chunk, final = final)
+        if self.state == 'rest':
+            self._rest.append(text)
+            return []
+        self.buffer += text
+        if self.state == 'seek' and not self._seek(): return []
+        return self._items(final)
+
+    def _seek(self) -> bool:
+        """ Scans the top-level object for the key whose value is the data array"""
+        buf, i = self.buffer, self._pos
+        while True:
+            if self._in_string:
+                m = _StringRe.search(buf, i)
+                if m is None: break
+                if m.group() == '\\':
+                    # the escaped char may still be in the next chunk
+                    if m.end() >= len(buf):
+                        i = m.start()
+                        break
+                    i = m.end() + 1
+                    continue
+                self._in_string = False
+                if self._depth == 1: self._last_string = buf[self._string_start:m.start()]
+                i = m.end()
+                continue
+            m = _StructRe.search(buf, i)
+            if m is None:
+                i = len(buf)
+                break
+            c, i = m.group(), m.end()
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ':': self._key = self._last_string if self._depth == 1 else None
+            elif c in '{[':
+                if c == '[' and self._depth == 1 and self._key == self.key:
+                    self._rest.append(buf[:i])
+                    self.buffer = buf[i:]
+                    self.state = 'items'
+                    return True
+                self._depth += 1
+                self._key = None
+            else: self._depth -= 1
+        self._pos = i
+        return False
+
+    def _items(self, final: bool) -> List[Dict]:
+        buf, i, items = self.buffer, 0, []
+        while True:
+            i = _SkipRe.match(buf, i).end()
+            if i >= len(buf): break
+            if buf[i] == ']':
+                self._rest.append(buf[i:])
+                self.buffer = ''
+                self.state = 'rest'
+                return items
+            try: item, end = self._json.raw_decode(buf, i)
+            except json.JSONDecodeError:
+                if final: raise
+                break
+            items.append(item)
+            i = end
+        self.buffer = buf[i:]
+        return items
+
+    def close(self) -> Dict:
+        """ Returns the collection without its data items, ie. for pagination.next"""
+        if self.state == 'items': raise ValueError('Incomplete collection body')
+        rest = ''.join(self._rest) + (self.buffer if self.state == 'seek' else '')
+        return json.loads(rest) if rest.strip() else {}
+
+
+__all__ = [
+    'CollectionParser',
+]
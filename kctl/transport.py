@@ -0,0 +1,218 @@
+import asyncio
+import atexit
+import threading
+import collections
+import httpx
+from urllib.parse import urlsplit
+from lazycls.envs import envToInt
+from lazycls.types import *
+from lazyapi import ApiClient
+from kubernetes.client import ApiClient as KubernetesClient, Configuration
+from .logz import get_logger
+
+try: import h2
+except ImportError: h2 = None
+
+try: import brotli
+except ImportError:
+    try: import brotlicffi as brotli
+    except ImportError: brotli = None
+
+logger = get_logger()
+
+"""
+Pooled HTTP transports shared by every client talking to the same host.
+
+Connections are keyed by origin and connection settings, so v1 and v3 clients of
+one Rancher host reuse the same keep-alive pool. The async path negotiates HTTP/2
+when h2 is installed, multiplexing concurrent requests over a single connection.
+Pools are reference counted and closed when the last client using them is closed.
+
+Native kubernetes ApiClients each own a urllib3 pool and a thread pool, so they are
+kept per cluster and credentials in an LRU and closed when evicted.
+"""
+
+AcceptEncoding = 'br, gzip, deflate' if brotli is not None else 'gzip, deflate'
+
+
+def get_transport_key(cfg) -> Tuple:
+    """ Clients with the same key share a pool"""
+    url = urlsplit(cfg.host)
+    return (f'{url.scheme}://{url.netloc}', cfg.ssl_verify, cfg.http2, cfg.http_timeout, cfg.pool_max_connections, cfg.pool_max_keepalive, cfg.pool_keepalive_expiry, cfg.compression)
+
+
+class TransportRegistry:
+    """ Creates and reference counts the httpx clients for each transport key.
+        Async clients are bound to the event loop they were created on, so one is kept per loop.
+    """
+    _http2_warned = False
+
+    def __init__(self):
+        self._clients: Dict[Tuple, httpx.Client] = {}
+        self._async_clients: Dict[Tuple, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self._refs = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _options(self, key: Tuple, http2: bool = False) -> Dict:
+        _, verify, _, timeout, max_connections, max_keepalive, keepalive_expiry, compression = key
+        return {
+            'verify': verify,
+            'http2': http2,
+            'timeout': httpx.Timeout(timeout, connect = timeout),
+            'limits': httpx.Limits(max_connections = max_connections, max_keepalive_connections = max_keepalive, keepalive_expiry = keepalive_expiry),
+            'headers': {'Accept-Encoding': AcceptEncoding if compression else 'identity'},
+        }
+
+    def _http2(self, key: Tuple) -> bool:
+        if not key[2]: return False
+        if h2 is not None: return True
+        if not TransportRegistry._http2_warned:
+            logger.info('http2 is enabled but h2 is not installed (pip install httpx[http2]). Using HTTP/1.1')
+            TransportRegistry._http2_warned = True
+        return False
+
+    def acquire(self, key: Tuple):
+        with self._lock: self._refs[key] += 1
+
+    def client(self, key: Tuple) -> httpx.Client:
+        client = self._clients.get(key)
+        if client is not None: return client
+        with self._lock:
+            if key not in self._clients: self._clients[key] = httpx.Client(**self._options(key))
+            return self._clients[key]
+
+    def async_client(self, key: Tuple) -> httpx.AsyncClient:
+        try: loop = asyncio.get_running_loop()
+        except RuntimeError: loop = None
+        loop_key = key + (id(loop),)
+        entry = self._async_clients.get(loop_key)
+        if entry is not None and entry[0] is loop: return entry[1]
+        with self._lock:
+            entry = self._async_clients.get(loop_key)
+            if entry is None or entry[0] is not loop:
+                entry = (loop, httpx.AsyncClient(**self._options(key, http2 = self._http2(key))))
+                self._async_clients[loop_key] = entry
+            self._prune()
+            return entry[1]
+
+    def _prune(self):
+        """ Drops async clients whose loop is closed, their connections went with it"""
+        for loop_key, (loop, _) in list(self._async_clients.items()):
+            if loop is not None and loop.is_closed(): self._async_clients.pop(loop_key, None)
+
+    def _pop(self, key: Tuple = None):
+        with self._lock:
+            if key is not None:
+                self._refs[key] -= 1
+                if self._refs[key] > 0: return None, []
+                self._refs.pop(key, None)
+            client = self._clients.pop(key, None) if key is not None else None
+            clients = list(self._clients.values()) if key is None else ([client] if client else [])
+            async_keys = [k for k in self._async_clients if key is None or k[:-1] == key]
+            async_clients = [self._async_clients.pop(k) for k in async_keys]
+            if key is None:
+                self._clients.clear()
+                self._refs.clear()
+        return clients, async_clients
+
+    def release(self, key: Tuple = None):
+        """ Releases a reference to key, closing its pools when unused. key=None closes every pool"""
+        clients, async_clients = self._pop(key)
+        if clients is None: return
+        for client in clients: client.close()
+        for loop, client in async_clients:
+            if loop is None or loop.is_closed(): continue
+            if loop.is_running(): loop.call_soon_threadsafe(lambda c = client, l = loop: l.create_task(c.aclose()))
+            else: loop.run_until_complete(client.aclose())
+
+    async def async_release(self, key: Tuple = None):
+        """ Async version of release, awaiting the pools of the running loop"""
+        clients, async_clients = self._pop(key)
+        if clients is None: return
+        for client in clients: client.close()
+        try: running = asyncio.get_running_loop()
+        except RuntimeError: running = None
+        for loop, client in async_clients:
+            if loop is running: await client.aclose()
+            elif loop is not None and not loop.is_closed() and loop.is_running(): loop.call_soon_threadsafe(lambda c = client, l = loop: l.create_task(c.aclose()))
+
+    def close(self):
+        self.release(None)
+
+    async def aclose(self):
+        await self.async_release(None)
+
+
+class PooledApiClient(ApiClient):
+    """ lazyapi ApiClient that sends its requests through the shared pools of a TransportRegistry"""
+    def __init__(self, key: Tuple, registry: TransportRegistry, **kwargs):
+        super().__init__(**kwargs)
+        self._key = key
+        self._registry = registry
+
+    @property
+    def client(self) -> httpx.Client:
+        return self._web or self._registry.client(self._key)
+
+    @property
+    def aclient(self) -> httpx.AsyncClient:
+        return self._async or self._registry.async_client(self._key)
+
+
+def get_kube_config_key(config: Configuration) -> Tuple:
+    """ Configurations of the same cluster url, credentials and tls settings share a kubernetes ApiClient"""
+    return (config.host, tuple(sorted(config.api_key.items())), tuple(sorted(config.api_key_prefix.items())), config.verify_ssl, config.ssl_ca_cert, config.cert_file, config.key_file)
+
+
+class KubernetesClientPool:
+    """ LRU of kubernetes ApiClients keyed by get_kube_config_key.
+        args:
+            - maxsize: clients kept open, the least recently used one is closed past it
+    """
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._clients: 'collections.OrderedDict[Tuple, KubernetesClient]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, config: Configuration) -> KubernetesClient:
+        key = get_kube_config_key(config)
+        evicted = []
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+            client = self._clients[key] = KubernetesClient(config)
+            while len(self._clients) > max(self.maxsize, 1): evicted.append(self._clients.popitem(last = False)[1])
+        for old in evicted: self._close(old)
+        return client
+
+    @staticmethod
+    def _close(client: KubernetesClient):
+        try: client.close()
+        except Exception as e: logger.error(f'Failed to close kubernetes client of {client.configuration.host}: {e}')
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients: self._close(client)
+
+    def __len__(self): return len(self._clients)
+
+
+transports = TransportRegistry()
+kube_clients = KubernetesClientPool(envToInt('KCTL_KUBE_CLIENTS_MAX', 32))
+atexit.register(lambda: [client.close() for client in list(transports._clients.values())])
+
+
+__all__ = [
+    'AcceptEncoding',
+    'get_transport_key',
+    'TransportRegistry',
+    'PooledApiClient',
+    'get_kube_config_key',
+    'KubernetesClientPool',
+    'transports',
+    'kube_clients',
+]
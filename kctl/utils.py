@@ -1,4 +1,5 @@
 import time
+import inspect
 
 from .static import TIME, DEFAULT_TIMEOUT
 from .logz import get_logger
@@ -22,6 +23,8 @@ def create_clskey(apiVersion: str, modulename: str = 'Rke'):
 
 
 def timed_url(fn):
+    # wrapping a coroutine function would only time the creation of the coroutine
+    if inspect.iscoroutinefunction(fn): return async_timed_url(fn)
     def wrapped(*args, **kw):
         if not TIME: return fn(*args, **kw)
         start = time.time()
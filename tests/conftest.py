@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from fake_rancher import FakeRancher
+from kctl.client import KctlBaseClient
+
+"""
+Fixtures running kctl against the in-process fake Rancher server of the benchmarks,
+see benchmarks/fake_rancher.py.
+"""
+
+Token = 'token-test:secret'
+
+
+def wait_for(predicate, timeout: float = 5.0, interval: float = 0.01) -> bool:
+    """ Polls predicate until it is true or timeout, for state changed by informer threads / tasks"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline: return False
+        time.sleep(interval)
+    return True
+
+
+@pytest.fixture
+def fake():
+    return FakeRancher(items = 20, clusters = 3, transition_polls = 2, watch_wait = 1.0)
+
+
+@pytest.fixture
+def make_client(fake, tmp_path):
+    """ Returns a factory of clients of the fake, all closed at teardown"""
+    clients = []
+    def make(api_version: str = 'v1', **kwargs) -> KctlBaseClient:
+        kwargs.setdefault('metrics', False)
+        client = KctlBaseClient(host = fake.host, api_version = api_version, api_token = Token, cache_dir = str(tmp_path), **kwargs)
+        client._client._web = httpx.Client(transport = fake.transport())
+        client._client._async = httpx.AsyncClient(transport = fake.async_transport())
+        clients.append(client)
+        return client
+    yield make
+    for client in clients: client.close()
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client()
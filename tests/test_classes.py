@@ -0,0 +1,93 @@
+import json
+import pytest
+from kctl.classes import RestObject, LazyRestObject
+
+Pod = {
+    'type': 'pod',
+    'id': 'default/x',
+    'links': {'self': 'http://rancher.test/v1/pods/default/x'},
+    'actions': {'restart': 'http://rancher.test/v1/pods/default/x?action=restart'},
+    'metadata': {'name': 'x', 'labels': {'app': 'web', 'tier': 'a'}},
+    'spec': {'args': ['a'], 'containers': [{'name': 'c', 'env': [{'name': 'A', 'value': '1'}]}]},
+}
+
+
+@pytest.fixture(params = ['eager', 'lazy'])
+def pod(request, client):
+    client._cfg.lazy_decode = request.param == 'lazy'
+    return client._unmarshall(json.dumps(Pod).encode('utf-8'))
+
+
+def test_decoded_objects_are_clean(pod):
+    assert not pod.is_dirty
+    assert pod.changes() == {}
+
+
+def test_lazy_decoding_resolves_on_access(client):
+    client._cfg.lazy_decode = True
+    pod = client._unmarshall(json.dumps(Pod).encode('utf-8'))
+    assert isinstance(pod, LazyRestObject)
+    assert pod.metadata.labels.app == 'web'
+    assert pod.links.self == Pod['links']['self']
+    assert pod.actions.restart.endswith('action=restart')
+    assert pod.spec.containers[0].env[0].name == 'A'
+    assert json.loads(pod.json) == Pod
+
+
+def test_assignment(pod):
+    pod.metadata.labels.app = 'api'
+    assert pod.is_dirty
+    assert pod.changes() == {'metadata': {'labels': {'app': 'api'}}}
+
+
+def test_list_modified_in_place(pod):
+    pod.spec.args.append('b')
+    assert pod.changes() == {'spec': {'args': ['a', 'b']}}
+    pod.reset_changes()
+    pod.spec.containers[0].env.append({'name': 'B', 'value': '2'})
+    assert pod.is_dirty
+    env = pod.changes()['spec']['containers'][0]['env']
+    assert [(e['name'], e['value']) for e in env] == [('A', '1'), ('B', '2')]
+
+
+def test_reassigned_map_nulls_dropped_keys(pod):
+    pod.metadata.labels = {'app': 'web'}
+    assert pod.changes() == {'metadata': {'labels': {'app': 'web', 'tier': None}}}
+    assert pod.json_patch() == [{'op': 'replace', 'path': '/metadata/labels', 'value': {'app': 'web'}}]
+
+
+def test_reset_changes(pod):
+    pod.metadata.labels = {'app': 'web', 'tier': 'b'}
+    pod.spec.args.append('b')
+    pod.reset_changes()
+    assert not pod.is_dirty
+    assert pod.changes() == {}
+    # the reset state is the new baseline
+    pod.spec.args.append('c')
+    assert pod.changes() == {'spec': {'args': ['a', 'b', 'c']}}
+
+
+def test_update_data_sends_the_changes(fake, client):
+    pod = client.by_id('pod', 'default/pod-1')
+    pod.metadata.labels.app = 'api'
+    pod.spec.containers[0].ports.append({'containerPort': 9090})
+    fake.history.clear()
+    client.update_data(pod)
+    [(method, path, body)] = fake.history
+    assert (method, path) == ('PATCH', '/v1/pods/default/pod-1')
+    body = json.loads(body)
+    assert body['metadata'] == {'labels': {'app': 'api'}}
+    assert body['spec']['containers'][0]['ports'][-1] == {'containerPort': 9090}
+    assert not pod.is_dirty
+    fake.history.clear()
+    assert client.update_data(pod) is pod
+    assert fake.history == []
+
+
+def test_update_data_without_patch_puts(fake, make_client):
+    client = make_client(patch_type = 'none')
+    pod = client.by_id('pod', 'default/pod-1')
+    pod.metadata.labels.app = 'api'
+    fake.history.clear()
+    client.update_data(pod)
+    assert [(method, path) for method, path, _ in fake.history] == [('PUT', '/v1/pods/default/pod-1')]
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import httpx
+import pytest
+from kctl.client import KctlClient
+from kctl.classes import ClientApiError
+from kctl.schema_store import schema_store
+
+
+def refuse_sync(client):
+    """ Fails every request the client sends through its sync transport"""
+    def handler(request: httpx.Request): raise AssertionError(f'sync request {request.method} {request.url}')
+    client._client._web = httpx.Client(transport = httpx.MockTransport(handler))
+    return client
+
+
+def requests_of(fake, method: str = None):
+    return [(m, path) for m, path, _ in fake.history if method is None or m == method]
+
+
+#############################################################################
+#                                   Schema                                  #
+#############################################################################
+
+def test_cold_async_methods_load_the_schema_asynchronously(fake, make_client):
+    async def main(client):
+        pods = await client.async_list_pod()
+        names = [p.metadata.name async for p in client.async_iter_pod(page_size = 7)]
+        return pods, names
+    pods, names = asyncio.run(main(refuse_sync(make_client())))
+    assert len(pods.data) == fake.items
+    assert len(names) == fake.items
+    assert requests_of(fake)[0] == ('GET', '/v1')
+
+
+def test_cold_async_unknown_method(make_client):
+    client = refuse_sync(make_client())
+    with pytest.raises(AttributeError): asyncio.run(client.async_list_nope())
+
+
+def test_prune_removes_unreferenced_schema_content(make_client):
+    client = make_client()
+    client.schema
+    cache = client._cfg.cache
+    current = sorted(p.name for p in cache.cache_dir.glob('schema-content-*'))
+    assert current
+    for name in current:
+        stale = name.replace('schema-content-', 'schema-content-stale')
+        (cache.cache_dir / stale).write_bytes((cache.cache_dir / name).read_bytes())
+        os.utime(cache.cache_dir / stale, (0, 0))
+    assert schema_store.prune(cache, client._codec) == 1
+    assert sorted(p.name for p in cache.cache_dir.glob('schema-content-*')) == current
+
+
+def test_prune_keeps_recent_content(make_client):
+    client = make_client()
+    client.schema
+    cache = client._cfg.cache
+    for path in list(cache.cache_dir.glob('schema-content-*')):
+        (cache.cache_dir / path.name.replace('schema-content-', 'schema-content-stale')).write_bytes(path.read_bytes())
+    assert schema_store.prune(cache, client._codec) == 0
+
+
+#############################################################################
+#                               Response Cache                              #
+#############################################################################
+
+def test_response_cache_is_invalidated_by_writes(fake, make_client):
+    client = make_client(response_cache = True, response_cache_ttl = 60)
+    client.list_pod()
+    gets = len(requests_of(fake, 'GET'))
+    client.list_pod()
+    assert len(requests_of(fake, 'GET')) == gets
+    client.create('pod', metadata = {'name': 'pod-new', 'namespace': 'fleet-default'})
+    client.list_pod()
+    assert len(requests_of(fake, 'GET')) == gets + 1
+
+
+#############################################################################
+#                                Bulk Methods                               #
+#############################################################################
+
+def test_delete_many(fake, client):
+    items = client.list('pod', response_mode = 'dict')['data'][:2] + client.list_pod().data[2:3]
+    fake.history.clear()
+    results = client.delete_many(items)
+    assert [r.ok for r in results] == [True] * 3
+    assert sorted(requests_of(fake)) == [('DELETE', f'/v1/pods/default/pod-{i}') for i in range(3)]
+
+
+def test_delete_many_without_self_link(fake, client):
+    fake.history.clear()
+    results = client.delete_many([{'id': 'default/pod-1'}])
+    assert isinstance(results[0].error, ClientApiError)
+    assert requests_of(fake) == []
+    results = asyncio.run(client.async_delete_many([{'id': 'default/pod-1'}]))
+    assert isinstance(results[0].error, ClientApiError)
+    assert requests_of(fake) == []
+
+
+def test_wait_transitioning_many_lists_once_per_tick(fake, client):
+    pods = [client.by_id('pod', f'default/pod-{i}') for i in range(fake.items)]
+    gone = client.by_id('pod', 'default/pod-3')
+    gone.id, gone.links.self = 'default/pod-999', gone.links.self.replace('pod-3', 'pod-999')
+    fake.reset_transitions()
+    fake.history.clear()
+    results = client.wait_transitioning_many(pods + [gone], sleep = 0)
+    assert all(not p.metadata.state.transitioning for p in results[:-1])
+    assert results[-1] is None
+    gets = requests_of(fake, 'GET')
+    # only the object missing from the list is fetched on its own
+    assert set(gets) == {('GET', '/v1/pods/default'), ('GET', '/v1/pods/default/pod-999')}
+    assert gets.count(('GET', '/v1/pods/default')) == fake.transition_polls + 1
+
+
+def test_async_wait_transitioning_many(fake, client):
+    pods = [client.by_id('pod', f'default/pod-{i}') for i in range(fake.items)]
+    fake.reset_transitions()
+    fake.history.clear()
+    results = asyncio.run(client.async_wait_transitioning_many(pods, sleep = 0))
+    assert all(not p.metadata.state.transitioning for p in results)
+    assert set(requests_of(fake, 'GET')) == {('GET', '/v1/pods/default')}
+
+
+#############################################################################
+#                                  Clusters                                 #
+#############################################################################
+
+@pytest.fixture
+def kctl(monkeypatch, make_client):
+    """ KctlClient bound to clients of the fake, sending every request asynchronously"""
+    monkeypatch.setattr(KctlClient, 'v1', make_client('v1'))
+    monkeypatch.setattr(KctlClient, 'v3', make_client('v3'))
+    return KctlClient
+
+
+def test_api_for_unknown_cluster(kctl):
+    kctl.build_rancher_ctx()
+    assert 'cluster-1' in kctl.v1._cfg.rancher_ctxs
+    assert kctl.api_for('cluster-1') is not None
+    with pytest.raises(ClientApiError): kctl.api_for('typo')
+
+
+def test_fanout(fake, kctl):
+    results = kctl.fanout('list', 'pod', response_mode = 'dict', clusters = ['local', 'cluster-1', 'typo'])
+    assert results['local'].ok and results['cluster-1'].ok
+    assert len(results['local'].result['data']) == fake.items
+    assert isinstance(results['typo'].error, ClientApiError)
+
+
+def test_async_fanout_builds_contexts_asynchronously(fake, kctl):
+    refuse_sync(kctl.v1)
+    refuse_sync(kctl.v3)
+    results = asyncio.run(kctl.async_fanout('list', 'pod', response_mode = 'dict'))
+    assert sorted(results) == ['cluster-1', 'cluster-2', 'local']
+    assert all(r.ok for r in results.values())
@@ -0,0 +1,104 @@
+import asyncio
+import fixtures
+from conftest import wait_for
+
+
+def informer_of(client, **kw):
+    return client.informer('pod', watch_timeout = 1, **kw)
+
+
+def count_relists(informer):
+    """ Counts the relists of informer from now on"""
+    calls = []
+    relist = informer.relist
+    def counted():
+        calls.append(1)
+        return relist()
+    informer.relist = counted
+    return calls
+
+
+def test_initial_list(fake, client):
+    informer = informer_of(client)
+    try:
+        assert informer.has_synced
+        assert len(informer) == fake.items
+        assert informer.revision == str(fake.revision)
+        assert informer.keys(namespace = 'default') == sorted(f'default/pod-{i}' for i in range(fake.items))
+        assert [p.id for p in informer.list(labels = {'tier': 'web'})] == sorted(f'default/pod-{i}' for i in range(0, fake.items, 3))
+        assert informer.get('default/pod-1').metadata.name == 'pod-1'
+    finally: informer.stop()
+
+
+def test_watch_events(fake, client):
+    events = []
+    informer = informer_of(client).add_handler(
+        on_add = lambda obj: events.append(('add', obj.id)),
+        on_update = lambda old, new: events.append(('update', new.id, new.spec.nodeName)),
+        on_delete = lambda obj: events.append(('delete', obj.id)),
+    )
+    try:
+        fake.emit('ADDED', fixtures.pod(fake.host, 100))
+        assert wait_for(lambda: 'default/pod-100' in informer.store)
+        moved = fixtures.pod(fake.host, 1)
+        moved['spec']['nodeName'] = 'node-moved'
+        fake.emit('MODIFIED', moved)
+        assert wait_for(lambda: informer.get('default/pod-1', mode = 'dict')['spec']['nodeName'] == 'node-moved')
+        fake.emit('DELETED', fixtures.pod(fake.host, 2))
+        assert wait_for(lambda: 'default/pod-2' not in informer.store)
+        assert events == [('add', 'default/pod-100'), ('update', 'default/pod-1', 'node-moved'), ('delete', 'default/pod-2')]
+        assert len(informer) == fake.items
+        assert 'default/pod-2' not in informer.keys(namespace = 'default')
+    finally: informer.stop()
+
+
+def test_watch_resumes_from_resource_version(fake, client):
+    informer = informer_of(client)
+    relists = count_relists(informer)
+    try:
+        for i in range(3):
+            fake.emit('ADDED', fixtures.pod(fake.host, 100 + i))
+            assert wait_for(lambda: informer.revision == str(fake.revision))
+        watches = fake.watches
+        # quiet watches end after timeoutSeconds and reconnect from the last revision
+        assert wait_for(lambda: fake.watches >= watches + 2)
+        fake.emit('DELETED', fixtures.pod(fake.host, 100))
+        assert wait_for(lambda: 'default/pod-100' not in informer.store)
+        assert relists == []
+        assert len(informer) == fake.items + 2
+    finally: informer.stop()
+
+
+def test_relists_when_the_revision_expired(fake, client):
+    informer = informer_of(client)
+    relists = count_relists(informer)
+    try:
+        # a change the watch never sees, then the history is compacted past the informer's revision
+        fake.emit('DELETED', fixtures.pod(fake.host, 3), record = False)
+        fake.compact()
+        assert wait_for(lambda: 'default/pod-3' not in informer.store)
+        assert len(relists) == 1
+        assert informer.has_synced
+        assert informer.revision == str(fake.revision)
+        fake.emit('ADDED', fixtures.pod(fake.host, 100))
+        assert wait_for(lambda: 'default/pod-100' in informer.store)
+    finally: informer.stop()
+
+
+def test_async_informer(fake, client):
+    async def run():
+        informer = await client.async_informer('pod', watch_timeout = 1)
+        try:
+            assert len(informer) == fake.items
+            fake.emit('ADDED', fixtures.pod(fake.host, 100))
+            for _ in range(500):
+                if 'default/pod-100' in informer.store: break
+                await asyncio.sleep(0.01)
+            assert 'default/pod-100' in informer.store
+            fake.emit('DELETED', fixtures.pod(fake.host, 0))
+            for _ in range(500):
+                if 'default/pod-0' not in informer.store: break
+                await asyncio.sleep(0.01)
+            assert 'default/pod-0' not in informer.store
+        finally: informer.stop()
+    asyncio.run(run())
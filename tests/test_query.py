@@ -0,0 +1,49 @@
+import pytest
+from kctl.query import Query, split_modifier, project
+from kctl.classes import ClientApiError
+
+
+def test_split_modifier():
+    assert split_modifier('name_ne') == ('name', 'ne')
+    assert split_modifier('name') == ('name', 'eq')
+    assert split_modifier('node_name') == ('node_name', 'eq')
+
+
+def test_compile_v1():
+    query = Query(name = 'pod-1').labels(app = 'web', tier = ['a', 'b']).fields(metadata__namespace = 'default').sort('-metadata.name').limit(5)
+    params = query.compile('v1')
+    assert params['filter'] == ['name=pod-1']
+    assert params['labelSelector'] == 'app=web,tier in (a,b)'
+    assert params['fieldSelector'] == 'metadata.namespace=default'
+    assert params['sort'] == '-metadata.name'
+    assert params['limit'] == 5
+
+
+def test_v1_translates_modifiers():
+    assert Query(name_ne = 'pod-1').compile('v1')['filter'] == ['name!=pod-1']
+    assert Query(name_eq = 'pod-1').compile('v1')['filter'] == ['name=pod-1']
+
+
+def test_v1_rejects_modifiers_it_cannot_express():
+    with pytest.raises(ClientApiError): Query(name_like = 'pod').compile('v1')
+
+
+def test_v3_keeps_modifiers():
+    assert Query(name_ne = 'pod-1').compile('v3') == {'name_ne': 'pod-1'}
+
+
+def test_v3_rejects_selectors():
+    with pytest.raises(ClientApiError): Query().labels(app = 'web').compile('v3')
+
+
+def test_project():
+    item = {'id': 'default/pod-1', 'type': 'pod', 'metadata': {'name': 'pod-1', 'labels': {'app': 'web'}}, 'spec': {}}
+    assert project(item, ['metadata.name']) == {'id': 'default/pod-1', 'type': 'pod', 'metadata': {'name': 'pod-1'}}
+
+
+def test_list_with_query(fake, client):
+    client.list('pod', query = Query(name_ne = 'pod-1').labels(app = 'web').limit(3))
+    method, path, _ = fake.history[-1]
+    assert method == 'GET'
+    assert 'filter=name%21%3Dpod-1' in path
+    assert 'labelSelector=app%3Dweb' in path
@@ -0,0 +1,73 @@
+import asyncio
+import httpx
+import pytest
+from kctl.retry import RetryPolicy, get_retry_after
+
+
+def failing(outcome):
+    """ Returns a request func always ending with outcome, a status code or a transport error, and its call list"""
+    calls = []
+    def func(url, **kwargs):
+        calls.append(url)
+        if isinstance(outcome, int): return httpx.Response(outcome)
+        raise outcome('failed', request = httpx.Request('POST', url))
+    return func, calls
+
+
+def attempts(method, outcome, force = False, **kwargs):
+    func, calls = failing(outcome)
+    policy = RetryPolicy(max_retries = 3, backoff = 0, jitter = False, **kwargs)
+    try: policy.call(method, func, 'http://rancher.test/v1/pods', force = force)
+    except httpx.TransportError: pass
+    return len(calls)
+
+
+@pytest.mark.parametrize('outcome', [httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, 409, 429, 502, 503, 504])
+def test_idempotent_methods_are_retried(outcome):
+    assert attempts('GET', outcome) == 4
+    assert attempts('PUT', outcome) == 4
+
+
+@pytest.mark.parametrize('outcome', [httpx.ConnectError, 503])
+def test_post_is_not_retried_unless_forced(outcome):
+    assert attempts('POST', outcome) == 1
+
+
+@pytest.mark.parametrize('outcome', [httpx.ConnectError, httpx.ConnectTimeout, 409, 429, 503])
+def test_forced_post_is_retried_when_it_cannot_have_run(outcome):
+    assert attempts('POST', outcome, force = True) == 4
+
+
+@pytest.mark.parametrize('outcome', [httpx.ReadTimeout, 502, 504])
+def test_forced_post_is_not_retried_when_it_may_have_run(outcome):
+    assert attempts('POST', outcome, force = True) == 1
+
+
+def test_success_is_not_retried():
+    assert attempts('GET', 200) == 1
+
+
+def test_budget_caps_retries():
+    policy = RetryPolicy(max_retries = 3, backoff = 0, jitter = False, budget = 2, budget_window = 3600)
+    func, calls = failing(503)
+    assert policy.call('GET', func, 'http://rancher.test/v1/pods').status_code == 503
+    assert len(calls) == 3
+    assert policy.stats['budget_exhausted'] == 1
+
+
+def test_async_call():
+    func, calls = failing(504)
+    async def afunc(url, **kwargs): return func(url, **kwargs)
+    policy = RetryPolicy(max_retries = 2, backoff = 0, jitter = False)
+    assert asyncio.run(policy.async_call('POST', afunc, 'http://rancher.test/v1/pods', force = True)).status_code == 504
+    assert len(calls) == 1
+    assert asyncio.run(policy.async_call('GET', afunc, 'http://rancher.test/v1/pods')).status_code == 504
+    assert len(calls) == 4
+
+
+def test_retry_after():
+    assert get_retry_after(httpx.Response(503, headers = {'Retry-After': '2'})) == 2.0
+    assert get_retry_after(httpx.Response(503, headers = {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0.0
+    assert get_retry_after(httpx.Response(503)) is None
+    policy = RetryPolicy(retry_after_max = 1.0)
+    assert policy.get_delay(0, httpx.Response(503, headers = {'Retry-After': '30'})) == 1.0
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import pytest
+from kctl.singleflight import SingleFlight, AsyncSingleFlight
+from conftest import wait_for
+
+
+def blocking_call():
+    """ Returns a func blocking until released, its started event and its call list"""
+    started, release, calls = threading.Event(), threading.Event(), []
+    def func(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return value
+    return func, started, release, calls
+
+
+def run_in_threads(target, count):
+    results = [None] * count
+    def run(i): results[i] = target()
+    threads = [threading.Thread(target = run, args = (i,)) for i in range(count)]
+    for t in threads: t.start()
+    return threads, results
+
+
+def test_concurrent_calls_are_coalesced():
+    shared = []
+    flight = SingleFlight(on_shared = shared.append)
+    func, started, release, calls = blocking_call()
+    leader, results = run_in_threads(lambda: flight.do('pods', func, 1), 1)
+    started.wait(5)
+    followers, followed = run_in_threads(lambda: flight.do('pods', func, 2), 4)
+    assert wait_for(lambda: len(shared) == 4)
+    release.set()
+    for t in leader + followers: t.join(5)
+    assert calls == [1]
+    assert results + followed == [1] * 5
+    assert flight.stats == {'calls': 1, 'shared': 4}
+    # nothing is kept once the call returned
+    assert flight.do('pods', lambda: 3) == 3
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+    with pytest.raises(ValueError): flight.do('pods', lambda: (_ for _ in ()).throw(ValueError('boom')))
+    assert flight._calls == {}
+
+
+def test_forget_detaches_in_flight_calls():
+    flight = SingleFlight()
+    func, started, release, calls = blocking_call()
+    leader, results = run_in_threads(lambda: flight.do('pods', func, 'before'), 1)
+    started.wait(5)
+    flight.forget(lambda key: key == 'pods')
+    # a call after the write does not join the one started before it
+    assert flight.do('pods', lambda: 'after') == 'after'
+    release.set()
+    leader[0].join(5)
+    assert results == ['before']
+
+
+def test_async_calls_are_coalesced():
+    flight, calls = AsyncSingleFlight(), []
+    async def func(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+    async def main():
+        return await asyncio.gather(*[flight.do('pods', func, i) for i in range(5)])
+    assert asyncio.run(main()) == [0] * 5
+    assert calls == [0]
+    assert flight.stats == {'calls': 1, 'shared': 4}
+
+
+def test_async_cancelled_caller_does_not_cancel_the_call():
+    flight = AsyncSingleFlight()
+    async def func():
+        await asyncio.sleep(0.05)
+        return 'pods'
+    async def main():
+        first = asyncio.ensure_future(flight.do('pods', func))
+        second = asyncio.ensure_future(flight.do('pods', func))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+    assert asyncio.run(main()) == 'pods'
+
+
+def test_async_forget():
+    flight, calls = AsyncSingleFlight(), []
+    async def func(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+    async def main():
+        before = asyncio.ensure_future(flight.do('pods', func, 'before'))
+        await asyncio.sleep(0)
+        flight.forget(lambda key: key == 'pods')
+        return await asyncio.gather(before, flight.do('pods', func, 'after'))
+    assert asyncio.run(main()) == ['before', 'after']
+    assert calls == ['before', 'after']